@@ -0,0 +1,315 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Micro-benchmarks for the pure-Python work done on every login and refresh
+
+Measures time and peak bytes allocated per operation, offline with a generated
+RSA key, and compares them with benchmarks/baseline.json. Times are compared
+relative to a fixed calibration loop so the baseline carries across machines.
+Allocations depend on the interpreter, they are only compared with a baseline
+recorded on the same Python major and minor version.
+Exits with status 1 if an operation regressed. Run with::
+
+    $ python -m benchmarks.bench_hot_paths
+    $ python -m benchmarks.bench_hot_paths --update-baseline
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from intuitlib.client import AuthClient
+from intuitlib.enums import Scopes
+from intuitlib.jsoncodec import get_codec
+from intuitlib.jwks import JWKCache
+from intuitlib.scopes import ScopeSet
+from intuitlib.tokens import TokenSet, encode_state, decode_state
+from intuitlib.transport import InMemoryTransport
+from intuitlib.utils import (
+    generate_token,
+    get_auth_header,
+    scopes_to_string,
+    set_attributes,
+    validate_id_token,
+    _check_id_token_claims,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+CLIENT_ID = 'L39elSubFxjPOSpdZoYWRKiCCE6TINjv67RoaE8zBqbIxxb4lK'
+CLIENT_SECRET = 'X7cKPtJHZ8lMIUeQcXMoYu5xOb9Vf8bBMCkbRLh8'
+ISSUER = 'https://oauth.platform.intuit.com/op/v1'
+JWKS_URI = 'https://oauth.platform.intuit.com/op/v1/jwks'
+SCOPES = [Scopes.OPENID, Scopes.EMAIL, Scopes.PROFILE, Scopes.ACCOUNTING]
+
+DISCOVERY_DOC = {
+    'authorization_endpoint': 'https://appcenter.intuit.com/connect/oauth2',
+    'token_endpoint': 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer',
+    'revocation_endpoint': 'https://developer.api.intuit.com/v2/oauth2/tokens/revoke',
+    'issuer': ISSUER,
+    'jwks_uri': JWKS_URI,
+    'userinfo_endpoint': 'https://accounts.platform.intuit.com/v1/openid_connect/userinfo',
+}
+
+TOKEN_RESPONSE = {
+    'token_type': 'bearer',
+    'access_token': 'eyJlbmMiOiJBMTI4Q0JDLUhTMjU2IiwiYWxnIjoiZGlyIn0..' + 'x' * 900,
+    'refresh_token': 'AB11' + 'r' * 46,
+    'x_refresh_token_expires_in': 8726400,
+    'expires_in': 3600,
+}
+
+TOKEN_RESPONSE_TOKENS = dict((key, value) for key, value in TOKEN_RESPONSE.items() if key != 'token_type')
+
+
+class IdTokenFixture(object):
+    """Generated RSA key, its JWKS served in memory and an ID token signed with it
+    """
+
+    def __init__(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+        jwk.update({'kid': 'kid1', 'alg': 'RS256', 'use': 'sig'})
+        self.transport = InMemoryTransport()
+        self.transport.add_route('GET', JWKS_URI, json_body={'keys': [jwk]})
+        self.transport.record = False
+        payload = {'aud': [CLIENT_ID], 'iss': ISSUER, 'exp': int(time.time()) + 86400, 'sub': 'user', 'realmid': '1108033471'}
+        self.id_token = jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': 'kid1'})
+
+
+def _make_client():
+    return AuthClient(CLIENT_ID, CLIENT_SECRET, 'https://www.mydemoapp.com/oauth-redirect', 'production', discovery_doc=DISCOVERY_DOC)
+
+
+def bench_scopes_to_string(fixture):
+    return lambda: scopes_to_string(SCOPES)
+
+def bench_scope_set_to_string(fixture):
+    scopes = ScopeSet(SCOPES)
+    return lambda: scopes_to_string(scopes)
+
+def bench_get_auth_header(fixture):
+    return lambda: get_auth_header(CLIENT_ID, CLIENT_SECRET)
+
+def bench_generate_token(fixture):
+    return generate_token
+
+def bench_get_authorization_url(fixture):
+    client = _make_client()
+    return lambda: client.get_authorization_url(SCOPES, state_token='state')
+
+def bench_set_attributes(fixture):
+    client = _make_client()
+    return lambda: set_attributes(client, TOKEN_RESPONSE)
+
+def _in_memory_client():
+    transport = InMemoryTransport()
+    transport.add_route('POST', DISCOVERY_DOC['token_endpoint'], json_body=TOKEN_RESPONSE)
+    transport.record = False
+    return AuthClient(CLIENT_ID, CLIENT_SECRET, 'https://www.mydemoapp.com/oauth-redirect', 'production',
+        discovery_doc=DISCOVERY_DOC, transport=transport)
+
+def bench_refresh(fixture):
+    client = _in_memory_client()
+    return lambda: client.refresh(refresh_token=TOKEN_RESPONSE['refresh_token'])
+
+def bench_get_bearer_token(fixture):
+    client = _in_memory_client()
+    return lambda: client.get_bearer_token('AB11570127472rsn4HCmVYAeqFrlvs4oAhS8dWDwcNfZBGFpuH', realm_id='1108033471')
+
+def bench_check_id_token_claims(fixture):
+    codec = get_codec()
+    now = time.time()
+    return lambda: _check_id_token_claims(fixture.id_token, CLIENT_ID, ISSUER, codec, now)
+
+def bench_validate_id_token(fixture):
+    jwk_cache = JWKCache()
+    return lambda: validate_id_token(fixture.id_token, CLIENT_ID, ISSUER, JWKS_URI, jwk_cache=jwk_cache, transport=fixture.transport)
+
+def bench_encode_state(fixture):
+    tokens = TokenSet(issued_at=time.time(), realm_id='1108033471', **TOKEN_RESPONSE_TOKENS)
+    return lambda: encode_state(tokens, 1)
+
+def bench_decode_state(fixture):
+    data = encode_state(TokenSet(issued_at=time.time(), realm_id='1108033471', **TOKEN_RESPONSE_TOKENS), 1)
+    return lambda: decode_state(data)
+
+# name, factory taking an `IdTokenFixture` and returning the operation, calls per timing
+BENCHMARKS = [
+    ('scopes_to_string', bench_scopes_to_string, 20000),
+    ('scope_set_to_string', bench_scope_set_to_string, 20000),
+    ('get_auth_header', bench_get_auth_header, 20000),
+    ('generate_token', bench_generate_token, 5000),
+    ('get_authorization_url', bench_get_authorization_url, 5000),
+    ('set_attributes', bench_set_attributes, 5000),
+    ('refresh', bench_refresh, 5000),
+    ('get_bearer_token', bench_get_bearer_token, 5000),
+    ('check_id_token_claims', bench_check_id_token_claims, 5000),
+    ('validate_id_token', bench_validate_id_token, 200),
+    ('encode_state', bench_encode_state, 20000),
+    ('decode_state', bench_decode_state, 20000),
+]
+
+
+def calibrate():
+    """Fixed pure-Python workload, times are reported relative to it
+    """
+
+    return sum(i * i for i in range(1000))
+
+
+def measure_time(func, number, repeat=5):
+    """Best time per call in microseconds
+    """
+
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def measure_allocations(func, calls=20):
+    """Smallest peak of bytes allocated by one call, after a warm-up call
+    """
+
+    tracemalloc.start()
+    try:
+        func()
+        peaks = []
+        for _ in range(calls):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            func()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        return min(peaks)
+    finally:
+        tracemalloc.stop()
+
+
+def run(names=None, scale=1.0, repeat=5):
+    """Runs benchmarks
+
+    :param names: Benchmark names, defaults to None (all)
+    :param scale: Factor applied to calls per timing, defaults to 1.0
+    :param repeat: Timings per benchmark, the best is kept, defaults to 5
+    :return: dict with Python version, calibration time and per benchmark time_us, relative time and alloc_bytes
+    """
+
+    fixture = IdTokenFixture()
+    calibration_number = max(int(5000 * scale), 1)
+    results = {'python': python_version(), 'calibration_us': measure_time(calibrate, calibration_number, repeat), 'benchmarks': {}}
+    for name, factory, number in BENCHMARKS:
+        if names and name not in names:
+            continue
+        func = factory(fixture)
+        # calibrated right before each benchmark so slow phases of a busy machine affect both alike
+        calibration = measure_time(calibrate, calibration_number, repeat)
+        time_us = measure_time(func, max(int(number * scale), 1), repeat)
+        results['benchmarks'][name] = {
+            'time_us': round(time_us, 3),
+            'relative': round(time_us / calibration, 5),
+            'alloc_bytes': measure_allocations(func),
+        }
+    results['calibration_us'] = round(results['calibration_us'], 3)
+    return results
+
+
+def compare(results, baseline, time_tolerance=2.0, alloc_tolerance=1.25):
+    """Compares results with a baseline
+
+    :param results: `run` results
+    :param baseline: `run` results stored earlier
+    :param time_tolerance: Allowed factor over the baseline relative time, defaults to 2.0
+    :param alloc_tolerance: Allowed factor over the baseline allocated bytes, defaults to 1.25
+    :return: list of regression messages, empty if none regressed
+    """
+
+    # allocations of another interpreter version say nothing about this change
+    check_allocations = results.get('python') == baseline.get('python')
+    regressions = []
+    for name, result in sorted(results['benchmarks'].items()):
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            continue
+        if result['relative'] > base['relative'] * time_tolerance:
+            regressions.append('{0}: time {1:.2f}x baseline ({2:.3f}us)'.format(name, result['relative'] / base['relative'], result['time_us']))
+        # small absolute slack for interpreter bookkeeping such as freelists
+        if check_allocations and result['alloc_bytes'] > base['alloc_bytes'] * alloc_tolerance + 64:
+            regressions.append('{0}: allocations {1} bytes, baseline {2} bytes'.format(name, result['alloc_bytes'], base['alloc_bytes']))
+    return regressions
+
+
+def python_version():
+    return '{0}.{1}'.format(*sys.version_info[:2])
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of intuitlib hot paths')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, defaults to all')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=2.0)
+    parser.add_argument('--alloc-tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    results = run(args.names)
+    baseline = load_baseline(args.baseline) if os.path.exists(args.baseline) else None
+
+    print('{0:<24} {1:>12} {2:>10} {3:>14} {4:>10}'.format('benchmark', 'time (us)', 'vs base', 'alloc (bytes)', 'vs base'))
+    for name, result in sorted(results['benchmarks'].items()):
+        base = baseline['benchmarks'].get(name) if baseline else None
+        print('{0:<24} {1:>12.3f} {2:>10} {3:>14} {4:>10}'.format(
+            name, result['time_us'],
+            '{0:.2f}x'.format(result['relative'] / base['relative']) if base else '-',
+            result['alloc_bytes'],
+            '{0:+d}'.format(result['alloc_bytes'] - base['alloc_bytes']) if base else '-'))
+
+    if args.update_baseline:
+        # best of a few runs, so a busy moment does not loosen the baseline
+        for _ in range(2):
+            for name, result in run(args.names)['benchmarks'].items():
+                if result['relative'] < results['benchmarks'][name]['relative']:
+                    results['benchmarks'][name] = result
+        if baseline and args.names:
+            baseline['benchmarks'].update(results['benchmarks'])
+            results['benchmarks'] = baseline['benchmarks']
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return 0
+
+    if baseline is None:
+        print('no baseline at {0}, run with --update-baseline'.format(args.baseline), file=sys.stderr)
+        return 0
+    if baseline.get('python') != results['python']:
+        print('baseline recorded on Python {0}, allocations not compared'.format(baseline.get('python')), file=sys.stderr)
+    regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""Benchmark for intuitlib.transport.Http2Transport
+
+Sends a burst of concurrent `AuthClient.refresh` calls, one client per thread, through the default
+`requests` transport against a local HTTP/1.1 server and through
+`Http2Transport` against a local cleartext HTTP/2 server. Both servers add the
+same simulated connection setup and response latency, so the numbers show what
+multiplexing saves over opening a connection per concurrent request. Needs the
+`http2` extra. Run with::
+
+    $ python -m benchmarks.bench_http2 --threads 50 --requests 1000
+"""
+
+from __future__ import print_function
+
+import argparse
+import socket
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import requests
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import RequestReceived, StreamEnded
+
+from benchmarks.bench_transport import TOKEN_RESPONSE, make_client
+from intuitlib.transport import Http2Transport, RequestsTransport
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler, connect_delay, latency):
+        HTTPServer.__init__(self, server_address, handler)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.connections = 0
+
+    def process_request_thread(self, request, client_address):
+        self.connections += 1
+        time.sleep(self.connect_delay)
+        ThreadingMixIn.process_request_thread(self, request, client_address)
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(TOKEN_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(TOKEN_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+class H2Server(object):
+    """Cleartext HTTP/2 server answering every stream with TOKEN_RESPONSE after latency seconds
+    """
+
+    def __init__(self, connect_delay, latency):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.url = 'http://127.0.0.1:{0}'.format(self.sock.getsockname()[1])
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.connections = 0
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.sock.accept()[0]
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self.serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_connection(self, conn):
+        time.sleep(self.connect_delay)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        h2_conn = H2Connection(H2Configuration(client_side=False))
+        lock = threading.Lock()
+
+        def respond(stream_id):
+            with lock:
+                h2_conn.send_headers(stream_id, [
+                    (':status', '200'),
+                    ('content-type', 'application/json'),
+                    ('content-length', str(len(TOKEN_RESPONSE))),
+                ])
+                h2_conn.send_data(stream_id, TOKEN_RESPONSE, end_stream=True)
+                conn.sendall(h2_conn.data_to_send())
+
+        with lock:
+            h2_conn.initiate_connection()
+            conn.sendall(h2_conn.data_to_send())
+        while True:
+            try:
+                data = conn.recv(65535)
+            except OSError:
+                return
+            if not data:
+                conn.close()
+                return
+            with lock:
+                for event in h2_conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        h2_conn.acknowledge_received_data(0, event.stream_id)
+                    elif isinstance(event, StreamEnded):
+                        timer = threading.Timer(self.latency, respond, args=(event.stream_id,))
+                        timer.daemon = True
+                        timer.start()
+                conn.sendall(h2_conn.data_to_send())
+
+    def close(self):
+        self.sock.close()
+
+def burst(base_url, transport, threads, total):
+    """Runs total refreshes split over threads, one client per thread sharing transport, returns refreshes per second
+    """
+
+    per_thread = total // threads
+
+    def worker():
+        client = make_client(base_url, transport)
+        for _ in range(per_thread):
+            client.refresh(refresh_token='token')
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.time() - started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare refresh throughput of the default and the HTTP/2 transport')
+    parser.add_argument('--threads', type=int, default=50, help='concurrent refresh threads')
+    parser.add_argument('--requests', type=int, default=1000, help='refreshes per transport')
+    parser.add_argument('--connect-delay', type=float, default=0.03, help='simulated connection setup (TCP+TLS) in seconds')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated response latency in seconds')
+    args = parser.parse_args(argv)
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler, args.connect_delay, args.latency)
+    http1_thread = threading.Thread(target=httpd.serve_forever)
+    http1_thread.daemon = True
+    http1_thread.start()
+
+    h2_server = H2Server(args.connect_delay, args.latency)
+    h2_thread = threading.Thread(target=h2_server.serve_forever)
+    h2_thread.daemon = True
+    h2_thread.start()
+
+    runs = [
+        ('requests/1.1', 'http://127.0.0.1:{0}'.format(httpd.server_address[1]), RequestsTransport(requests.Session()), httpd),
+        ('httpx/h2', h2_server.url, Http2Transport(max_connections=1, http1=False), h2_server),
+    ]
+    print('{0:<14} {1:>12} {2:>12}'.format('transport', 'refresh/s', 'connections'))
+    for name, base_url, transport, server in runs:
+        throughput = burst(base_url, transport, args.threads, args.requests)
+        print('{0:<14} {1:>12.1f} {2:>12}'.format(name, throughput, server.connections))
+        transport.close()
+
+    httpd.shutdown()
+    httpd.server_close()
+    h2_server.close()
+
+if __name__ == '__main__':
+    main()
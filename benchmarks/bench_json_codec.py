@@ -0,0 +1,96 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""Benchmark for intuitlib.jsoncodec
+
+Compares the JSON work done per token refresh (decoding the token endpoint
+response) and per ID token validation (decoding the JWT header and payload)
+for every installed codec. Run with::
+
+    $ python -m benchmarks.bench_json_codec
+"""
+
+from __future__ import print_function
+
+import json
+import timeit
+from base64 import b64decode, urlsafe_b64encode
+
+import requests
+
+from intuitlib.jsoncodec import get_codec, _CODECS, _PREFERENCE
+from intuitlib.utils import _correct_padding
+
+TOKEN_RESPONSE = json.dumps({
+    'token_type': 'bearer',
+    'access_token': 'eyJlbmMiOiJBMTI4Q0JDLUhTMjU2IiwiYWxnIjoiZGlyIn0..' + 'x' * 900,
+    'refresh_token': 'AB11' + 'r' * 46,
+    'x_refresh_token_expires_in': 8726400,
+    'expires_in': 3600,
+}).encode('utf-8')
+
+def _segment(obj):
+    return urlsafe_b64encode(json.dumps(obj).encode('utf-8')).decode('ascii').rstrip('=')
+
+ID_TOKEN = '.'.join([
+    _segment({'kid': 'r4p5SbL2qaFehFzhj8gI', 'alg': 'RS256'}),
+    _segment({
+        'sub': 'b053d994-07d5-468d-b7ee-22e349d2e739',
+        'aud': ['L39elSubFxjPOSpdZoYWRKiCCE6TINjv67RoaE8zBqbIxxb4lK'],
+        'realmid': '1108033471',
+        'auth_time': 1462554475,
+        'iss': 'https://oauth.platform.intuit.com/op/v1',
+        'exp': 1462561328,
+        'iat': 1462557728,
+    }),
+    'signature',
+])
+
+def _response():
+    response = requests.models.Response()
+    response.status_code = 200
+    response._content = TOKEN_RESPONSE
+    response.headers['Content-Type'] = 'application/json;charset=UTF-8'
+    return response
+
+def per_refresh(codec):
+    response = _response()
+    return lambda: codec.response_json(response)
+
+def per_validation(codec):
+    parts = ID_TOKEN.split('.')
+    def decode():
+        codec.loads(b64decode(_correct_padding(parts[0])))
+        codec.loads(b64decode(_correct_padding(parts[1])))
+    return decode
+
+def measure(func, number=20000, repeat=5):
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+def main():
+    names = [name for name in reversed(_PREFERENCE) if _CODECS[name][1]]
+    results = {}
+    for name in names:
+        codec = get_codec(name)
+        results[name] = (measure(per_refresh(codec)), measure(per_validation(codec)))
+
+    base_refresh, base_validation = results['json']
+    print('{0:<8} {1:>14} {2:>10} {3:>14} {4:>10}'.format('codec', 'refresh (us)', 'saving', 'validate (us)', 'saving'))
+    for name in names:
+        refresh, validation = results[name]
+        print('{0:<8} {1:>14.2f} {2:>9.0f}% {3:>14.2f} {4:>9.0f}%'.format(
+            name, refresh, 100 * (1 - refresh / base_refresh), validation, 100 * (1 - validation / base_validation)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""Benchmark for intuitlib.transport
+
+Measures one `AuthClient.refresh` per transport against a local keep-alive
+HTTP server, plus the in-memory transport which isolates the client logic
+from any socket work. Run with::
+
+    $ python -m benchmarks.bench_transport
+"""
+
+from __future__ import print_function
+
+import json
+import threading
+import timeit
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from intuitlib.client import AuthClient
+from intuitlib.transport import InMemoryTransport, RequestsTransport, Urllib3Transport
+
+TOKEN_RESPONSE = json.dumps({
+    'token_type': 'bearer',
+    'access_token': 'eyJlbmMiOiJBMTI4Q0JDLUhTMjU2IiwiYWxnIjoiZGlyIn0..' + 'x' * 900,
+    'refresh_token': 'AB11' + 'r' * 46,
+    'x_refresh_token_expires_in': 8726400,
+    'expires_in': 3600,
+}).encode('utf-8')
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(TOKEN_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(TOKEN_RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+def discovery_doc(base_url):
+    return {
+        'authorization_endpoint': base_url + '/authorize',
+        'token_endpoint': base_url + '/token',
+        'revocation_endpoint': base_url + '/revoke',
+        'issuer': base_url,
+        'jwks_uri': base_url + '/jwks',
+        'userinfo_endpoint': base_url + '/userinfo',
+    }
+
+def make_client(base_url, transport):
+    return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+        discovery_doc=discovery_doc(base_url), transport=transport)
+
+def measure(client, number):
+    client.refresh(refresh_token='token')
+    return min(timeit.repeat(lambda: client.refresh(refresh_token='token'), number=number, repeat=3)) / number * 1e6
+
+def main():
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base_url = 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+
+    in_memory = InMemoryTransport()
+    in_memory.record = False
+    in_memory.add_route('POST', base_url + '/token', content=TOKEN_RESPONSE)
+
+    transports = [
+        ('requests', RequestsTransport(requests.Session()), 500),
+        ('urllib3', Urllib3Transport(), 500),
+        ('in-memory', in_memory, 20000),
+    ]
+    print('{0:<10} {1:>16}'.format('transport', 'refresh (us)'))
+    for name, transport, number in transports:
+        print('{0:<10} {1:>16.1f}'.format(name, measure(make_client(base_url, transport), number)))
+        transport.close()
+
+    httpd.shutdown()
+    httpd.server_close()
+
+if __name__ == '__main__':
+    main()
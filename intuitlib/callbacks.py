@@ -0,0 +1,329 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a pipeline redeeming authorization codes of OAuth callback bursts
+
+Callback handlers submit (code, state, realm_id) items. Each item passes four stages, each run by its own
+threads: verify the state token, redeem the code at the token endpoint, validate the ID token against a
+shared `intuitlib.jwks.JWKCache`, and persist the tokens. Stages are connected by bounded queues. When a
+stage falls behind, the stages before it block on the full queue, and finally `submit` blocks or fails.
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from intuitlib.jwks import JWKCache
+from intuitlib.utils import set_attributes, validate_id_token
+
+STAGES = ('state', 'redeem', 'validate', 'persist')
+
+# result of one callback, error and failed_stage are None if every stage succeeded,
+# latencies maps stage names and 'total' to seconds
+CallbackResult = namedtuple('CallbackResult', [
+    'state', 'realm_id', 'tokens', 'id_token_valid', 'error', 'failed_stage', 'latencies',
+])
+
+_STOP = object()
+
+
+class CallbackPipeline(object):
+    """Redeems authorization codes from callback handlers in concurrent stages with bounded queues
+    """
+
+    def __init__(self, client_factory, verify_state, persist, threads=None, queue_size=100, jwk_cache=None, on_result=None, window=1000):
+        """Constructor for CallbackPipeline
+
+        :param client_factory: callable taking a realm ID and returning the `intuitlib.client.AuthClient` to redeem its code with
+        :param verify_state: callable taking a state token and realm ID, returning True if the state was issued by this app and not used before
+        :param persist: callable taking a `CallbackResult` with the new tokens, e.g. to save them
+        :param threads: dict of threads per stage name, defaults to None (state 1, redeem 8, validate 2, persist 2)
+        :param queue_size: Items each stage can have waiting, defaults to 100
+        :param jwk_cache: `intuitlib.jwks.JWKCache` ID tokens are validated with, defaults to None (created)
+        :param on_result: callable taking every `CallbackResult`, called from a pipeline thread, defaults to None
+        :param window: Latency samples kept per stage, defaults to 1000
+        """
+
+        self.client_factory = client_factory
+        self.verify_state = verify_state
+        self.persist = persist
+        self.jwk_cache = jwk_cache if jwk_cache is not None else JWKCache()
+        self.on_result = on_result
+
+        stage_threads = {'state': 1, 'redeem': 8, 'validate': 2, 'persist': 2}
+        stage_threads.update(threads or {})
+        functions = {
+            'state': self._verify_state,
+            'redeem': self._redeem,
+            'validate': self._validate,
+            'persist': self._persist,
+        }
+        self._stages = [_Stage(name, functions[name], stage_threads[name], queue_size, window) for name in STAGES]
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._started = False
+        self._closed = False
+        self._submitting = 0
+        self.submitted = 0
+        self.completed = 0
+
+    def start(self):
+        """Starts the stage threads, called by `submit` if needed
+        """
+
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for index, stage in enumerate(self._stages):
+                following = self._stages[index + 1] if index + 1 < len(self._stages) else None
+                for number in range(stage.thread_count):
+                    thread = threading.Thread(target=self._run_stage, args=(stage, following),
+                        name='intuitlib-callbacks-{0}-{1}'.format(stage.name, number))
+                    thread.daemon = True
+                    thread.start()
+                    stage.threads.append(thread)
+
+    def submit(self, code, state, realm_id=None, block=True, timeout=None):
+        """Queues one callback
+
+        :param code: Authorization code received from redirect_uri
+        :param state: State token received from redirect_uri
+        :param realm_id: QBO Realm/Company ID received from redirect_uri, defaults to None
+        :param block: Wait while the pipeline is full, defaults to True
+        :param timeout: Seconds to wait while the pipeline is full, defaults to None (no limit)
+        :raises queue.Full: if the pipeline is still full after timeout, or at once if block is False
+        :raises RuntimeError: if the pipeline was closed
+        :return: `concurrent.futures.Future` of the `CallbackResult`
+        """
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Callback pipeline is closed')
+            # close waits for submits in progress, so no item is queued behind the stop sentinels
+            self._submitting += 1
+        try:
+            self.start()
+            item = _Callback(code, state, realm_id)
+            self._stages[0].queue.put(item, block, timeout)
+            with self._lock:
+                self.submitted += 1
+            return item.future
+        finally:
+            with self._lock:
+                self._submitting -= 1
+                self._idle.notify_all()
+
+    def close(self, wait=True):
+        """Stops accepting callbacks, callbacks already submitted are completed
+
+        :param wait: Wait until every stage finished its callbacks, defaults to True
+        """
+
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        def stop():
+            with self._lock:
+                while self._submitting:
+                    self._idle.wait()
+                if not self._started:
+                    return
+            # stages stop in order, so each one drains before the next is told to stop
+            for stage in self._stages:
+                for _ in stage.threads:
+                    stage.queue.put(_STOP)
+                for thread in stage.threads:
+                    thread.join()
+
+        if wait:
+            stop()
+        else:
+            thread = threading.Thread(target=stop, name='intuitlib-callbacks-close')
+            thread.daemon = True
+            thread.start()
+
+    def stats(self):
+        """Gets pipeline statistics
+
+        :return: dict with submitted, completed and in-flight callbacks, and per stage the callbacks processed and
+            failed, queue depth, and percentiles in ms of processing latency and of waiting in the stage's queue
+        """
+
+        with self._lock:
+            stats = {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'in_flight': self.submitted - self.completed,
+            }
+        stats['stages'] = dict((stage.name, stage.stats()) for stage in self._stages)
+        return stats
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _verify_state(self, item):
+        if not self.verify_state(item.state, item.realm_id):
+            raise ValueError('State token not recognized')
+
+    def _redeem(self, item):
+        item.client = self.client_factory(item.realm_id)
+        item.response_json = item.client._redeem_code(item.code)
+
+    def _validate(self, item):
+        client = item.client
+        id_token = item.response_json.get('id_token')
+        if id_token is not None:
+            try:
+                item.id_token_valid = validate_id_token(id_token, client.client_id, client.issuer_uri, client.jwks_uri,
+                    codec=client.codec, session=client.session, jwk_cache=self.jwk_cache, transport=client.transport)
+            except Exception:
+                # e.g. JWKS outage or unknown kid, the code is spent so the tokens are kept without the ID token
+                item.id_token_valid = False
+        if item.realm_id is not None:
+            item.response_json['realm_id'] = item.realm_id
+        # tokens are applied here so persist sees them, the ID token only if it is valid
+        set_attributes(client, item.response_json, id_token_valid=item.id_token_valid)
+        item.applied = True
+
+    def _persist(self, item):
+        self.persist(item.result())
+
+    def _run_stage(self, stage, following):
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                return
+            started = time.monotonic()
+            try:
+                stage.function(item)
+                error = None
+            except Exception as e:
+                error = e
+            finished = time.monotonic()
+            item.latencies[stage.name] = finished - started
+            stage.record(finished - started, started - item.queued_at, error is None)
+
+            if error is not None:
+                self._complete(item, error, stage.name)
+            elif following is None:
+                self._complete(item)
+            else:
+                item.queued_at = finished
+                # blocks while the following stage is full, which holds back this stage and the ones before it
+                following.queue.put(item)
+
+    def _complete(self, item, error=None, failed_stage=None):
+        item.error = error
+        item.failed_stage = failed_stage
+        item.latencies['total'] = time.monotonic() - item.submitted_at
+        result = item.result()
+        with self._lock:
+            self.completed += 1
+        item.future.set_result(result)
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception:
+                # a failing callback must not stop the stage thread
+                pass
+
+
+class _Callback(object):
+    """One callback moving through the stages
+    """
+
+    def __init__(self, code, state, realm_id):
+        self.code = code
+        self.state = state
+        self.realm_id = realm_id
+        self.client = None
+        self.response_json = None
+        self.id_token_valid = None
+        self.applied = False
+        self.error = None
+        self.failed_stage = None
+        self.latencies = {}
+        self.future = Future()
+        self.submitted_at = self.queued_at = time.monotonic()
+
+    def result(self):
+        return CallbackResult(
+            state=self.state,
+            realm_id=self.realm_id,
+            tokens=self.client.tokens if self.applied else None,
+            id_token_valid=self.id_token_valid,
+            error=self.error,
+            failed_stage=self.failed_stage,
+            latencies=dict(self.latencies),
+        )
+
+
+class _Stage(object):
+    """Queue, threads and latency samples of one stage
+    """
+
+    def __init__(self, name, function, thread_count, queue_size, window):
+        self.name = name
+        self.function = function
+        self.thread_count = thread_count
+        self.queue = queue.Queue(queue_size)
+        self.threads = []
+        self.processed = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=window)
+        self._waits = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, wait, ok):
+        with self._lock:
+            self.processed += 1
+            if not ok:
+                self.failed += 1
+            self._latencies.append(latency)
+            self._waits.append(wait)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+            stats = {'processed': self.processed, 'failed': self.failed}
+        stats.update(
+            threads=self.thread_count,
+            queued=self.queue.qsize(),
+            latency_ms=_percentiles(latencies),
+            wait_ms=_percentiles(waits),
+        )
+        return stats
+
+
+def _percentiles(values):
+    if not values:
+        return dict.fromkeys(['p50', 'p90', 'p99', 'max'], 0)
+    return dict(
+        (name, round(values[min(len(values) - 1, int(len(values) * percent / 100.0))] * 1000, 1))
+        for name, percent in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]
+    )
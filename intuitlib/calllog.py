@@ -0,0 +1,279 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""This module contains sampled, structured logging of outbound OAuth calls with secrets redacted
+
+Calls are logged to the `intuitlib.calls` logger. While that logger is disabled for the configured levels,
+logging a call costs one level check. Records are formatted, and secrets redacted, only when a handler
+formats the message or reads `record.oauth_call.as_dict()`.
+"""
+
+import hashlib
+import json
+import logging
+import random
+
+import six
+
+try:
+    from urllib.parse import unquote_plus, urlsplit, urlunsplit
+except ImportError:
+    from urlparse import urlsplit, urlunsplit
+    from urllib import unquote_plus
+
+LOGGER_NAME = 'intuitlib.calls'
+
+# headers whose values are replaced, the auth scheme is kept
+REDACTED_HEADERS = frozenset(['authorization', 'cookie', 'set-cookie', 'proxy-authorization'])
+
+# body, query and JSON keys whose values are replaced
+REDACTED_KEYS = frozenset([
+    'access_token', 'refresh_token', 'id_token', 'token', 'code', 'client_secret', 'client_assertion',
+    'password', 'oauth_token', 'oauth_token_secret', 'oauth_signature', 'consumer_secret', 'access_secret',
+])
+
+
+class CallLogger(object):
+    """Logs outbound OAuth calls as structured records, sampled and with secrets redacted
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG, error_level=logging.WARNING, sample_rate=1.0, error_sample_rate=1.0, include_bodies=False):
+        """Constructor for CallLogger
+
+        :param logger: `logging.Logger` to log to, defaults to None (`intuitlib.calls`)
+        :param level: Level of successful calls, defaults to DEBUG
+        :param error_level: Level of calls that raised or returned status != 200, defaults to WARNING
+        :param sample_rate: Share of successful calls logged, 0 to 1, defaults to 1.0
+        :param error_sample_rate: Share of failed calls logged, 0 to 1, defaults to 1.0
+        :param include_bodies: Log redacted request and response bodies, defaults to False
+        """
+
+        self.logger = logger or logging.getLogger(LOGGER_NAME)
+        self.level = level
+        self.error_level = error_level
+        self.sample_rate = sample_rate
+        self.error_sample_rate = error_sample_rate
+        self.include_bodies = include_bodies
+        self._random = random.Random()
+
+    def enabled(self):
+        """Checks if any call would be logged, used to skip timing calls when logging is off
+
+        :return: True/False
+        """
+
+        if self.sample_rate <= 0 and self.error_sample_rate <= 0:
+            return False
+        return self.logger.isEnabledFor(min(self.level, self.error_level))
+
+    def log_call(self, method, url, endpoint, headers, body, latency, response=None, error=None):
+        """Logs one call if sampled, formatting is deferred to the handler
+
+        :param method: HTTP method type
+        :param url: request URL
+        :param endpoint: Endpoint name, e.g. 'token', may be None
+        :param headers: request headers
+        :param body: request body
+        :param latency: Seconds the call took
+        :param response: Response, None if the call raised
+        :param error: Exception raised by the call, defaults to None
+        :return: `CallRecord` if logged, else None
+        """
+
+        failed = error is not None or response is None or response.status_code != 200
+        level, rate = (self.error_level, self.error_sample_rate) if failed else (self.level, self.sample_rate)
+        if rate < 1 and self._random.random() >= rate:
+            return None
+        if not self.logger.isEnabledFor(level):
+            return None
+        call = CallRecord(method, url, endpoint, headers, body, latency, response, error, rate, self.include_bodies)
+        self.logger.log(level, '%s', call, extra={'oauth_call': call})
+        return call
+
+
+class CallRecord(object):
+    """Lazily redacted and serialized view of one call, its string form is one JSON object
+
+    Raw headers, bodies and response are released once the redacted record is built, and only the redacted
+    record is pickled, e.g. by `logging.handlers.SocketHandler` or a `QueueHandler` feeding another process.
+    """
+
+    __slots__ = ('method', 'url', 'endpoint', 'headers', 'body', 'latency', 'response', 'error', 'sample_rate', 'include_bodies', '_dict')
+
+    def __init__(self, method, url, endpoint, headers, body, latency, response, error, sample_rate, include_bodies):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.headers = dict(headers or {})
+        self.body = body
+        self.latency = latency
+        self.response = response
+        self.error = error
+        self.sample_rate = sample_rate
+        self.include_bodies = include_bodies
+        self._dict = None
+
+    def as_dict(self):
+        """Gets the redacted record, built on first use
+
+        :return: dict of JSON types
+        """
+
+        # threads racing here build the same record twice, which is harmless
+        record = self._dict
+        if record is None:
+            headers, body, response, error = self.headers, self.body, self.response, self.error
+            if headers is None:
+                # released by a thread that stored the record first
+                return self._dict
+            record = self._dict = self._build(headers, body, response, error)
+            self.headers = self.body = self.response = self.error = None
+        return record
+
+    def __str__(self):
+        return json.dumps(self.as_dict(), sort_keys=True, default=str)
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self._dict = state
+
+    def _build(self, headers, body, response, error):
+        record = {
+            'event': 'oauth_call',
+            'method': self.method,
+            'url': redact_url(self.url),
+            'endpoint': self.endpoint,
+            'latency_ms': round(self.latency * 1000, 3),
+            'request_headers': redact_headers(headers),
+            'sample_rate': self.sample_rate,
+        }
+        if response is not None:
+            record['status'] = response.status_code
+            record['intuit_tid'] = response.headers.get('intuit_tid')
+        if error is not None:
+            record['error'] = '{0}: {1}'.format(type(error).__name__, error)
+        if self.include_bodies:
+            record['request_body'] = redact_body(body)
+            if response is not None:
+                record['response_body'] = redact_body(response.content)
+        return record
+
+
+def redact_headers(headers):
+    """Replaces values of authorization and cookie headers, keeping the auth scheme
+
+    :param headers: dict of headers
+    :return: new dict
+    """
+
+    redacted = {}
+    for name, value in headers.items():
+        if name.lower() in REDACTED_HEADERS and value:
+            scheme, _, secret = str(value).partition(' ')
+            redacted[name] = '{0} {1}'.format(scheme, _fingerprint(secret)) if secret else _fingerprint(scheme)
+        else:
+            redacted[name] = value
+    return redacted
+
+
+def redact_body(body):
+    """Replaces secret values of a form encoded or JSON body
+
+    :param body: str, bytes or dict
+    :return: Redacted body, or a placeholder if it is neither form encoded nor JSON
+    """
+
+    if body is None or body == b'' or body == '':
+        return body
+    if isinstance(body, dict):
+        return _redact_json(body)
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return '<{0} bytes>'.format(len(body))
+    stripped = body.lstrip()
+    if stripped.startswith('{') or stripped.startswith('['):
+        try:
+            return _redact_json(json.loads(body))
+        except ValueError:
+            pass
+    if '=' in body and ' ' not in body:
+        return '&'.join(_redact_pair(pair) for pair in body.split('&'))
+    return '<{0} characters>'.format(len(body))
+
+
+def redact_url(url):
+    """Replaces secret query parameters of a URL
+
+    :param url: URL
+    :return: Redacted URL
+    """
+
+    if not url or '?' not in url:
+        return url
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(query=redact_body(parts.query)))
+
+
+_default_call_logger = CallLogger()
+
+
+def get_call_logger(call_logger=None):
+    """Resolves the call logger used for a call
+
+    :param call_logger: `CallLogger` instance, defaults to None (library default)
+    :return: `CallLogger`
+    """
+
+    return call_logger if call_logger is not None else _default_call_logger
+
+
+def set_call_logger(call_logger):
+    """Sets library wide call logger used by clients that do not specify one
+
+    :param call_logger: `CallLogger`, None to restore the default
+    :return: `CallLogger` now in use
+    """
+
+    global _default_call_logger
+    _default_call_logger = call_logger or CallLogger()
+    return _default_call_logger
+
+
+def _redact_pair(pair):
+    key, separator, value = pair.partition('=')
+    if separator and unquote_plus(key) in REDACTED_KEYS:
+        return '{0}={1}'.format(key, _fingerprint(unquote_plus(value)))
+    return pair
+
+
+def _redact_json(value):
+    if isinstance(value, dict):
+        return dict((key, _fingerprint(item) if key in REDACTED_KEYS and isinstance(item, six.string_types) else _redact_json(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [_redact_json(item) for item in value]
+    return value
+
+
+def _fingerprint(secret):
+    """Placeholder for a secret, the hash prefix lets records of the same token be correlated
+    """
+
+    return '<redacted:{0}>'.format(hashlib.sha256(secret.encode('utf-8')).hexdigest()[:8])
@@ -0,0 +1,319 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""Command line tool for bulk token operations, run as `python -m intuitlib` or `intuit-oauth`
+
+Reads one record per realm from CSV or JSONL (columns/keys: realm_id, refresh_token, access_token, id_token, token),
+runs the operation for every record and writes one JSON line per result as soon as it completes.
+"""
+
+from __future__ import print_function
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from intuitlib.client import AuthClient
+from intuitlib.concurrency import AdaptiveLimiter
+from intuitlib.endpoints import EndpointConfig
+from intuitlib.exceptions import AuthClientError
+from intuitlib.jwks import JWKCache
+from intuitlib.ratelimit import RateLimiter
+from intuitlib.transport import Urllib3Transport
+from intuitlib.utils import validate_id_tokens
+
+OPERATIONS = ['refresh', 'revoke', 'userinfo', 'validate']
+
+# endpoint each operation is rate limited on
+_ENDPOINTS = {
+    'refresh': 'token',
+    'revoke': 'revoke',
+    'userinfo': 'userinfo',
+}
+
+
+class Stats(object):
+    """Thread-safe throughput and latency statistics of a run
+    """
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.latencies = []
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, ok, latency):
+        """Records one result
+
+        :param ok: True if the operation succeeded
+        :param latency: Operation latency in seconds
+        """
+
+        with self._lock:
+            if ok:
+                self.ok += 1
+            else:
+                self.failed += 1
+            self.latencies.append(latency)
+
+    def percentile(self, percent):
+        """Gets latency percentile in seconds
+
+        :param percent: Percentile, 0-100
+        :return: Latency in seconds, 0 if nothing was recorded
+        """
+
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100.0))]
+
+    def summary(self):
+        """Gets run summary
+
+        :return: dict with counts, elapsed seconds, throughput and latency percentiles in ms
+        """
+
+        elapsed = time.monotonic() - self.started
+        total = self.ok + self.failed
+        return {
+            'total': total,
+            'ok': self.ok,
+            'failed': self.failed,
+            'elapsed_s': round(elapsed, 3),
+            'throughput_per_s': round(total / elapsed, 1) if elapsed else 0,
+            'latency_ms': dict(
+                (name, round(self.percentile(percent) * 1000, 1))
+                for name, percent in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]
+            ),
+        }
+
+
+def read_records(stream, input_format):
+    """Reads records lazily from CSV or JSONL
+
+    :param stream: file object
+    :param input_format: 'csv' or 'jsonl'
+    :return: generator of dict
+    """
+
+    if input_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield dict((key, value) for key, value in row.items() if value)
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def run_operation(operation, records, make_client, output, concurrency=8, stats=None):
+    """Runs refresh, revoke or userinfo for every record with bounded concurrency
+
+    :param operation: 'refresh', 'revoke' or 'userinfo'
+    :param records: iterable of dict
+    :param make_client: callable taking a record and returning `intuitlib.client.AuthClient`
+    :param output: file object results are written to as JSON lines
+    :param concurrency: Number of calls in flight, defaults to 8
+    :param stats: `Stats` to record into, defaults to None (created)
+    :return: `Stats`
+    """
+
+    stats = stats or Stats()
+    write_lock = threading.Lock()
+
+    def process(index, record):
+        result = {'index': index, 'realm_id': record.get('realm_id')}
+        start = time.monotonic()
+        try:
+            client = make_client(record)
+            if operation == 'refresh':
+                client.refresh()
+                tokens = client.tokens
+                result.update(
+                    access_token=tokens.access_token,
+                    refresh_token=tokens.refresh_token,
+                    expires_in=tokens.expires_in,
+                    x_refresh_token_expires_in=tokens.x_refresh_token_expires_in,
+                    issued_at=tokens.issued_at,
+                )
+            elif operation == 'revoke':
+                client.revoke(token=record.get('token'))
+            else:
+                result['userinfo'] = client.codec.response_json(client.get_user_info())
+            result['ok'] = True
+        except AuthClientError as e:
+            result.update(ok=False, status=e.status_code, error=_text(e.content), intuit_tid=e.intuit_tid)
+        except Exception as e:
+            # any other failure is reported in the result line so the run carries on
+            result.update(ok=False, error='{0}: {1}'.format(type(e).__name__, e))
+        latency = time.monotonic() - start
+        result['latency_ms'] = round(latency * 1000, 1)
+        stats.record(result['ok'], latency)
+        line = json.dumps(result)
+        with write_lock:
+            output.write(line + '\n')
+            output.flush()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        for index, record in enumerate(records):
+            if len(in_flight) >= concurrency:
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            in_flight.add(executor.submit(process, index, record))
+    return stats
+
+
+def run_validate(records, client_id, issuer, jwk_uri, output, concurrency=8, stats=None, **kwargs):
+    """Validates the id_token of every record with `intuitlib.utils.validate_id_tokens`
+
+    :param records: iterable of dict
+    :param client_id: Client ID
+    :param issuer: Intuit Issuer
+    :param jwk_uri: JWK URI
+    :param output: file object results are written to as JSON lines
+    :param concurrency: Number of worker processes, defaults to 8
+    :param stats: `Stats` to record into, defaults to None (created)
+    :param kwargs: passed to `intuitlib.utils.validate_id_tokens`
+    :return: `Stats`
+    """
+
+    stats = stats or Stats()
+    pending = deque()
+
+    def id_tokens():
+        for record in records:
+            pending.append((record.get('realm_id'), time.monotonic()))
+            yield record.get('id_token') or ''
+
+    results = validate_id_tokens(id_tokens(), client_id, issuer, jwk_uri, processes=concurrency, **kwargs)
+    for index, is_valid in enumerate(results):
+        realm_id, start = pending.popleft()
+        latency = time.monotonic() - start
+        stats.record(is_valid, latency)
+        output.write(json.dumps({'index': index, 'realm_id': realm_id, 'ok': is_valid, 'latency_ms': round(latency * 1000, 1)}) + '\n')
+        output.flush()
+    return stats
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='intuit-oauth', description='Bulk Intuit OAuth token operations')
+    parser.add_argument('operation', choices=OPERATIONS)
+    parser.add_argument('--input', '-i', default='-', help='CSV or JSONL file, - for stdin (default)')
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='defaults to file extension, jsonl for stdin')
+    parser.add_argument('--output', '-o', default='-', help='JSONL results file, - for stdout (default)')
+    parser.add_argument('--client-id', default=os.environ.get('INTUIT_CLIENT_ID'), help='defaults to $INTUIT_CLIENT_ID')
+    parser.add_argument('--client-secret', default=os.environ.get('INTUIT_CLIENT_SECRET'), help='defaults to $INTUIT_CLIENT_SECRET')
+    parser.add_argument('--redirect-uri', default=os.environ.get('INTUIT_REDIRECT_URI', ''), help='defaults to $INTUIT_REDIRECT_URI')
+    parser.add_argument('--environment', '-e', default='sandbox', help="'sandbox', 'production' or a discovery URL")
+    parser.add_argument('--concurrency', '-c', type=int, default=8, help='calls in flight, worker processes for validate')
+    parser.add_argument('--rate', type=float, help='maximum calls per second to the endpoint')
+    parser.add_argument('--adaptive', action='store_true', help='adapt calls in flight to endpoint latency and throttling, starting at --concurrency')
+    parser.add_argument('--max-concurrency', type=int, default=64, help='highest calls in flight with --adaptive (default 64)')
+    parser.add_argument('--transport', choices=['requests', 'urllib3'], default='requests')
+    return parser
+
+
+def main(argv=None, transport=None):
+    """Entry point of the command line tool
+
+    :param argv: Arguments, defaults to None (sys.argv)
+    :param transport: `intuitlib.transport.Transport` used instead of --transport, defaults to None
+    :return: 0 if every operation succeeded, 1 if any failed, 2 for usage errors
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.client_id or (args.operation != 'validate' and not args.client_secret):
+        parser.print_usage(sys.stderr)
+        print('intuit-oauth: error: --client-id and --client-secret are required', file=sys.stderr)
+        return 2
+
+    concurrency_limiter = None
+    concurrency = args.concurrency
+    if args.adaptive and args.operation != 'validate':
+        concurrency = max(args.max_concurrency, args.concurrency)
+        concurrency_limiter = AdaptiveLimiter(initial=args.concurrency, max_limit=concurrency)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if transport is None and args.transport == 'urllib3':
+        transport = Urllib3Transport(maxsize=concurrency)
+
+    rate_limiter = None
+    if args.rate and args.operation in _ENDPOINTS:
+        rate_limiter = RateLimiter({_ENDPOINTS[args.operation]: (args.rate, max(args.rate, 1))})
+
+    endpoint_config = EndpointConfig(args.environment, session=session, transport=transport)
+    jwk_cache = JWKCache()
+
+    def make_client(record):
+        return AuthClient(
+            args.client_id,
+            args.client_secret,
+            args.redirect_uri,
+            args.environment,
+            access_token=record.get('access_token'),
+            refresh_token=record.get('refresh_token'),
+            realm_id=record.get('realm_id'),
+            session=session,
+            endpoint_config=endpoint_config,
+            jwk_cache=jwk_cache,
+            rate_limiter=rate_limiter,
+            transport=transport,
+            concurrency_limiter=concurrency_limiter,
+        )
+
+    input_format = args.input_format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    input_stream = sys.stdin if args.input == '-' else open(args.input)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        records = read_records(input_stream, input_format)
+        if args.operation == 'validate':
+            endpoints = endpoint_config.endpoints
+            stats = run_validate(records, args.client_id, endpoints.issuer_uri, endpoints.jwks_uri, output,
+                concurrency=args.concurrency, session=session, jwk_cache=jwk_cache, transport=transport)
+        else:
+            stats = run_operation(args.operation, records, make_client, output, concurrency=concurrency)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output is not sys.stdout:
+            output.close()
+        session.close()
+
+    summary = stats.summary()
+    if concurrency_limiter is not None:
+        summary['concurrency'] = concurrency_limiter.metrics()
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if stats.failed else 0
+
+
+def _text(content):
+    if isinstance(content, bytes):
+        return content.decode('utf-8', 'replace')
+    return content
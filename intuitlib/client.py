@@ -12,7 +12,8 @@
  # See the License for the specific language governing permissions and
  # limitations under the License.
 
-import json
+import logging
+import threading
 import requests
 
 try:
@@ -21,18 +22,67 @@ except (ModuleNotFoundError, ImportError):
   from future.moves.urllib.parse import urlencode
 
 from intuitlib.utils import (
-    get_discovery_doc,
     generate_token,
     scopes_to_string,
-    get_auth_header,
     send_request,
+    set_attributes,
 )
+from intuitlib.endpoints import EndpointConfig
+from intuitlib.exceptions import AuthClientError
+from intuitlib.jsoncodec import get_codec
+from intuitlib.scopes import ScopeSet
+from intuitlib.templates import RequestTemplates
+from intuitlib.tokens import TokenSet, encode_state, decode_state, state_to_dict, state_from_dict
+
+_logger = logging.getLogger(__name__)
+
+def _token_property(name):
+    """Attribute reading from the current `intuitlib.tokens.TokenSet`, assignments swap in a new snapshot
+    """
+
+    def getter(self):
+        return getattr(self._tokens, name)
+
+    def setter(self, value):
+        self.update_tokens(**{name: value})
+
+    return property(getter, setter)
+
+def _endpoint_property(name):
+    """Attribute reading from the current `intuitlib.endpoints.Endpoints` of the client's config
+    """
+
+    def getter(self):
+        return getattr(self.endpoint_config.endpoints, name)
+
+    def setter(self, value):
+        self._detach_endpoints().update(**{name: value})
+
+    return property(getter, setter)
 
 class AuthClient(requests.Session):
     """Handles OAuth 2.0 and OpenID Connect flows to get access to User Info API, Accounting APIs and Payments APIs
+
+    Token state is kept in an immutable `intuitlib.tokens.TokenSet` that is replaced as a whole on every update,
+    so a client can be shared between threads and readers never see tokens from different responses.
     """
 
-    def __init__(self, client_id, client_secret, redirect_uri, environment, state_token=None, access_token=None, refresh_token=None, id_token=None, realm_id=None):
+    access_token = _token_property('access_token')
+    refresh_token = _token_property('refresh_token')
+    id_token = _token_property('id_token')
+    expires_in = _token_property('expires_in')
+    x_refresh_token_expires_in = _token_property('x_refresh_token_expires_in')
+    realm_id = _token_property('realm_id')
+    scope = _token_property('scope')
+
+    auth_endpoint = _endpoint_property('auth_endpoint')
+    token_endpoint = _endpoint_property('token_endpoint')
+    revoke_endpoint = _endpoint_property('revoke_endpoint')
+    issuer_uri = _endpoint_property('issuer_uri')
+    jwks_uri = _endpoint_property('jwks_uri')
+    user_info_url = _endpoint_property('user_info_url')
+
+    def __init__(self, client_id, client_secret, redirect_uri, environment, state_token=None, access_token=None, refresh_token=None, id_token=None, realm_id=None, codec=None, session=None, discovery_doc=None, jwk_cache=None, rate_limiter=None, transport=None, endpoint_config=None, token_store=None, dead_token_cache=None, concurrency_limiter=None, call_logger=None):
         """Constructor for AuthClient
 
         :param client_id: Client ID found in developer account Keys tab
@@ -44,50 +94,215 @@ class AuthClient(requests.Session):
         :param refresh_token: Refresh Token for refresh or revoke functionality, defaults to None
         :param id_token: ID Token for OpenID flow, defaults to None
         :param realm_id: QBO Realm/Company ID, defaults to None
+        :param codec: JSON codec instance or name used for requests and responses, accepted values: 'json', 'orjson', 'ujson', 'auto', defaults to None (library default)
+        :param session: `requests.Session` whose connection pool is used for API calls, defaults to None (this client)
+        :param discovery_doc: Discovery doc dict to use instead of fetching it, defaults to None
+        :param jwk_cache: `intuitlib.jwks.JWKCache` used to validate ID tokens, defaults to None (JWKS fetched on every validation)
+        :param rate_limiter: `intuitlib.ratelimit.RateLimiter` applied to token, revoke and userinfo calls, defaults to None
+        :param transport: `intuitlib.transport.Transport` all API calls are sent with, defaults to None (`requests` using session)
+        :param endpoint_config: `intuitlib.endpoints.EndpointConfig` shared with other clients, defaults to None (created from discovery_doc or the discovery URL)
+        :param token_store: `intuitlib.tokencache.SharedTokenCache` token updates are written to and refresh reads newer tokens from, defaults to None
+        :param dead_token_cache: `intuitlib.deadtokens.DeadTokenCache` of refresh tokens that are not sent again, defaults to None
+        :param concurrency_limiter: `intuitlib.concurrency.AdaptiveLimiter` shared by clients of a bulk run, defaults to None
+        :param call_logger: `intuitlib.calllog.CallLogger` token, revoke and userinfo calls are logged with, defaults to None (library default)
         """
 
         super(AuthClient, self).__init__()
 
+        self._token_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._tokens = TokenSet(access_token=access_token, refresh_token=refresh_token, id_token=id_token, realm_id=realm_id)
+        self.token_store = token_store
+        self.dead_token_cache = dead_token_cache
+
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.environment = environment
         self.state_token = state_token
+        self.codec = get_codec(codec)
+        self.session = session if session is not None else self
+        self.jwk_cache = jwk_cache
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+        self.call_logger = call_logger
+        self.transport = transport
+        self._templates = None
 
         # Discovery doc contains endpoints based on environment specified
-        discovery_doc = get_discovery_doc(self.environment, session=self)
-        self.auth_endpoint = discovery_doc['authorization_endpoint']
-        self.token_endpoint = discovery_doc['token_endpoint']
-        self.revoke_endpoint = discovery_doc['revocation_endpoint']
-        self.issuer_uri = discovery_doc['issuer']
-        self.jwks_uri = discovery_doc['jwks_uri']
-        self.user_info_url = discovery_doc['userinfo_endpoint']
-
-        # response values
-        self.realm_id = realm_id
-        self.access_token = access_token
-        self.expires_in = None
-        self.refresh_token = refresh_token
-        self.x_refresh_token_expires_in = None
-        self.id_token = id_token
+        self._owns_endpoint_config = endpoint_config is None
+        if endpoint_config is None:
+            endpoint_config = EndpointConfig(self.environment, discovery_doc, session=self.session, codec=self.codec, transport=self.transport)
+        self.endpoint_config = endpoint_config
+
+    @classmethod
+    def from_pinned_endpoints(cls, client_id, client_secret, redirect_uri, environment, endpoints=None, lazy_refresh=False, **kwargs):
+        """Creates AuthClient without any network I/O using pinned endpoint values
+
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param endpoints: dict of endpoint URLs, path to a JSON file with them, or None for the built-in values of environment
+        :param lazy_refresh: Fetch the discovery doc on a background thread on first use, defaults to False
+        :param kwargs: other `AuthClient` arguments
+        :raises ValueError: if endpoints is None and environment has no built-in values
+        :return: AuthClient
+        """
+
+        endpoint_config = EndpointConfig.pinned(environment, endpoints, lazy_refresh=lazy_refresh,
+            session=kwargs.get('session'), codec=kwargs.get('codec'), transport=kwargs.get('transport'))
+        client = cls(client_id, client_secret, redirect_uri, environment, endpoint_config=endpoint_config, **kwargs)
+        client._owns_endpoint_config = True
+        if endpoint_config.session is None:
+            endpoint_config.session = client.session
+        return client
+
+    @classmethod
+    def from_bytes(cls, data, client_id, client_secret, redirect_uri, environment, **kwargs):
+        """Creates AuthClient with token state encoded by `to_bytes`
+
+        The endpoints version in the state is informational only, the client uses the endpoints of endpoint_config
+        or the environment. Read it with `intuitlib.tokens.decode_state` to detect state saved with other endpoints.
+
+        :param data: bytes
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param kwargs: other `AuthClient` arguments, pass endpoint_config to skip fetching the discovery doc
+        :raises ValueError: if data is not token state of a known layout version
+        :return: AuthClient
+        """
+
+        tokens = decode_state(data)[0]
+        client = cls(client_id, client_secret, redirect_uri, environment, **kwargs)
+        client._tokens = tokens
+        return client
+
+    @classmethod
+    def from_dict(cls, state, client_id, client_secret, redirect_uri, environment, **kwargs):
+        """Creates AuthClient with token state converted by `to_dict`
+
+        The endpoints version in the state is informational only, the client uses the endpoints of endpoint_config
+        or the environment. Read it with `intuitlib.tokens.state_from_dict` to detect state saved with other endpoints.
+
+        :param state: dict
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param kwargs: other `AuthClient` arguments, pass endpoint_config to skip fetching the discovery doc
+        :raises ValueError: if state is of a newer layout version
+        :return: AuthClient
+        """
+
+        tokens = state_from_dict(state)[0]
+        client = cls(client_id, client_secret, redirect_uri, environment, **kwargs)
+        client._tokens = tokens
+        return client
+
+    def to_bytes(self):
+        """Encodes token state (tokens, expiries, realm and endpoints version) in a compact binary layout, credentials and session are not included
+
+        :return: bytes, see `intuitlib.tokens.decode_state`
+        """
+
+        return encode_state(self._tokens, self.endpoint_config.version)
+
+    def to_dict(self):
+        """Converts token state to a dict of JSON types, including absolute expiries
+
+        :return: dict, see `intuitlib.tokens.state_from_dict`
+        """
+
+        return state_to_dict(self._tokens, self.endpoint_config.version)
+
+    @property
+    def tokens(self):
+        """Current token state, read without locking
+
+        :return: `intuitlib.tokens.TokenSet`
+        """
+
+        return self._tokens
+
+    def update_tokens(self, **values):
+        """Replaces token state with a snapshot of the current one updated with values
+
+        Failing to write the new tokens to `token_store` is logged, not raised, the client holds them either way.
+
+        :param values: `intuitlib.tokens.TokenSet` field values
+        :return: New `intuitlib.tokens.TokenSet`
+        """
+
+        with self._token_lock:
+            self._tokens = tokens = self._tokens._replace(**values)
+            if self.token_store is not None and tokens.realm_id is not None:
+                try:
+                    self.token_store.put(tokens.realm_id, tokens)
+                except Exception:
+                    # raising here would report a refresh that already rotated the refresh token as failed
+                    _logger.warning('Could not store tokens of realm %s', tokens.realm_id, exc_info=True)
+            return tokens
+
+    def load_tokens(self):
+        """Replaces token state with the tokens in `token_store` if they were issued later, e.g. by another process
+
+        :return: True if tokens were replaced
+        """
+
+        if self.token_store is None:
+            return False
+        with self._token_lock:
+            current = self._tokens
+            stored = self.token_store.get(current.realm_id)
+            if stored is None or (stored.issued_at or 0) <= (current.issued_at or 0):
+                return False
+            self._tokens = stored
+            return True
+
+    @property
+    def granted_scopes(self):
+        """Scopes from the `scope` field of the last token response
+
+        :return: `intuitlib.scopes.ScopeSet`
+        """
+
+        return ScopeSet.from_string(self.scope)
 
     def setAuthorizeURLs(self, urlObject):
         """Set authorization url using custom values passed in the data dict
+
+        Only this client is changed, it stops following a shared `endpoint_config`. Use
+        `intuitlib.endpoints.EndpointConfig.update` to change the URLs of every client sharing it.
+
         :param **data: data dict for custom authorizationURLS
         :return: self
         """
         if urlObject is not None:
-            self.auth_endpoint = urlObject['auth_endpoint']
-            self.token_endpoint = urlObject['token_endpoint']
-            self.revoke_endpoint = urlObject['revoke_endpoint']
-            self.user_info_url = urlObject['user_info_url']
+            self._detach_endpoints().update(
+                auth_endpoint=urlObject['auth_endpoint'],
+                token_endpoint=urlObject['token_endpoint'],
+                revoke_endpoint=urlObject['revoke_endpoint'],
+                user_info_url=urlObject['user_info_url'],
+            )
         return None
 
+    def _detach_endpoints(self):
+        """Replaces a shared endpoint config by a copy owned by this client
+        """
+
+        if not self._owns_endpoint_config:
+            self.endpoint_config = self.endpoint_config.copy()
+            self._owns_endpoint_config = True
+        return self.endpoint_config
+
     def get_authorization_url(self, scopes, state_token=None):
         """Generates authorization url using scopes specified where user is redirected to
 
         :param scopes: Scopes for OAuth/OpenId flow
-        :type scopes: list of enum, `intuitlib.enums.Scopes`
+        :type scopes: list of enum, `intuitlib.enums.Scopes` or `intuitlib.scopes.ScopeSet`
         :param state_token: CSRF token, defaults to None
         :return: Authorization url
         """
@@ -113,24 +328,14 @@ class AuthClient(requests.Session):
         :param auth_code: Authorization code received from redirect_uri
         :param realm_id: Realm ID/Company ID of the QBO company
         :raises `intuitlib.exceptions.AuthClientError`: if response status != 200
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if rate_limiter or concurrency_limiter does not allow the call in time
         """
 
         realm = realm_id or self.realm_id
         if realm is not None:
             self.realm_id = realm
 
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Authorization': get_auth_header(self.client_id, self.client_secret)
-        }
-
-        body = {
-            'grant_type': 'authorization_code',
-            'code': auth_code,
-            'redirect_uri': self.redirect_uri
-        }
-
-        send_request('POST', self.token_endpoint, headers, self, body=urlencode(body), session=self)
+        set_attributes(self, self._redeem_code(auth_code))
 
     def refresh(self, refresh_token=None):
         """Gets fresh access_token and refresh_token
@@ -138,23 +343,32 @@ class AuthClient(requests.Session):
         :param refresh_token: Refresh Token
         :raises ValueError: if Refresh Token value not specified
         :raises `intuitlib.exceptions.AuthClientError`: if response status != 200
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if rate_limiter or concurrency_limiter does not allow the call in time
+        :raises `intuitlib.exceptions.DeadRefreshTokenError`: if dead_token_cache has the refresh token
         """
 
+        if refresh_token is None:
+            # another process may have rotated the refresh token, use the newest one
+            self.load_tokens()
+
         token = refresh_token or self.refresh_token
         if token is None:
             raise ValueError('Refresh token not specified')
-
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded',
-            'Authorization': get_auth_header(self.client_id, self.client_secret)
-        }
-
-        body = {
-            'grant_type': 'refresh_token',
-            'refresh_token': token
-        }
-
-        send_request('POST', self.token_endpoint, headers, self, body=urlencode(body), session=self)
+        if self.dead_token_cache is not None:
+            self.dead_token_cache.check(token, self.realm_id)
+
+        templates = self._request_templates()
+
+        with self._refresh_lock:
+            # another thread refreshed while this one waited, its tokens are already current
+            if refresh_token is None and self.refresh_token != token:
+                return
+            try:
+                self._send_request('POST', 'token', self.token_endpoint, templates.token_headers, body=templates.refresh_body(token))
+            except AuthClientError as e:
+                if self.dead_token_cache is not None:
+                    self.dead_token_cache.add_error(token, self.realm_id, e, self.codec)
+                raise
 
     def revoke(self, token=None):
         """Revokes access to QBO company/User Info using either valid Refresh Token or Access Token
@@ -162,6 +376,7 @@ class AuthClient(requests.Session):
         :param token: Refresh Token or Access Token to revoke
         :raises ValueError: if Refresh Token or Access Token value not specified
         :raises `intuitlib.exceptions.AuthClientError`: if response status != 200
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if rate_limiter or concurrency_limiter does not allow the call in time
         :return: True if token successfully revoked
         """
 
@@ -169,16 +384,11 @@ class AuthClient(requests.Session):
         if token_to_revoke is None:
             raise ValueError('Token to revoke not specified')
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': get_auth_header(self.client_id, self.client_secret)
-        }
-
         body = {
             'token': token_to_revoke
         }
 
-        send_request('POST', self.revoke_endpoint, headers, self, body=json.dumps(body), session=self)
+        self._send_request('POST', 'revoke', self.revoke_endpoint, self._request_templates().revoke_headers, body=self.codec.dumps(body))
         return True
 
     def get_user_info(self, access_token=None):
@@ -187,6 +397,7 @@ class AuthClient(requests.Session):
         :param access_token: Access token
         :raises ValueError: if Refresh Token or Access Token value not specified
         :raises `intuitlib.exceptions.AuthClientError`: if response status != 200
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if rate_limiter or concurrency_limiter does not allow the call in time
         :return: Requests object
         """
 
@@ -198,4 +409,26 @@ class AuthClient(requests.Session):
             'Authorization': 'Bearer {0}'.format(token)
         }
 
-        return send_request('GET', self.user_info_url, headers, self, session=self)
+        return self._send_request('GET', 'userinfo', self.user_info_url, headers)
+
+    def _redeem_code(self, auth_code):
+        """Sends the authorization code grant, the token response is returned without being applied
+        """
+
+        templates = self._request_templates()
+        response = self._send_request('POST', 'token', self.token_endpoint, templates.token_headers, body=templates.code_body(auth_code), set_response=False)
+        return self.codec.response_json(response) if response.content else {}
+
+    def _request_templates(self):
+        """Gets request templates of the current credentials, rebuilt after client_id, client_secret or redirect_uri change
+        """
+
+        templates = self._templates
+        if templates is None or not templates.matches(self.client_id, self.client_secret, self.redirect_uri):
+            templates = self._templates = RequestTemplates(self.client_id, self.client_secret, self.redirect_uri)
+        return templates
+
+    def _send_request(self, method, endpoint, url, headers, body=None, set_response=True):
+        return send_request(method, url, headers, self if set_response else None, body=body, session=self.session, codec=self.codec,
+            rate_limiter=self.rate_limiter, endpoint=endpoint, transport=self.transport, concurrency_limiter=self.concurrency_limiter,
+            call_logger=self.call_logger)
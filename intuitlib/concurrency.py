@@ -0,0 +1,199 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""This module contains an adaptive concurrency limiter for bulk calls to Intuit OAuth endpoints
+
+The limit follows AIMD: it grows by one for every `limit` successful calls made while at least half of it is used,
+and is multiplied by `backoff` on 429s, 5xx responses, connection errors or when the p99 latency of the last
+`window` calls rises above `latency_tolerance` times the healthy p99. `Retry-After` pauses new calls.
+"""
+
+import email.utils
+import threading
+import time
+from collections import deque
+
+from intuitlib.exceptions import RateLimitExceededError
+
+
+class AdaptiveLimiter(object):
+    """Thread-safe AIMD concurrency limiter, attached to `intuitlib.client.AuthClient` through its `concurrency_limiter` argument
+
+    Share one limiter between every client of a bulk run.
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, backoff=0.5, latency_tolerance=2.0, window=100, timeout=None):
+        """Constructor for AdaptiveLimiter
+
+        :param initial: Starting number of calls in flight, defaults to 8
+        :param min_limit: Lowest limit, defaults to 1
+        :param max_limit: Highest limit, defaults to 64
+        :param backoff: Factor the limit is multiplied by on overload, defaults to 0.5
+        :param latency_tolerance: p99 latency over the healthy p99 that counts as overload, defaults to 2.0
+        :param window: Number of calls p99 latency is computed over, defaults to 100
+        :param timeout: Maximum seconds `acquire` waits, defaults to None (no limit)
+        :raises ValueError: if limits are not 1 <= min_limit <= initial <= max_limit or backoff is not in (0, 1)
+        """
+
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError('Limits should satisfy 1 <= min_limit <= initial <= max_limit')
+        if not 0 < backoff < 1:
+            raise ValueError('Backoff should be between 0 and 1')
+
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+        self.timeout = timeout
+
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self.increases = 0
+        self.decreases = 0
+        self._limit = float(initial)
+        self._latencies = deque(maxlen=window)
+        self._since_check = 0
+        self._healthy_p99 = None
+        self._next_decrease = 0
+        self._paused_until = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        """Current number of calls allowed in flight
+        """
+
+        return int(self._limit)
+
+    def acquire(self, timeout=None):
+        """Waits for a free slot and takes it
+
+        :param timeout: Maximum seconds to wait, defaults to None (limiter setting)
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if no slot is free in time
+        :return: Start time to pass to `release`
+        """
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if now >= self._paused_until and self.in_flight < int(self._limit):
+                    self.in_flight += 1
+                    return now
+                wait = self._paused_until - now if now < self._paused_until else None
+                if deadline is not None:
+                    if now >= deadline:
+                        raise RateLimitExceededError('concurrency', max(wait or 0, 0))
+                    wait = min(wait, deadline - now) if wait is not None else deadline - now
+                self._condition.wait(wait)
+
+    def release(self, started, status_code=None, retry_after=None):
+        """Frees a slot and adjusts the limit from the call outcome
+
+        :param started: Start time returned by `acquire`
+        :param status_code: HTTP status of the response, None if the call failed without one
+        :param retry_after: `Retry-After` header value, seconds or HTTP date, defaults to None
+        """
+
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            # only calls made while at least half of the slots were used show that more would help
+            saturated = self.in_flight * 2 >= self._limit
+            self.in_flight -= 1
+            pause = _retry_after_seconds(retry_after)
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
+            if status_code is None or status_code == 429 or status_code >= 500:
+                self.overloads += 1
+                self._decrease(now, latency)
+            else:
+                self.successes += 1
+                self._latencies.append(latency)
+                self._since_check += 1
+                if self._since_check >= self.window:
+                    self._check_latency(now, latency)
+                elif saturated and self._limit < self.max_limit:
+                    self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+                    self.increases += 1
+            self._condition.notify_all()
+
+    def metrics(self):
+        """Gets limiter metrics
+
+        :return: dict with limit, calls in flight, call and adjustment counts, latency percentiles in ms and pause left in seconds
+        """
+
+        with self._condition:
+            latencies = sorted(self._latencies)
+            return {
+                'limit': int(self._limit),
+                'in_flight': self.in_flight,
+                'successes': self.successes,
+                'overloads': self.overloads,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+                'p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+                'healthy_p99_ms': round((self._healthy_p99 or 0) * 1000, 1),
+                'paused_s': round(max(self._paused_until - time.monotonic(), 0), 3),
+            }
+
+    def _decrease(self, now, latency):
+        """Multiplies the limit by backoff at most once per call latency, caller holds the lock
+        """
+
+        # calls in flight when the overload started report it too, they should not shrink the limit again
+        if now < self._next_decrease:
+            return
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._next_decrease = now + latency
+        self.decreases += 1
+
+    def _check_latency(self, now, latency):
+        """Compares p99 of the window with the healthy p99, caller holds the lock
+        """
+
+        self._since_check = 0
+        p99 = _percentile(sorted(self._latencies), 99)
+        if self._healthy_p99 is not None and p99 > self._healthy_p99 * self.latency_tolerance:
+            self.overloads += 1
+            self._decrease(now, latency)
+        elif self._healthy_p99 is None or p99 < self._healthy_p99:
+            self._healthy_p99 = p99
+        else:
+            # slow drift so a lasting change of network latency becomes the new normal
+            self._healthy_p99 = 0.9 * self._healthy_p99 + 0.1 * p99
+
+
+def _percentile(latencies, percent):
+    if not latencies:
+        return 0
+    return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100.0))]
+
+
+def _retry_after_seconds(value):
+    if value is None:
+        return 0
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        if parsed is None:
+            return 0
+        return max(email.utils.mktime_tz(parsed) - time.time(), 0)
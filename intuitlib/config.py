@@ -27,6 +27,26 @@ DISCOVERY_URL = {
     'production': 'https://developer.intuit.com/.well-known/openid_configuration/',
 }
 
+# discovery doc values published for each environment, used to build clients without network I/O
+KNOWN_ENDPOINTS = {
+    'sandbox': {
+        'issuer': 'https://oauth.platform.intuit.com/op/v1',
+        'authorization_endpoint': 'https://appcenter.intuit.com/connect/oauth2',
+        'token_endpoint': 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer',
+        'userinfo_endpoint': 'https://sandbox-accounts.platform.intuit.com/v1/openid_connect/userinfo',
+        'revocation_endpoint': 'https://developer.api.intuit.com/v2/oauth2/tokens/revoke',
+        'jwks_uri': 'https://oauth.platform.intuit.com/op/v1/jwks',
+    },
+    'production': {
+        'issuer': 'https://oauth.platform.intuit.com/op/v1',
+        'authorization_endpoint': 'https://appcenter.intuit.com/connect/oauth2',
+        'token_endpoint': 'https://oauth.platform.intuit.com/oauth2/v1/tokens/bearer',
+        'userinfo_endpoint': 'https://accounts.platform.intuit.com/v1/openid_connect/userinfo',
+        'revocation_endpoint': 'https://developer.api.intuit.com/v2/oauth2/tokens/revoke',
+        'jwks_uri': 'https://oauth.platform.intuit.com/op/v1/jwks',
+    },
+}
+
 # info for user-agent
 PYTHON_VERSION = platform.python_version()
 OS_SYSTEM = platform.uname()[0]
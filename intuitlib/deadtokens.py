@@ -0,0 +1,179 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""This module contains a negative cache of refresh tokens that failed with non-retryable grant errors
+"""
+
+import collections
+import hashlib
+import threading
+import time
+
+from intuitlib.exceptions import DeadRefreshTokenError
+from intuitlib.tokens import FLAG_DEAD, TokenSet
+
+# OAuth errors of a token response that retrying the same refresh token cannot fix
+NON_RETRYABLE_ERRORS = ('invalid_grant',)
+
+
+class DeadTokenCache(object):
+    """Thread-safe negative cache of refresh tokens, can be shared between clients
+
+    Tokens are kept as SHA-256 digests. With a `token_store`, dead tokens are also flagged on the realm's
+    record so other processes sharing the store skip them too.
+    """
+
+    def __init__(self, ttl=3600, errors=NON_RETRYABLE_ERRORS, token_store=None, maxsize=100000):
+        """Constructor for DeadTokenCache
+
+        :param ttl: Seconds a failed refresh token is not retried, defaults to 3600
+        :param errors: OAuth error codes that mark a refresh token dead, defaults to ('invalid_grant',)
+        :param token_store: `intuitlib.tokencache.SharedTokenCache` to share dead tokens through, defaults to None
+        :param maxsize: Maximum number of tokens kept in this process, oldest are dropped first, defaults to 100000
+        """
+
+        self.ttl = ttl
+        self.errors = frozenset(errors)
+        self.token_store = token_store
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, refresh_token, realm_id=None):
+        """Raises if refresh token is dead
+
+        :param refresh_token: Refresh Token
+        :param realm_id: QBO Realm/Company ID, used to look up `token_store`, defaults to None
+        :raises `intuitlib.exceptions.DeadRefreshTokenError`: if refresh token failed within ttl
+        """
+
+        entry = self.get(refresh_token, realm_id)
+        if entry is not None:
+            error, expires_at = entry
+            raise DeadRefreshTokenError(realm_id, error, max(expires_at - time.time(), 0))
+
+    def get(self, refresh_token, realm_id=None):
+        """Gets the error a refresh token failed with
+
+        :param refresh_token: Refresh Token
+        :param realm_id: QBO Realm/Company ID, used to look up `token_store`, defaults to None
+        :return: tuple of (error, expires_at) or None if refresh token is not known to be dead
+        """
+
+        key = _digest(refresh_token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                return entry
+
+        if self.token_store is not None and realm_id is not None:
+            record = self.token_store.get_record(realm_id)
+            if record is not None:
+                tokens, flags, updated_at = record
+                if flags & FLAG_DEAD and tokens.refresh_token == refresh_token and updated_at + self.ttl > now:
+                    entry = (NON_RETRYABLE_ERRORS[0], updated_at + self.ttl)
+                    with self._lock:
+                        self.hits += 1
+                        self._insert(key, entry)
+                    return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def add(self, refresh_token, realm_id=None, error=NON_RETRYABLE_ERRORS[0]):
+        """Marks refresh token dead for ttl seconds
+
+        :param refresh_token: Refresh Token
+        :param realm_id: QBO Realm/Company ID, used to flag the record in `token_store`, defaults to None
+        :param error: OAuth error code the refresh failed with, defaults to invalid_grant
+        """
+
+        with self._lock:
+            self._insert(_digest(refresh_token), (error, time.time() + self.ttl))
+
+        if self.token_store is not None and realm_id is not None:
+            if not self.token_store.set_flags(realm_id, FLAG_DEAD, refresh_token=refresh_token) and self.token_store.get(realm_id) is None:
+                self.token_store.put(realm_id, TokenSet(refresh_token=refresh_token, realm_id=realm_id), flags=FLAG_DEAD)
+
+    def add_error(self, refresh_token, realm_id, auth_client_error, codec):
+        """Marks refresh token dead if a failed refresh response carries a non-retryable error
+
+        :param refresh_token: Refresh Token sent in the failed request
+        :param realm_id: QBO Realm/Company ID, may be None
+        :param auth_client_error: `intuitlib.exceptions.AuthClientError` of the refresh
+        :param codec: `intuitlib.jsoncodec.JSONCodec` to parse the response body
+        :return: True if refresh token was marked dead
+        """
+
+        if auth_client_error.status_code != 400:
+            return False
+        try:
+            error = codec.loads(auth_client_error.content).get('error')
+        except (ValueError, TypeError, AttributeError):
+            return False
+        if error not in self.errors:
+            return False
+        self.add(refresh_token, realm_id, error)
+        return True
+
+    def discard(self, refresh_token):
+        """Forgets refresh token in this process, e.g. after the user reconnected the app
+
+        :param refresh_token: Refresh Token
+        """
+
+        with self._lock:
+            self._entries.pop(_digest(refresh_token), None)
+
+    def clear(self):
+        """Removes all tokens kept in this process
+        """
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Gets cache statistics
+
+        :return: dict with hits, misses and number of tokens kept in this process
+        """
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'tokens': len(self._entries),
+            }
+
+    def _insert(self, key, entry):
+        """Stores entry, caller holds the lock
+        """
+
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+def _digest(refresh_token):
+    return hashlib.sha256(refresh_token.encode('utf-8')).digest()
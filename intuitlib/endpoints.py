@@ -0,0 +1,259 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains the versioned endpoint configuration shared by `intuitlib.client.AuthClient` objects
+"""
+
+import json
+import threading
+from collections import namedtuple
+
+from intuitlib.config import DISCOVERY_URL, KNOWN_ENDPOINTS
+from intuitlib.utils import get_discovery_doc, get_discovery_url
+
+ENDPOINT_FIELDS = ('auth_endpoint', 'token_endpoint', 'revoke_endpoint', 'issuer_uri', 'jwks_uri', 'user_info_url')
+
+# discovery doc key for each endpoint field
+DISCOVERY_KEYS = {
+    'auth_endpoint': 'authorization_endpoint',
+    'token_endpoint': 'token_endpoint',
+    'revoke_endpoint': 'revocation_endpoint',
+    'issuer_uri': 'issuer',
+    'jwks_uri': 'jwks_uri',
+    'user_info_url': 'userinfo_endpoint',
+}
+
+
+class Endpoints(namedtuple('Endpoints', ENDPOINT_FIELDS + ('version',))):
+    """Immutable set of endpoint URLs with the configuration version it belongs to
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_discovery_doc(cls, discovery_doc, version=1):
+        """Creates Endpoints from a discovery doc
+
+        :param discovery_doc: Discovery doc dict
+        :param version: Configuration version, defaults to 1
+        :return: Endpoints
+        """
+
+        return cls(version=version, **dict((field, discovery_doc[key]) for field, key in DISCOVERY_KEYS.items()))
+
+    @classmethod
+    def from_dict(cls, data, version=1):
+        """Creates Endpoints from a dict keyed by discovery doc keys or by `Endpoints` field names
+
+        :param data: dict of endpoint URLs
+        :param version: Configuration version, defaults to 1
+        :raises KeyError: if an endpoint is missing
+        :return: Endpoints
+        """
+
+        if 'token_endpoint' in data and 'auth_endpoint' in data:
+            return cls(version=version, **dict((field, data[field]) for field in ENDPOINT_FIELDS))
+        return cls.from_discovery_doc(data, version=version)
+
+    def to_discovery_doc(self):
+        """Converts to discovery doc keys, the format written to and read from pinned endpoint files
+
+        :return: dict
+        """
+
+        return dict((key, getattr(self, field)) for field, key in DISCOVERY_KEYS.items())
+
+    def same_urls(self, other):
+        """Checks if other has the same URLs, ignoring version
+
+        :param other: Endpoints
+        :return: True/False
+        """
+
+        return self[:-1] == other[:-1]
+
+
+class EndpointConfig(object):
+    """Endpoint configuration referenced by clients instead of copied into them
+
+    The current `Endpoints` are replaced as a whole, so every client sharing the config sees new URLs
+    on its next call without being rebuilt.
+    """
+
+    def __init__(self, environment, endpoints=None, session=None, codec=None, transport=None):
+        """Constructor for EndpointConfig
+
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param endpoints: `Endpoints` or discovery doc dict to start with, defaults to None (fetched)
+        :param session: `requests.Session` used to fetch the discovery doc, defaults to None
+        :param codec: JSON codec instance or name, defaults to None (library default)
+        :param transport: `intuitlib.transport.Transport` used to fetch the discovery doc, defaults to None
+        """
+
+        self.environment = environment
+        self.session = session
+        self.codec = codec
+        self.transport = transport
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = None
+        self._refresh_pending = False
+
+        if endpoints is None:
+            endpoints = self._fetch()
+        if not isinstance(endpoints, Endpoints):
+            endpoints = Endpoints.from_dict(endpoints)
+        self._endpoints = endpoints
+
+    @classmethod
+    def pinned(cls, environment, source=None, lazy_refresh=False, session=None, codec=None, transport=None):
+        """Creates config from pinned endpoint values without any network I/O
+
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param source: dict of endpoint URLs, path to a JSON file with them, or None for the built-in values of environment
+        :param lazy_refresh: Fetch the discovery doc on a background thread the first time endpoints are read, defaults to False
+        :param session: `requests.Session` used for refreshes, defaults to None
+        :param codec: JSON codec instance or name, defaults to None (library default)
+        :param transport: `intuitlib.transport.Transport` used for refreshes, defaults to None
+        :raises ValueError: if source is None and environment has no built-in values
+        :return: `EndpointConfig`
+        """
+
+        if source is None:
+            endpoints = _known_endpoints(environment)
+        elif isinstance(source, (dict, Endpoints)):
+            endpoints = source
+        else:
+            with open(source) as fp:
+                endpoints = json.load(fp)
+
+        config = cls(environment, endpoints, session=session, codec=codec, transport=transport)
+        config._refresh_pending = lazy_refresh
+        return config
+
+    @property
+    def endpoints(self):
+        """Current endpoints, read without locking
+
+        :return: `Endpoints`
+        """
+
+        endpoints = self._endpoints
+        if self._refresh_pending:
+            self._refresh_pending = False
+            self.refresh_in_background()
+        return endpoints
+
+    def save(self, path):
+        """Writes current endpoints to a JSON file that `pinned` can load
+
+        :param path: File path
+        """
+
+        with open(path, 'w') as fp:
+            json.dump(self._endpoints.to_discovery_doc(), fp, indent=2, sort_keys=True)
+
+    @property
+    def version(self):
+        return self._endpoints.version
+
+    def update(self, **values):
+        """Replaces endpoints with the current ones updated with values, bumping the version
+
+        :param values: `Endpoints` field values
+        :return: New `Endpoints`
+        """
+
+        with self._lock:
+            self._endpoints = self._endpoints._replace(version=self._endpoints.version + 1, **values)
+            return self._endpoints
+
+    def refresh(self):
+        """Fetches the discovery doc and swaps in its endpoints if they changed
+
+        :raises `intuitlib.exceptions.AuthClientError`: if response status != 200
+        :return: True if endpoints changed
+        """
+
+        fetched = self._fetch()
+        with self._lock:
+            if fetched.same_urls(self._endpoints):
+                return False
+            self._endpoints = fetched._replace(version=self._endpoints.version + 1)
+            return True
+
+    def refresh_in_background(self):
+        """Runs `refresh` once on a daemon thread, an error keeps the current endpoints and is stored in `last_error`
+
+        :return: `threading.Thread`
+        """
+
+        thread = threading.Thread(target=self._refresh_quietly, name='intuitlib-endpoint-refresh')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def copy(self):
+        """Creates an independent config with the current endpoints
+
+        :return: `EndpointConfig`
+        """
+
+        return EndpointConfig(self.environment, self._endpoints, session=self.session, codec=self.codec, transport=self.transport)
+
+    def start_auto_refresh(self, interval=3600):
+        """Refreshes endpoints every interval seconds on a daemon thread, errors keep the current endpoints and are stored in `last_error`
+
+        :param interval: Seconds between refreshes, defaults to 3600
+        :return: `threading.Thread`
+        """
+
+        self.stop_auto_refresh()
+        stop = self._stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self._refresh_quietly()
+
+        thread = threading.Thread(target=run, name='intuitlib-endpoint-refresh')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop_auto_refresh(self):
+        """Stops the auto refresh thread if running
+        """
+
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+
+    def _fetch(self):
+        discovery_doc = get_discovery_doc(self.environment, session=self.session, codec=self.codec, transport=self.transport)
+        return Endpoints.from_discovery_doc(discovery_doc)
+
+
+def _known_endpoints(environment):
+    url = get_discovery_url(environment)
+    for name, discovery_url in DISCOVERY_URL.items():
+        if url == discovery_url:
+            return KNOWN_ENDPOINTS[name]
+    raise ValueError('No built-in endpoints for environment {0}, pass source'.format(environment))
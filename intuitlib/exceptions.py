@@ -33,3 +33,39 @@ class AuthClientError(Exception):
         self.timestamp = response.headers.get('Date', None) 
 
         Exception.__init__(self, 'HTTP status {0}, error message: {1}, intuit_tid {2} at time {3}'.format(self.status_code, self.content, self.intuit_tid, self.timestamp)) 
+
+
+class RateLimitExceededError(Exception):
+    """Raised when a call is not allowed by the client-side rate limiter and the caller chose not to wait
+    """
+
+    def __init__(self, endpoint, retry_after):
+        """Constructor for RateLimitExceededError
+
+        :param endpoint: Rate limited endpoint name
+        :param retry_after: Seconds until the call would be allowed
+        """
+
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+        Exception.__init__(self, 'Rate limit exceeded for {0} endpoint, retry after {1:.3f}s'.format(endpoint, retry_after))
+
+
+class DeadRefreshTokenError(Exception):
+    """Raised without calling the token endpoint when the refresh token recently failed with a non-retryable grant error
+    """
+
+    def __init__(self, realm_id, error, retry_after):
+        """Constructor for DeadRefreshTokenError
+
+        :param realm_id: QBO Realm/Company ID, may be None
+        :param error: OAuth error code of the failed refresh, e.g. invalid_grant
+        :param retry_after: Seconds until the refresh token is tried again
+        """
+
+        self.realm_id = realm_id
+        self.error = error
+        self.retry_after = retry_after
+
+        Exception.__init__(self, 'Refresh token for realm {0} failed with {1}, not retried for {2:.3f}s'.format(realm_id, error, retry_after))
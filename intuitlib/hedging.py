@@ -0,0 +1,192 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""This module contains a transport hedging slow idempotent requests
+
+If a GET has not answered within a percentile of the recent latencies of its URL, one backup request is sent
+and whichever answers first is returned. In this library only the discovery doc, JWKS and userinfo calls are
+GETs, token exchange, refresh, revoke and migration are POSTs and are never hedged.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from intuitlib.transport import Transport, RequestsTransport
+
+
+class HedgingTransport(Transport):
+    """Transport wrapper sending a backup request when an idempotent request is slow, within a hedging budget
+
+    A request still running when the other one answered cannot be interrupted, its response is discarded. Primary
+    and backup requests run on separate thread pools, so primaries never queue behind backups. The hedging delay
+    counts from the moment a primary is sent, and every primary's latency is recorded when it completes, also when
+    a backup answered first.
+    """
+
+    def __init__(self, transport=None, percentile=95, initial_delay=0.1, min_delay=0.01, max_delay=2.0, window=100,
+            budget=0.05, burst=5, methods=('GET', 'HEAD'), max_workers=8, max_primary_workers=32):
+        """Constructor for HedgingTransport
+
+        :param transport: `intuitlib.transport.Transport` requests are sent with, defaults to None (`RequestsTransport`)
+        :param percentile: Latency percentile of a URL after which a backup request is sent, defaults to 95
+        :param initial_delay: Hedging delay in seconds until a URL has 10 latency samples, defaults to 0.1
+        :param min_delay: Lowest hedging delay in seconds, defaults to 0.01
+        :param max_delay: Highest hedging delay in seconds, defaults to 2.0
+        :param window: Number of latency samples kept per URL, defaults to 100
+        :param budget: Backup requests allowed per request, defaults to 0.05 (one in twenty)
+        :param burst: Backup requests that can be saved up, defaults to 5
+        :param methods: Idempotent HTTP methods that are hedged, defaults to ('GET', 'HEAD')
+        :param max_workers: Threads sending backup requests, defaults to 8
+        :param max_primary_workers: Threads sending primary requests that may be hedged, defaults to 32
+        """
+
+        self.transport = transport if transport is not None else RequestsTransport()
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.budget = budget
+        self.burst = burst
+        self.methods = frozenset(method.upper() for method in methods)
+        self.max_workers = max_workers
+        self.max_primary_workers = max_primary_workers
+
+        self.requests = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self.budget_exhausted = 0
+        self._credit = float(burst)
+        self._latencies = {}
+        self._executor = None
+        self._primary_executor = None
+        self._lock = threading.Lock()
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        if method.upper() not in self.methods:
+            return self.transport.request(method, url, headers=headers, data=data, auth=auth)
+
+        with self._lock:
+            self.requests += 1
+            self._credit = min(float(self.burst), self._credit + self.budget)
+            can_hedge = self._credit >= 1
+            if can_hedge and self._primary_executor is None:
+                self._primary_executor = ThreadPoolExecutor(max_workers=self.max_primary_workers)
+            primary_executor = self._primary_executor
+
+        delay = self.get_delay(url)
+        if not can_hedge:
+            # no backup can be afforded, so the primary runs on the caller thread
+            started = time.monotonic()
+            response = self._primary(None, method, url, headers, data, auth)
+            if time.monotonic() - started > delay:
+                with self._lock:
+                    self.budget_exhausted += 1
+            return response
+
+        sent = threading.Event()
+        primary = primary_executor.submit(self._primary, sent, method, url, headers, data, auth)
+        # time spent queued for a primary worker does not count towards the hedging delay
+        sent.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_credit():
+            return primary.result()
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            executor = self._executor
+        backup = executor.submit(self.transport.request, method, url, headers=headers, data=data, auth=auth)
+        pending = [primary, backup]
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is backup:
+                        with self._lock:
+                            self.backup_wins += 1
+                    return future.result()
+                if error is None or future is primary:
+                    error = future.exception()
+        raise error
+
+    def get_delay(self, url):
+        """Gets the time after which a request to url is hedged
+
+        :param url: request URL
+        :return: Delay in seconds
+        """
+
+        with self._lock:
+            latencies = sorted(self._latencies.get(url, ()))
+        if len(latencies) < 10:
+            return self.initial_delay
+        delay = latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))]
+        return min(self.max_delay, max(self.min_delay, delay))
+
+    def stats(self):
+        """Gets hedging statistics
+
+        :return: dict with hedgeable requests, backup requests sent, backup requests that answered first and hedges skipped for budget
+        """
+
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'backup_wins': self.backup_wins,
+                'budget_exhausted': self.budget_exhausted,
+            }
+
+    def close(self):
+        with self._lock:
+            executors = [self._executor, self._primary_executor]
+            self._executor = self._primary_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.transport.close()
+
+    def _primary(self, sent, method, url, headers, data, auth):
+        """Sends the primary request and records its latency, whether or not a backup answered first
+        """
+
+        if sent is not None:
+            sent.set()
+        started = time.monotonic()
+        response = self.transport.request(method, url, headers=headers, data=data, auth=auth)
+        self._record(url, time.monotonic() - started)
+        return response
+
+    def _take_credit(self):
+        with self._lock:
+            if self._credit < 1:
+                self.budget_exhausted += 1
+                return False
+            self._credit -= 1
+            self.hedged += 1
+            return True
+
+    def _record(self, url, latency):
+        with self._lock:
+            latencies = self._latencies.get(url)
+            if latencies is None:
+                latencies = self._latencies[url] = deque(maxlen=self.window)
+            latencies.append(latency)
@@ -0,0 +1,145 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains the JSON codecs used to encode request bodies and decode API responses
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONCodec(object):
+    """Codec backed by the standard library `json` module
+    """
+
+    name = 'json'
+
+    def dumps(self, obj):
+        """Serializes object to JSON
+
+        :param obj: Object to serialize
+        :return: JSON string
+        """
+
+        return json.dumps(obj)
+
+    def loads(self, data):
+        """Deserializes JSON
+
+        :param data: JSON document as str or bytes
+        :return: Deserialized object
+        """
+
+        return json.loads(data)
+
+    def response_json(self, response):
+        """Deserializes the body of an API response
+
+        :param response: API response
+        :type response: `requests` object
+        :return: Deserialized object
+        """
+
+        return response.json()
+
+
+class OrjsonCodec(JSONCodec):
+    """Codec backed by `orjson`, decodes response bytes directly
+    """
+
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def response_json(self, response):
+        return orjson.loads(response.content)
+
+
+class UjsonCodec(JSONCodec):
+    """Codec backed by `ujson`, decodes response bytes directly
+    """
+
+    name = 'ujson'
+
+    def dumps(self, obj):
+        return ujson.dumps(obj)
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def response_json(self, response):
+        return ujson.loads(response.content)
+
+
+_CODECS = {
+    'json': (JSONCodec, True),
+    'orjson': (OrjsonCodec, orjson is not None),
+    'ujson': (UjsonCodec, ujson is not None),
+}
+
+# fastest first, 'auto' picks the first one installed
+_PREFERENCE = ['orjson', 'ujson', 'json']
+
+_default_codec = JSONCodec()
+
+
+def get_codec(codec=None):
+    """Resolves codec name or instance to a codec instance
+
+    :param codec: Codec instance or name, accepted values: 'json', 'orjson', 'ujson', 'auto', defaults to None (library default)
+    :raises ValueError: if codec name is unknown
+    :raises ImportError: if the library backing the codec is not installed
+    :return: Codec instance
+    """
+
+    if codec is None:
+        return _default_codec
+    if not isinstance(codec, str):
+        return codec
+
+    name = codec.lower()
+    if name == 'auto':
+        name = next(n for n in _PREFERENCE if _CODECS[n][1])
+    if name not in _CODECS:
+        raise ValueError('Unknown JSON codec {0}, accepted values: {1}'.format(codec, ', '.join(sorted(_CODECS) + ['auto'])))
+
+    codec_class, available = _CODECS[name]
+    if not available:
+        raise ImportError('JSON codec {0} requires the {0} package to be installed'.format(name))
+    return codec_class()
+
+
+def set_default_codec(codec):
+    """Sets library wide codec used by clients that do not specify one
+
+    :param codec: Codec instance or name, accepted values: 'json', 'orjson', 'ujson', 'auto'
+    :return: Codec instance now in use
+    """
+
+    global _default_codec
+    _default_codec = get_codec(codec or 'json')
+    return _default_codec
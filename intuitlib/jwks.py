@@ -0,0 +1,100 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a cache for the JSON Web Key Sets used to validate ID tokens
+"""
+
+import threading
+import time
+
+import jwt
+
+
+class JWKCache(object):
+    """Thread-safe cache of JWK sets keyed by JWK URI, can be shared between clients
+    """
+
+    def __init__(self, ttl=3600, min_refetch_interval=60):
+        """Constructor for JWKCache
+
+        :param ttl: Seconds a fetched key set is used before it is fetched again, defaults to 3600
+        :param min_refetch_interval: Minimum seconds between fetches triggered by an unknown kid (key rotation), defaults to 60
+        """
+
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._key_sets = {}
+        self._lock = threading.Lock()
+
+    def get(self, kid, jwk_uri, fetch):
+        """Gets JWK for kid, fetching the key set if it is not cached, expired or does not contain kid
+
+        :param kid: KID
+        :param jwk_uri: JWK URI
+        :param fetch: callable taking jwk_uri and returning the JWKS document as dict
+        :raises KeyError: if kid is not in the key set
+        :return: `jwt.PyJWK` for kid
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._key_sets.get(jwk_uri)
+            if entry is not None:
+                key_set, fetched_at = entry
+                if now - fetched_at < self.ttl and _contains(key_set, kid):
+                    self.hits += 1
+                    return key_set[kid]
+                # unknown kid is refetched only once per interval so bad tokens cannot flood the endpoint
+                if now - fetched_at < self.min_refetch_interval:
+                    self.misses += 1
+                    return key_set[kid]
+            self.misses += 1
+
+        key_set = jwt.PyJWKSet.from_dict(fetch(jwk_uri))
+        with self._lock:
+            self.fetches += 1
+            self._key_sets[jwk_uri] = (key_set, time.monotonic())
+        return key_set[kid]
+
+    def clear(self):
+        """Removes all cached key sets
+        """
+
+        with self._lock:
+            self._key_sets.clear()
+
+    def stats(self):
+        """Gets cache statistics
+
+        :return: dict with hits, misses, fetches and number of cached key sets
+        """
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'fetches': self.fetches,
+                'key_sets': len(self._key_sets),
+            }
+
+
+def _contains(key_set, kid):
+    try:
+        key_set[kid]
+        return True
+    except KeyError:
+        return False
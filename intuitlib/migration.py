@@ -15,7 +15,6 @@
 """This module helps in migrating OAuth 1.0a tokens to OAuth 2.0
 """
 
-import json
 from requests_oauthlib import OAuth1
 
 from intuitlib.utils import (
@@ -35,6 +34,7 @@ def migrate(consumer_key, consumer_secret, access_token, access_secret, auth_cli
     :type auth_client: `intuitlib.client.AuthClient`
     :param scopes: list of `intuitlib.enum.Scopes`
     :raises AuthClientError: if response status != 200
+    :raises `intuitlib.exceptions.RateLimitExceededError`: if the client rate limiter does not allow the call
     """
 
     if auth_client.environment.lower() == 'production':
@@ -55,4 +55,7 @@ def migrate(consumer_key, consumer_secret, access_token, access_secret, auth_cli
         'client_secret': auth_client.client_secret
     }
     
-    send_request('POST', migration_url, headers, auth_client, body=json.dumps(body), oauth1_header=auth_header)
+    codec = auth_client.codec
+    send_request('POST', migration_url, headers, auth_client, body=codec.dumps(body), oauth1_header=auth_header, codec=codec,
+        rate_limiter=auth_client.rate_limiter, endpoint='migration', transport=auth_client.transport,
+        concurrency_limiter=auth_client.concurrency_limiter, call_logger=auth_client.call_logger)
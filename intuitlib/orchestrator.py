@@ -0,0 +1,511 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""This module contains an orchestrator refreshing tokens of many realms in a pool of worker processes
+
+Realms are partitioned across workers by consistent hashing, so every realm is owned and refreshed by
+exactly one worker, and adding or removing a worker only moves the realms of the affected ring segments.
+Each worker keeps its own clients, connection pool and refresh schedule.
+"""
+
+import bisect
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from intuitlib.client import AuthClient
+from intuitlib.deadtokens import DeadTokenCache
+from intuitlib.endpoints import EndpointConfig
+from intuitlib.exceptions import AuthClientError
+from intuitlib.tokens import TokenSet
+
+
+class HashRing(object):
+    """Consistent hash ring mapping keys to nodes, each node is placed at `replicas` points
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        """Constructor for HashRing
+
+        :param nodes: Initial node names
+        :param replicas: Points per node, more points spread keys more evenly, defaults to 100
+        """
+
+        self.replicas = replicas
+        self._points = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted(set(self._nodes.values()))
+
+    def add(self, node):
+        """Adds node, it takes over keys from its neighbours only
+
+        :param node: Node name
+        """
+
+        for i in range(self.replicas):
+            point = _hash('{0}#{1}'.format(node, i))
+            if point not in self._nodes:
+                bisect.insort(self._points, point)
+                self._nodes[point] = node
+
+    def remove(self, node):
+        """Removes node, its keys move to the following nodes on the ring
+
+        :param node: Node name
+        """
+
+        for i in range(self.replicas):
+            point = _hash('{0}#{1}'.format(node, i))
+            if self._nodes.get(point) == node:
+                del self._nodes[point]
+                del self._points[bisect.bisect_left(self._points, point)]
+
+    def get(self, key):
+        """Gets node owning key
+
+        :param key: Key, e.g. realm ID
+        :return: Node name or None if the ring is empty
+        """
+
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[self._points[index]]
+
+
+# settings passed to every worker process
+_WorkerSettings = namedtuple('_WorkerSettings', [
+    'client_id', 'client_secret', 'redirect_uri', 'environment', 'endpoints',
+    'threads', 'leeway', 'retry_interval', 'dead_token_ttl', 'transport_factory',
+])
+
+
+class _Worker(object):
+    """Parent side handle of a worker process
+    """
+
+    def __init__(self, name, process, commands):
+        self.name = name
+        self.process = process
+        self.commands = commands
+        self.stopping = False
+        self.refreshed = 0
+        self.failed = 0
+
+
+class RefreshOrchestrator(object):
+    """Refreshes tokens of realms before they expire, spread across worker processes by consistent hashing
+
+    Every refresh result is reported to `on_result(realm_id, tokens, error)` from a background thread of
+    this process, so callers can persist rotated refresh tokens.
+    """
+
+    def __init__(self, client_id, client_secret, redirect_uri, environment, workers=4, threads=4, leeway=300, retry_interval=60,
+            dead_token_ttl=3600, endpoint_config=None, transport_factory=None, on_result=None, replicas=100, mp_context=None):
+        """Constructor for RefreshOrchestrator
+
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param workers: Number of worker processes started by `start`, defaults to 4
+        :param threads: Refreshes in flight per worker, defaults to 4
+        :param leeway: Seconds before access token expiry a realm is refreshed, defaults to 300
+        :param retry_interval: Seconds before a failed refresh is retried, defaults to 60
+        :param dead_token_ttl: Seconds a refresh token failing with invalid_grant is not retried, defaults to 3600
+        :param endpoint_config: `intuitlib.endpoints.EndpointConfig` whose endpoints are given to workers, defaults to None (fetched once here)
+        :param transport_factory: picklable callable returning the `intuitlib.transport.Transport` of a worker, defaults to None (`requests`)
+        :param on_result: callable taking realm_id, `intuitlib.tokens.TokenSet` or None and error message or None, defaults to None
+        :param replicas: Hash ring points per worker, defaults to 100
+        :param mp_context: `multiprocessing` context used to start workers, defaults to None (default context)
+        """
+
+        if endpoint_config is None:
+            endpoint_config = EndpointConfig(environment)
+        self._settings = _WorkerSettings(client_id, client_secret, redirect_uri, environment, endpoint_config.endpoints,
+            threads, leeway, retry_interval, dead_token_ttl, transport_factory)
+        self.initial_workers = workers
+        self.on_result = on_result
+        self.moved = 0
+        self._context = mp_context or multiprocessing.get_context()
+        self._ring = HashRing(replicas=replicas)
+        self._workers = {}
+        self._owners = {}
+        self._moving = {}
+        self._tokens = {}
+        self._names = itertools.count()
+        self._results = None
+        self._collector = None
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts worker processes and the result collector thread
+
+        :return: self
+        """
+
+        self._results = self._context.Queue()
+        self._stopped.clear()
+        self._collector = threading.Thread(target=self._collect, name='intuitlib-orchestrator')
+        self._collector.daemon = True
+        self._collector.start()
+        for _ in range(self.initial_workers):
+            self.add_worker()
+        return self
+
+    def stop(self, timeout=10):
+        """Stops every worker and the collector thread, realms are kept and resumed by `start`
+
+        :param timeout: Seconds to wait for workers to exit, defaults to 10
+        """
+
+        with self._lock:
+            names = list(self._workers)
+        for name in names:
+            self.remove_worker(name)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._workers:
+                    break
+            time.sleep(0.01)
+        with self._lock:
+            for worker in self._workers.values():
+                worker.process.terminate()
+            self._workers.clear()
+            # realms of terminated workers resume from the tokens last reported by them, as in `_reap`
+            for realm_id in self._owners:
+                self._owners[realm_id] = None
+            self._moving.clear()
+        self._stopped.set()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_worker(self, name=None):
+        """Starts a worker process and moves the realms it owns on the ring to it
+
+        :param name: Worker name, defaults to None (generated)
+        :return: Worker name
+        """
+
+        with self._lock:
+            if name is None:
+                name = 'worker-{0}'.format(next(self._names))
+            commands = self._context.Queue()
+            process = self._context.Process(target=_run_worker, args=(name, self._settings, commands, self._results),
+                name='intuitlib-{0}'.format(name))
+            process.daemon = True
+            process.start()
+            self._workers[name] = _Worker(name, process, commands)
+            self._ring.add(name)
+            self._rebalance()
+        return name
+
+    def remove_worker(self, name):
+        """Stops a worker, its realms move to the following workers on the ring once it released them
+
+        :param name: Worker name
+        """
+
+        with self._lock:
+            worker = self._workers.get(name)
+            if worker is None or worker.stopping:
+                return
+            worker.stopping = True
+            self._ring.remove(name)
+            worker.commands.put(('stop',))
+
+    def add_realm(self, realm_id, refresh_token, access_token=None, expires_in=None, issued_at=None):
+        """Adds realm, it is refreshed right away if the access token expiry is unknown
+
+        :param realm_id: QBO Realm/Company ID
+        :param refresh_token: Refresh Token
+        :param access_token: Access Token, defaults to None
+        :param expires_in: Access token lifetime in seconds, defaults to None
+        :param issued_at: Unix time the tokens were issued at, defaults to None
+        """
+
+        tokens = TokenSet(access_token=access_token, refresh_token=refresh_token, expires_in=expires_in, realm_id=realm_id, issued_at=issued_at)
+        with self._lock:
+            previous = self._owners.get(realm_id)
+            if previous is not None:
+                self._workers[previous].commands.put(('remove', realm_id))
+            # a release still in flight for the old tokens is ignored
+            self._moving.pop(realm_id, None)
+            self._tokens[realm_id] = tokens
+            self._assign(realm_id)
+
+    def remove_realm(self, realm_id):
+        """Stops refreshing realm
+
+        :param realm_id: QBO Realm/Company ID
+        """
+
+        with self._lock:
+            if realm_id not in self._tokens:
+                return
+            owner = self._owners.pop(realm_id, None)
+            self._moving.pop(realm_id, None)
+            del self._tokens[realm_id]
+            if owner is not None:
+                self._workers[owner].commands.put(('remove', realm_id))
+
+    def owner(self, realm_id):
+        """Gets the worker refreshing realm
+
+        :param realm_id: QBO Realm/Company ID
+        :return: Worker name or None if realm is unknown or moving between workers
+        """
+
+        with self._lock:
+            return self._owners.get(realm_id)
+
+    def get_tokens(self, realm_id):
+        """Gets the latest tokens reported for realm
+
+        :param realm_id: QBO Realm/Company ID
+        :return: `intuitlib.tokens.TokenSet` or None
+        """
+
+        with self._lock:
+            return self._tokens.get(realm_id)
+
+    def stats(self):
+        """Gets orchestrator statistics
+
+        :return: dict with realm and move counts and per worker realm, refresh and failure counts
+        """
+
+        with self._lock:
+            owned = {}
+            for owner in self._owners.values():
+                owned[owner] = owned.get(owner, 0) + 1
+            return {
+                'realms': len(self._tokens),
+                'moved': self.moved,
+                'workers': dict(
+                    (name, {'realms': owned.get(name, 0), 'refreshed': worker.refreshed, 'failed': worker.failed})
+                    for name, worker in self._workers.items()
+                ),
+            }
+
+    def _assign(self, realm_id):
+        """Hands realm to its owner on the ring, caller holds the lock
+        """
+
+        owner = self._ring.get(realm_id)
+        self._owners[realm_id] = owner
+        if owner is not None:
+            self._workers[owner].commands.put(('add', self._tokens[realm_id]))
+
+    def _rebalance(self):
+        """Asks current owners to release realms that hash to another worker now, caller holds the lock
+        """
+
+        for realm_id, owner in list(self._owners.items()):
+            if owner is not None and owner not in self._workers:
+                # owner or releasing worker is gone without releasing the realm, it is handed out again
+                owner = self._owners[realm_id] = None
+            if realm_id in self._moving and self._moving[realm_id] not in self._workers:
+                del self._moving[realm_id]
+            target = self._ring.get(realm_id)
+            if owner == target:
+                continue
+            if owner is None and realm_id not in self._moving:
+                self._assign(realm_id)
+            elif not self._workers[owner].stopping:
+                # released tokens are handed over by the collector, so no two workers refresh the realm
+                self._owners[realm_id] = None
+                self._moving[realm_id] = owner
+                self._workers[owner].commands.put(('release', realm_id))
+
+    def _collect(self):
+        while not self._stopped.is_set():
+            try:
+                message = self._results.get(timeout=0.2)
+            except queue.Empty:
+                self._reap()
+                continue
+            self._handle(message)
+
+    def _handle(self, message):
+        kind, name = message[:2]
+        callback = None
+        with self._lock:
+            worker = self._workers.get(name)
+            if kind == 'refreshed':
+                realm_id, tokens = message[2:]
+                if worker is not None:
+                    worker.refreshed += 1
+                if realm_id in self._tokens:
+                    self._tokens[realm_id] = tokens
+                callback = (realm_id, tokens, None)
+            elif kind == 'failed':
+                realm_id, error = message[2:]
+                if worker is not None:
+                    worker.failed += 1
+                callback = (realm_id, None, error)
+            elif kind == 'released':
+                realm_id, tokens = message[2:]
+                if self._moving.get(realm_id) == name or self._owners.get(realm_id) == name:
+                    self._moving.pop(realm_id, None)
+                    self._tokens[realm_id] = tokens
+                    self.moved += 1
+                    self._assign(realm_id)
+            elif kind == 'stopped':
+                if worker is not None:
+                    worker.process.join()
+                    del self._workers[name]
+        if callback is not None and self.on_result is not None:
+            self.on_result(*callback)
+
+    def _reap(self):
+        """Reassigns realms of worker processes that died, from the tokens last reported by them
+        """
+
+        with self._lock:
+            for name, worker in list(self._workers.items()):
+                if worker.process.is_alive():
+                    continue
+                del self._workers[name]
+                self._ring.remove(name)
+                for realm_id, owner in list(self._owners.items()):
+                    if owner == name or self._moving.get(realm_id) == name:
+                        self._moving.pop(realm_id, None)
+                        self._assign(realm_id)
+                self._rebalance()
+
+
+def _run_worker(name, settings, commands, results):
+    """Main loop of a worker process: applies commands and refreshes realms when they are due
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=settings.threads)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    transport = settings.transport_factory() if settings.transport_factory is not None else None
+    endpoint_config = EndpointConfig(settings.environment, settings.endpoints, session=session, transport=transport)
+    dead_token_cache = DeadTokenCache(ttl=settings.dead_token_ttl)
+    executor = ThreadPoolExecutor(max_workers=settings.threads)
+
+    clients = {}
+    due_at = {}
+    schedule = []
+
+    def reschedule(realm_id, due):
+        due_at[realm_id] = due
+        heapq.heappush(schedule, (due, realm_id))
+
+    def add(tokens):
+        client = AuthClient(settings.client_id, settings.client_secret, settings.redirect_uri, settings.environment,
+            realm_id=tokens.realm_id, session=session, endpoint_config=endpoint_config, transport=transport,
+            dead_token_cache=dead_token_cache)
+        client.update_tokens(**tokens._asdict())
+        clients[tokens.realm_id] = client
+        reschedule(tokens.realm_id, _due(tokens, settings.leeway))
+
+    def refresh(realm_id):
+        client = clients[realm_id]
+        try:
+            client.refresh()
+        except AuthClientError as e:
+            error = 'HTTP status {0}: {1}'.format(e.status_code, e.content)
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+        else:
+            return realm_id, client.tokens, None
+        return realm_id, None, error
+
+    stopping = False
+    while not stopping:
+        timeout = 1.0
+        if schedule:
+            timeout = min(timeout, max(schedule[0][0] - time.time(), 0))
+        try:
+            command = commands.get(timeout=timeout)
+        except queue.Empty:
+            command = None
+        while command is not None:
+            if command[0] == 'add':
+                add(command[1])
+            elif command[0] in ('remove', 'release'):
+                client = clients.pop(command[1], None)
+                due_at.pop(command[1], None)
+                if client is not None and command[0] == 'release':
+                    results.put(('released', name, command[1], client.tokens))
+            elif command[0] == 'stop':
+                stopping = True
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                command = None
+
+        now = time.time()
+        due = []
+        while schedule and schedule[0][0] <= now:
+            when, realm_id = heapq.heappop(schedule)
+            if due_at.get(realm_id) == when:
+                due.append(realm_id)
+        for realm_id, tokens, error in executor.map(refresh, due):
+            if error is None:
+                results.put(('refreshed', name, realm_id, tokens))
+                reschedule(realm_id, _due(tokens, settings.leeway))
+            else:
+                results.put(('failed', name, realm_id, error))
+                reschedule(realm_id, now + settings.retry_interval)
+
+    for realm_id, client in clients.items():
+        results.put(('released', name, realm_id, client.tokens))
+    results.put(('stopped', name))
+    executor.shutdown()
+    session.close()
+
+
+def _due(tokens, leeway):
+    expires_at = tokens.access_token_expires_at
+    if tokens.access_token is None or expires_at is None:
+        return time.time()
+    return expires_at - leeway
+
+
+def _hash(key):
+    return int(hashlib.md5(str(key).encode('utf-8')).hexdigest()[:16], 16)
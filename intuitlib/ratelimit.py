@@ -0,0 +1,152 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a client-side token bucket rate limiter for Intuit OAuth endpoints
+
+Endpoint names used by this library: 'token', 'revoke', 'userinfo', 'migration'
+"""
+
+import threading
+import time
+
+from intuitlib.exceptions import RateLimitExceededError
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket allowing `rate` calls per second with bursts of up to `burst` calls
+    """
+
+    def __init__(self, rate, burst=None):
+        """Constructor for TokenBucket
+
+        :param rate: Tokens added per second
+        :param burst: Bucket capacity, defaults to None (max of rate and 1)
+        :raises ValueError: if rate is not positive or burst is less than 1
+        """
+
+        if rate <= 0:
+            raise ValueError('Rate should be greater than 0')
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        # a bucket smaller than one call would never fill up enough to allow it
+        if self.burst < 1:
+            raise ValueError('Burst should be at least 1')
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens=1):
+        """Takes tokens if available without waiting
+
+        :param tokens: Number of tokens to take, defaults to 1
+        :return: 0 if tokens were taken, else seconds until they would be available
+        :raises ValueError: if tokens is more than the bucket holds
+        """
+
+        if tokens > self.burst:
+            raise ValueError('Cannot take {0} tokens from a bucket of {1}'.format(tokens, self.burst))
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, block=True, timeout=None):
+        """Takes tokens, waiting for them if block is True
+
+        :param tokens: Number of tokens to take, defaults to 1
+        :param block: Wait until tokens are available, defaults to True
+        :param timeout: Maximum seconds to wait, defaults to None (no limit)
+        :return: 0 if tokens were taken, else seconds until they would be available
+        :raises ValueError: if tokens is more than the bucket holds
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0 or not block:
+                return wait
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return wait
+            time.sleep(wait)
+
+
+class RateLimiter(object):
+    """Per endpoint rate limiter, attached to `intuitlib.client.AuthClient` through its `rate_limiter` argument
+    """
+
+    def __init__(self, limits=None, default=None, block=True, timeout=None):
+        """Constructor for RateLimiter
+
+        :param limits: dict of endpoint name to (rate, burst) tuple, defaults to None
+        :param default: (rate, burst) tuple for endpoints not in limits, defaults to None (not limited)
+        :param block: Wait for the bucket instead of failing fast, defaults to True
+        :param timeout: Maximum seconds to wait when blocking, defaults to None (no limit)
+        """
+
+        self.default = default
+        self.block = block
+        self.timeout = timeout
+        self._buckets = {}
+        self._lock = threading.Lock()
+        for endpoint, (rate, burst) in (limits or {}).items():
+            self._buckets[endpoint] = TokenBucket(rate, burst)
+
+    def set_limit(self, endpoint, rate, burst=None):
+        """Sets rate and burst for endpoint
+
+        :param endpoint: Endpoint name
+        :param rate: Calls per second
+        :param burst: Bucket capacity, defaults to None (max of rate and 1)
+        """
+
+        with self._lock:
+            self._buckets[endpoint] = TokenBucket(rate, burst)
+
+    def get_bucket(self, endpoint):
+        """Gets bucket for endpoint
+
+        :param endpoint: Endpoint name
+        :return: `TokenBucket` or None if endpoint is not limited
+        """
+
+        bucket = self._buckets.get(endpoint)
+        if bucket is None and self.default is not None:
+            with self._lock:
+                bucket = self._buckets.get(endpoint)
+                if bucket is None:
+                    bucket = self._buckets[endpoint] = TokenBucket(*self.default)
+        return bucket
+
+    def acquire(self, endpoint, block=None, timeout=None):
+        """Takes a token for a call to endpoint
+
+        :param endpoint: Endpoint name
+        :param block: Wait for the bucket, defaults to None (limiter setting)
+        :param timeout: Maximum seconds to wait, defaults to None (limiter setting)
+        :raises `intuitlib.exceptions.RateLimitExceededError`: if token is not available in time
+        """
+
+        bucket = self.get_bucket(endpoint)
+        if bucket is None:
+            return
+        block = self.block if block is None else block
+        timeout = self.timeout if timeout is None else timeout
+        wait = bucket.acquire(block=block, timeout=timeout)
+        if wait:
+            raise RateLimitExceededError(endpoint, wait)
@@ -0,0 +1,262 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module helps running several Intuit apps in one process with shared discovery docs, keys and connection pools
+"""
+
+import threading
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from intuitlib.client import AuthClient
+from intuitlib.endpoints import EndpointConfig
+from intuitlib.jsoncodec import get_codec
+from intuitlib.jwks import JWKCache
+from intuitlib.transport import Transport, RequestsTransport
+from intuitlib.utils import get_discovery_url
+
+App = namedtuple('App', ['name', 'client_id', 'client_secret', 'redirect_uri', 'environment', 'rate_limiter', 'dead_token_cache'])
+
+
+class _CountingTransport(Transport):
+    """Transport wrapper counting the responses of one environment
+    """
+
+    def __init__(self, transport, environment):
+        self.transport = transport
+        self.environment = environment
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        response = self.transport.request(method, url, headers=headers, data=data, auth=auth)
+        self.environment.count(response)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class _Environment(object):
+    """Resources shared by every client of one environment
+    """
+
+    def __init__(self, discovery_url, pool_maxsize, jwk_ttl, transport=None):
+        self.discovery_url = discovery_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # counted around the transport, a registry transport bypasses the session
+        self.transport = _CountingTransport(transport if transport is not None else RequestsTransport(self.session), self)
+        self.jwk_cache = JWKCache(ttl=jwk_ttl)
+        self.endpoint_config = None
+        self.discovery_fetches = 0
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def count(self, response):
+        with self.lock:
+            self.requests += 1
+            if response.status_code != 200:
+                self.errors += 1
+
+
+class ClientRegistry(object):
+    """Hands out `intuitlib.client.AuthClient` objects per (app, realm) that share one endpoint config, JWK cache and connection pool per environment
+    """
+
+    def __init__(self, codec=None, pool_maxsize=10, jwk_ttl=3600, transport=None):
+        """Constructor for ClientRegistry
+
+        :param codec: JSON codec instance or name used by every client, defaults to None (library default)
+        :param pool_maxsize: Maximum connections kept per host in each environment pool, defaults to 10
+        :param jwk_ttl: Seconds a fetched JWK set is cached, defaults to 3600
+        :param transport: `intuitlib.transport.Transport` shared by every client instead of the environment pools, defaults to None
+        """
+
+        self.codec = get_codec(codec)
+        self.pool_maxsize = pool_maxsize
+        self.jwk_ttl = jwk_ttl
+        self.transport = transport
+        self.auto_refresh_interval = None
+        self._apps = {}
+        self._environments = {}
+        self._clients = {}
+        self._lock = threading.RLock()
+
+    def register_app(self, name, client_id, client_secret, redirect_uri, environment, rate_limiter=None, dead_token_cache=None):
+        """Registers app credentials under a name
+
+        :param name: Name used to look up clients for this app
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        :param environment: App Environment, accepted values: 'sandbox','production','prod' or a discovery URL
+        :param rate_limiter: `intuitlib.ratelimit.RateLimiter` shared by every client of this app, defaults to None
+        :param dead_token_cache: `intuitlib.deadtokens.DeadTokenCache` shared by every client of this app, defaults to None
+        :return: `App` tuple
+        """
+
+        app = App(name, client_id, client_secret, redirect_uri, environment, rate_limiter, dead_token_cache)
+        with self._lock:
+            previous = self._apps.get(name)
+            self._apps[name] = app
+            if previous is not None and previous != app:
+                # credentials changed, clients built from the old ones are dropped
+                for key in [key for key in self._clients if key[0] == name]:
+                    del self._clients[key]
+        return app
+
+    def get_client(self, app, realm_id=None, access_token=None, refresh_token=None):
+        """Gets the client for app and realm, creating it on first use
+
+        Clients are cached, so repeated calls for the same (app, realm) return the same object. Tokens passed for a
+        cached client replace its current ones.
+
+        :param app: Name the app was registered with
+        :param realm_id: QBO Realm/Company ID, defaults to None
+        :param access_token: Access Token set on the client, defaults to None (kept)
+        :param refresh_token: Refresh Token set on the client, defaults to None (kept)
+        :raises KeyError: if app is not registered
+        :return: `intuitlib.client.AuthClient`
+        """
+
+        key = (app, realm_id)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    return self._create_client(key, access_token, refresh_token)
+
+        tokens = dict((name, value) for name, value in [('access_token', access_token), ('refresh_token', refresh_token)] if value is not None)
+        if tokens:
+            client.update_tokens(**tokens)
+        return client
+
+    def remove_client(self, app, realm_id=None):
+        """Removes cached client for app and realm
+
+        :param app: Name the app was registered with
+        :param realm_id: QBO Realm/Company ID, defaults to None
+        """
+
+        with self._lock:
+            self._clients.pop((app, realm_id), None)
+
+    def refresh_discovery(self):
+        """Fetches discovery docs again for every environment in use, existing clients use changed endpoints on their next call
+        """
+
+        with self._lock:
+            for environment in self._environments.values():
+                environment.endpoint_config.refresh()
+                environment.discovery_fetches += 1
+
+    def start_auto_refresh(self, interval=3600):
+        """Refreshes endpoints of every environment in use, and of environments added later, on background threads
+
+        :param interval: Seconds between refreshes, defaults to 3600
+        """
+
+        with self._lock:
+            self.auto_refresh_interval = interval
+            for environment in self._environments.values():
+                environment.endpoint_config.start_auto_refresh(interval)
+
+    def stop_auto_refresh(self):
+        """Stops background endpoint refreshes
+        """
+
+        with self._lock:
+            self.auto_refresh_interval = None
+            for environment in self._environments.values():
+                environment.endpoint_config.stop_auto_refresh()
+
+    def stats(self):
+        """Gets statistics aggregated across apps
+
+        :return: dict with per app client counts, per environment request and key cache counters and totals
+        """
+
+        with self._lock:
+            clients = {}
+            for app, _ in self._clients:
+                clients[app] = clients.get(app, 0) + 1
+
+            environments = {}
+            for url, environment in self._environments.items():
+                environments[url] = dict(
+                    environment.jwk_cache.stats(),
+                    apps=sorted(app.name for app in self._apps.values() if get_discovery_url(app.environment) == url),
+                    discovery_fetches=environment.discovery_fetches,
+                    requests=environment.requests,
+                    errors=environment.errors,
+                )
+
+            return {
+                'apps': len(self._apps),
+                'clients': clients,
+                'environments': environments,
+                'total_clients': len(self._clients),
+                'total_requests': sum(env['requests'] for env in environments.values()),
+                'total_errors': sum(env['errors'] for env in environments.values()),
+            }
+
+    def close(self):
+        """Closes the pooled connections of every environment
+        """
+
+        with self._lock:
+            for environment in self._environments.values():
+                environment.endpoint_config.stop_auto_refresh()
+                environment.session.close()
+            self._clients.clear()
+
+    def _create_client(self, key, access_token, refresh_token):
+        app, realm_id = key
+        registered = self._apps[app]
+        environment = self._get_environment(registered.environment)
+        client = AuthClient(
+            registered.client_id,
+            registered.client_secret,
+            registered.redirect_uri,
+            registered.environment,
+            access_token=access_token,
+            refresh_token=refresh_token,
+            realm_id=realm_id,
+            codec=self.codec,
+            session=environment.session,
+            endpoint_config=environment.endpoint_config,
+            jwk_cache=environment.jwk_cache,
+            rate_limiter=registered.rate_limiter,
+            dead_token_cache=registered.dead_token_cache,
+            transport=environment.transport,
+        )
+        self._clients[key] = client
+        return client
+
+    def _get_environment(self, environment_name):
+        url = get_discovery_url(environment_name)
+        environment = self._environments.get(url)
+        if environment is None:
+            environment = _Environment(url, self.pool_maxsize, self.jwk_ttl, self.transport)
+            environment.endpoint_config = EndpointConfig(url, session=environment.session, codec=self.codec, transport=environment.transport)
+            environment.discovery_fetches += 1
+            if self.auto_refresh_interval:
+                environment.endpoint_config.start_auto_refresh(self.auto_refresh_interval)
+            self._environments[url] = environment
+        return environment
@@ -0,0 +1,166 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a bitmask backed set of `intuitlib.enums.Scopes`
+"""
+
+from functools import lru_cache
+
+from intuitlib.enums import Scopes
+
+# one bit per scope, in enum definition order
+SCOPE_BITS = dict((scope, 1 << index) for index, scope in enumerate(Scopes))
+_VALUE_BITS = dict((scope.value, bit) for scope, bit in SCOPE_BITS.items())
+_BIT_SCOPES = [(bit, scope) for scope, bit in SCOPE_BITS.items()]
+ALL_SCOPES_MASK = sum(SCOPE_BITS.values())
+
+_strings = {}
+
+
+@lru_cache(maxsize=4096)
+def _parse(scope_string, strict):
+    mask = 0
+    for value in scope_string.split():
+        bit = _VALUE_BITS.get(value)
+        if bit is None:
+            if strict:
+                raise ValueError('Unknown scope {0}'.format(value))
+            continue
+        mask |= bit
+    return mask
+
+
+class ScopeSet(object):
+    """Immutable set of `intuitlib.enums.Scopes` stored as an integer bitmask
+
+    Membership and subset checks are integer operations, and string serialization is memoized per mask.
+    """
+
+    __slots__ = ('mask',)
+
+    def __init__(self, scopes=()):
+        """Constructor for ScopeSet
+
+        :param scopes: iterable of `intuitlib.enums.Scopes`, defaults to ()
+        :raises TypeError: if an item is not a `intuitlib.enums.Scopes`
+        """
+
+        mask = 0
+        for scope in scopes:
+            bit = SCOPE_BITS.get(scope) if isinstance(scope, Scopes) else None
+            if bit is None:
+                raise TypeError('Please use enum of type Scopes in list for scopes.')
+            mask |= bit
+        object.__setattr__(self, 'mask', mask)
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Creates ScopeSet from bitmask
+
+        :param mask: int bitmask of `SCOPE_BITS`
+        :raises ValueError: if mask has bits not assigned to a scope
+        :return: ScopeSet
+        """
+
+        if mask & ~ALL_SCOPES_MASK:
+            raise ValueError('Invalid scope mask {0}'.format(mask))
+        scope_set = cls.__new__(cls)
+        object.__setattr__(scope_set, 'mask', mask)
+        return scope_set
+
+    @classmethod
+    def from_string(cls, scope_string, strict=False):
+        """Parses space separated scope string, such as the `scope` field of a token response
+
+        :param scope_string: Scope string
+        :param strict: Raise for scopes not in `intuitlib.enums.Scopes` instead of ignoring them, defaults to False
+        :raises ValueError: if strict and scope_string has an unknown scope
+        :return: ScopeSet
+        """
+
+        return cls.from_mask(_parse(scope_string or '', strict))
+
+    def to_string(self):
+        """Converts to space separated scope string, scopes ordered as in `intuitlib.enums.Scopes`
+
+        :return: Scope string
+        """
+
+        string = _strings.get(self.mask)
+        if string is None:
+            string = _strings[self.mask] = ' '.join(scope.value for bit, scope in _BIT_SCOPES if self.mask & bit)
+        return string
+
+    def issubset(self, other):
+        return self.mask & ~_mask(other) == 0
+
+    def issuperset(self, other):
+        return _mask(other) & ~self.mask == 0
+
+    def __contains__(self, scope):
+        bit = SCOPE_BITS.get(scope)
+        return bit is not None and self.mask & bit != 0
+
+    def __iter__(self):
+        return (scope for bit, scope in _BIT_SCOPES if self.mask & bit)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __bool__(self):
+        return self.mask != 0
+
+    __nonzero__ = __bool__
+
+    def __or__(self, other):
+        return ScopeSet.from_mask(self.mask | _mask(other))
+
+    def __and__(self, other):
+        return ScopeSet.from_mask(self.mask & _mask(other))
+
+    def __sub__(self, other):
+        return ScopeSet.from_mask(self.mask & ~_mask(other))
+
+    def __le__(self, other):
+        return self.issubset(other)
+
+    def __ge__(self, other):
+        return self.issuperset(other)
+
+    def __eq__(self, other):
+        return isinstance(other, ScopeSet) and self.mask == other.mask
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ScopeSet is immutable')
+
+    def __reduce__(self):
+        return (ScopeSet.from_mask, (self.mask,))
+
+    def __repr__(self):
+        return 'ScopeSet([{0}])'.format(', '.join(str(scope) for scope in self))
+
+    def __str__(self):
+        return self.to_string()
+
+
+def _mask(other):
+    if isinstance(other, ScopeSet):
+        return other.mask
+    return ScopeSet(other).mask
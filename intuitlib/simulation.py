@@ -0,0 +1,340 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a discrete-event simulator of token refresh load, for capacity planning
+
+A population of realms holds tokens with the `expires_in` and `x_refresh_token_expires_in` lifetimes of the
+token endpoint. Realms are refreshed `leeway` seconds before their access token expires, like
+`intuitlib.orchestrator.RefreshOrchestrator` does, by a fixed number of concurrent refresh slots behind an
+optional token bucket. Onboarding bursts, provider latency and failures are drawn from a seeded random
+generator. Everything runs in virtual time, so a day of load is simulated in seconds. Run as::
+
+    $ python -m intuitlib.simulation --realms 50000 --onboarding 3600:20000:600 --workers 16 --rate 50
+"""
+
+from __future__ import print_function
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+from collections import deque
+
+# event kinds, ordered so that results at time t are processed before new work at time t
+_DONE = 0
+_ONBOARD = 1
+_DUE = 2
+_DISPATCH = 3
+
+# realm state indexes
+_ACCESS_EXPIRES = 0
+_REFRESH_EXPIRES = 1
+_ALIVE = 2
+_QUEUED = 3
+
+
+class Simulation(object):
+    """Simulates refreshes of a realm population against the token endpoint in virtual time
+    """
+
+    def __init__(self, realms=1000, expires_in=3600, x_refresh_token_expires_in=8726400, onboarding=(), leeway=300, jitter=0,
+            retry_interval=60, workers=16, rate=None, burst=None, latency=0.2, latency_sigma=0.5, failure_rate=0.0,
+            dead_rate=0.0, window=1.0, seed=None):
+        """Constructor for Simulation
+
+        :param realms: Realms connected at start, their tokens were issued uniformly over the last `expires_in` seconds, defaults to 1000
+        :param expires_in: Access token lifetime in seconds, defaults to 3600
+        :param x_refresh_token_expires_in: Refresh token lifetime in seconds, renewed by every refresh, defaults to 8726400
+        :param onboarding: Bursts of new realms as (at, count) or (at, count, spread) tuples, each realm exchanges an authorization code at a uniform time in [at, at + spread), defaults to ()
+        :param leeway: Seconds before access token expiry a realm is refreshed, defaults to 300
+        :param jitter: Refreshes start up to this many seconds earlier, drawn uniformly, to spread synchronized expiries, defaults to 0
+        :param retry_interval: Seconds before a failed refresh is retried, defaults to 60
+        :param workers: Refreshes in flight at most, defaults to 16
+        :param rate: Token endpoint calls per second allowed by the rate limiter, defaults to None (unlimited)
+        :param burst: Rate limiter bucket size, defaults to None (max of rate and 1)
+        :param latency: Median token endpoint latency in seconds, defaults to 0.2
+        :param latency_sigma: Sigma of the log-normal latency distribution, 0 for constant latency, defaults to 0.5
+        :param failure_rate: Share of refreshes failing transiently and retried, defaults to 0.0
+        :param dead_rate: Share of refreshes failing with invalid_grant, the realm is dropped, defaults to 0.0
+        :param window: Seconds per bucket QPS is measured over, defaults to 1.0
+        :param seed: Random seed, defaults to None
+        """
+
+        self.realms = realms
+        self.expires_in = expires_in
+        self.x_refresh_token_expires_in = x_refresh_token_expires_in
+        self.onboarding = [tuple(burst) + (0,) * (3 - len(burst)) for burst in onboarding]
+        self.leeway = leeway
+        self.jitter = jitter
+        self.retry_interval = retry_interval
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst or (max(rate, 1) if rate else rate)
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.dead_rate = dead_rate
+        self.window = window
+        self.seed = seed
+
+    def run(self, duration=86400):
+        """Runs the simulation
+
+        :param duration: Virtual seconds to simulate, defaults to 86400
+        :return: dict report, see `SimulationRun.report`
+        """
+
+        return SimulationRun(self).run(duration)
+
+
+class SimulationRun(object):
+    """State of one simulation run, use `Simulation.run`
+    """
+
+    def __init__(self, simulation):
+        self.sim = simulation
+        self.rng = random.Random(simulation.seed)
+        self.now = 0.0
+        self.events = []
+        self.counter = itertools.count()
+        self.states = []
+        self.queue = deque()
+        self.busy = 0
+        self.busy_time = 0.0
+        self.tokens = float(simulation.burst or 0)
+        self.tokens_at = 0.0
+        self.dispatch_pending = False
+
+        self.calls = {}
+        self.refresh_calls = {}
+        self.queue_delays = []
+        self.max_queue = 0
+        self.counts = dict.fromkeys(['exchanges', 'refreshes', 'succeeded', 'failed', 'dead',
+            'access_tokens_expired', 'refresh_tokens_expired'], 0)
+        self.stale_seconds = 0.0
+
+    def run(self, duration):
+        sim = self.sim
+        for _ in range(sim.realms):
+            issued_at = -self.rng.uniform(0, sim.expires_in)
+            self._add_realm(issued_at, issued_at + sim.x_refresh_token_expires_in)
+        for at, count, spread in sim.onboarding:
+            for _ in range(int(count)):
+                self._schedule(at + self.rng.uniform(0, spread), _ONBOARD, None)
+
+        while self.events and self.events[0][0] <= duration:
+            self.now, _, kind, realm = heapq.heappop(self.events)
+            if kind == _DONE:
+                self._done(realm)
+            elif kind == _ONBOARD:
+                self._record_call()
+                self.counts['exchanges'] += 1
+                self._add_realm(self.now, self.now + sim.x_refresh_token_expires_in)
+            elif kind == _DUE:
+                self._enqueue(realm)
+            else:
+                self.dispatch_pending = False
+            self._dispatch()
+
+        self.now = float(duration)
+        for state in self.states:
+            # tokens expired and not refreshed by the end of the run
+            if state[_ALIVE] and state[_ACCESS_EXPIRES] < duration:
+                self.counts['access_tokens_expired'] += 1
+                self.stale_seconds += duration - state[_ACCESS_EXPIRES]
+        return self.report(duration)
+
+    def report(self, duration):
+        """Gets run report
+
+        :param duration: Simulated seconds
+        :return: dict with call counts, peak and mean token endpoint QPS (peak_refresh_qps without code exchanges),
+            queueing delay percentiles in seconds, longest queue, worker utilization, access tokens that expired before they were refreshed (with the
+            seconds realms spent without a valid access token) and refresh tokens that expired
+        """
+
+        sim = self.sim
+        delays = sorted(self.queue_delays)
+        calls = self.counts['exchanges'] + self.counts['refreshes']
+        report = dict(self.counts)
+        report.update(
+            duration_s=duration,
+            realms=sum(1 for state in self.states if state[_ALIVE]),
+            peak_qps=round(max(self.calls.values()) / sim.window, 2) if self.calls else 0,
+            peak_refresh_qps=round(max(self.refresh_calls.values()) / sim.window, 2) if self.refresh_calls else 0,
+            mean_qps=round(calls / float(duration), 2) if duration else 0,
+            queue_delay_s=dict(
+                (name, round(_percentile(delays, percent), 3))
+                for name, percent in [('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)]
+            ),
+            max_queue=self.max_queue,
+            utilization=round(self.busy_time / (sim.workers * float(duration)), 3) if duration else 0,
+            stale_realm_s=round(self.stale_seconds, 1),
+        )
+        return report
+
+    def _schedule(self, at, kind, realm):
+        heapq.heappush(self.events, (at, next(self.counter), kind, realm))
+
+    def _add_realm(self, issued_at, refresh_expires):
+        realm = len(self.states)
+        self.states.append([issued_at + self.sim.expires_in, refresh_expires, True, False])
+        self._schedule_refresh(realm)
+
+    def _schedule_refresh(self, realm):
+        due = self.states[realm][_ACCESS_EXPIRES] - self.sim.leeway
+        if self.sim.jitter:
+            due -= self.rng.uniform(0, self.sim.jitter)
+        self._schedule(max(due, self.now), _DUE, realm)
+
+    def _enqueue(self, realm):
+        state = self.states[realm]
+        if not state[_ALIVE] or state[_QUEUED]:
+            return
+        state[_QUEUED] = True
+        self.queue.append((realm, self.now))
+        self.max_queue = max(self.max_queue, len(self.queue))
+
+    def _dispatch(self):
+        sim = self.sim
+        while self.queue and self.busy < sim.workers:
+            if sim.rate:
+                self.tokens = min(float(sim.burst), self.tokens + (self.now - self.tokens_at) * sim.rate)
+                self.tokens_at = self.now
+                if self.tokens < 1 - 1e-9:
+                    if not self.dispatch_pending:
+                        self.dispatch_pending = True
+                        self._schedule(self.now + (1 - self.tokens) / sim.rate, _DISPATCH, None)
+                    return
+                self.tokens = max(self.tokens - 1, 0.0)
+
+            realm, enqueued_at = self.queue.popleft()
+            self.queue_delays.append(self.now - enqueued_at)
+            self.counts['refreshes'] += 1
+            self._record_call(refresh=True)
+            latency = self._latency()
+            self.busy += 1
+            self.busy_time += latency
+            self._schedule(self.now + latency, _DONE, realm)
+
+    def _done(self, realm):
+        sim = self.sim
+        state = self.states[realm]
+        self.busy -= 1
+        state[_QUEUED] = False
+        draw = self.rng.random()
+
+        if self.now > state[_REFRESH_EXPIRES]:
+            self.counts['refresh_tokens_expired'] += 1
+            self._drop(state)
+        elif draw < sim.dead_rate:
+            self.counts['dead'] += 1
+            self._drop(state)
+        elif draw < sim.dead_rate + sim.failure_rate:
+            self.counts['failed'] += 1
+            self._schedule(self.now + sim.retry_interval, _DUE, realm)
+        else:
+            self.counts['succeeded'] += 1
+            if self.now > state[_ACCESS_EXPIRES]:
+                self.counts['access_tokens_expired'] += 1
+                self.stale_seconds += self.now - state[_ACCESS_EXPIRES]
+            state[_ACCESS_EXPIRES] = self.now + sim.expires_in
+            state[_REFRESH_EXPIRES] = self.now + sim.x_refresh_token_expires_in
+            self._schedule_refresh(realm)
+
+    def _drop(self, state):
+        state[_ALIVE] = False
+        if self.now > state[_ACCESS_EXPIRES]:
+            self.counts['access_tokens_expired'] += 1
+            self.stale_seconds += self.now - state[_ACCESS_EXPIRES]
+
+    def _record_call(self, refresh=False):
+        bucket = int(self.now // self.sim.window)
+        self.calls[bucket] = self.calls.get(bucket, 0) + 1
+        if refresh:
+            self.refresh_calls[bucket] = self.refresh_calls.get(bucket, 0) + 1
+
+    def _latency(self):
+        if not self.sim.latency_sigma:
+            return self.sim.latency
+        return self.rng.lognormvariate(math.log(self.sim.latency), self.sim.latency_sigma)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def _onboarding(value):
+    parts = [float(part) for part in value.split(':')]
+    if len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError('expected at:count or at:count:spread, got {0!r}'.format(value))
+    return tuple(parts)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m intuitlib.simulation', description='Simulate token endpoint load of refreshing a realm population')
+    parser.add_argument('--duration', type=float, default=86400, help='simulated seconds (default 86400)')
+    parser.add_argument('--realms', type=int, default=1000, help='realms connected at start (default 1000)')
+    parser.add_argument('--onboarding', type=_onboarding, action='append', default=[], metavar='AT:COUNT[:SPREAD]', help='burst of new realms, repeatable')
+    parser.add_argument('--expires-in', type=float, default=3600, help='access token lifetime in seconds (default 3600)')
+    parser.add_argument('--refresh-expires-in', type=float, default=8726400, help='refresh token lifetime in seconds (default 8726400)')
+    parser.add_argument('--leeway', type=float, default=300, help='seconds before expiry a realm is refreshed (default 300)')
+    parser.add_argument('--jitter', type=float, default=0, help='spread refreshes up to this many seconds earlier (default 0)')
+    parser.add_argument('--retry-interval', type=float, default=60, help='seconds before a failed refresh is retried (default 60)')
+    parser.add_argument('--workers', type=int, default=16, help='refreshes in flight (default 16)')
+    parser.add_argument('--rate', type=float, help='maximum token endpoint calls per second')
+    parser.add_argument('--burst', type=float, help='rate limiter bucket size, defaults to --rate, at least 1')
+    parser.add_argument('--latency', type=float, default=0.2, help='median token endpoint latency in seconds (default 0.2)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='log-normal latency sigma, 0 for constant (default 0.5)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of refreshes failing transiently')
+    parser.add_argument('--dead-rate', type=float, default=0.0, help='share of refreshes failing with invalid_grant')
+    parser.add_argument('--seed', type=int, help='random seed')
+    return parser
+
+
+def main(argv=None):
+    """Runs a simulation from command line arguments and prints its report as JSON
+
+    :param argv: Arguments, defaults to None (sys.argv)
+    :return: 0
+    """
+
+    args = build_parser().parse_args(argv)
+    simulation = Simulation(
+        realms=args.realms,
+        expires_in=args.expires_in,
+        x_refresh_token_expires_in=args.refresh_expires_in,
+        onboarding=args.onboarding,
+        leeway=args.leeway,
+        jitter=args.jitter,
+        retry_interval=args.retry_interval,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        failure_rate=args.failure_rate,
+        dead_rate=args.dead_rate,
+        seed=args.seed,
+    )
+    print(json.dumps(simulation.run(args.duration), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains request templates precompiled per client, so token calls only add the varying field
+"""
+
+from types import MappingProxyType
+
+try:
+  from urllib.parse import quote_plus, urlencode
+except (ModuleNotFoundError, ImportError):
+  from future.moves.urllib.parse import quote_plus, urlencode
+
+from intuitlib.config import ACCEPT_HEADER
+from intuitlib.utils import get_auth_header
+
+
+def prepared_headers(headers):
+    """Merges `intuitlib.config.ACCEPT_HEADER` into headers once and freezes them
+
+    `intuitlib.utils.send_request` sends read-only headers as they are, so one mapping is shared by every call.
+
+    :param headers: dict of headers
+    :return: read-only mapping of headers
+    """
+
+    merged = dict(headers)
+    merged.update(ACCEPT_HEADER)
+    return MappingProxyType(merged)
+
+
+class RequestTemplates(object):
+    """Headers and encoded body prefixes of the token and revoke calls of one client
+
+    Built once per set of credentials, `AuthClient` rebuilds it when client_id, client_secret or redirect_uri change.
+    """
+
+    def __init__(self, client_id, client_secret, redirect_uri):
+        """Constructor for RequestTemplates
+
+        :param client_id: Client ID found in developer account Keys tab
+        :param client_secret: Client Secret found in developer account Keys tab
+        :param redirect_uri: Redirect URI, handles callback from provider
+        """
+
+        self.key = (client_id, client_secret, redirect_uri)
+        authorization = get_auth_header(client_id, client_secret)
+        self.token_headers = prepared_headers({
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Authorization': authorization,
+        })
+        self.revoke_headers = prepared_headers({
+            'Content-Type': 'application/json',
+            'Authorization': authorization,
+        })
+        # urlencode of the same dicts, split around the varying value
+        self._refresh_prefix = urlencode({'grant_type': 'refresh_token'}) + '&refresh_token='
+        self._code_prefix = urlencode({'grant_type': 'authorization_code'}) + '&code='
+        self._code_suffix = '&' + urlencode({'redirect_uri': redirect_uri})
+
+    def matches(self, client_id, client_secret, redirect_uri):
+        """Checks if templates were built for these credentials
+
+        :return: True if templates can be used
+        """
+
+        return self.key == (client_id, client_secret, redirect_uri)
+
+    def refresh_body(self, refresh_token):
+        """Gets form body of a refresh token grant
+
+        :param refresh_token: Refresh Token
+        :return: str
+        """
+
+        return self._refresh_prefix + _quote(refresh_token)
+
+    def code_body(self, auth_code):
+        """Gets form body of an authorization code grant
+
+        :param auth_code: Authorization code received from redirect_uri
+        :return: str
+        """
+
+        return self._code_prefix + _quote(auth_code) + self._code_suffix
+
+
+def _quote(value):
+    # same quoting urlencode applies to a value
+    if not isinstance(value, (str, bytes)):
+        value = str(value)
+    return quote_plus(value)
@@ -0,0 +1,334 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains a token cache shared by processes through an mmap-backed file (Unix only)
+
+The file holds a fixed-size, open-addressed table keyed by realm. Every slot has a sequence counter
+that is odd while the slot is written, so readers copy a slot without locking and retry if it changed.
+Writers are serialized with a file lock.
+"""
+
+import fcntl
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from intuitlib.tokens import FLAG_DEAD, TokenSet
+
+_MAGIC = b'ITKC'
+_LAYOUT_VERSION = 1
+_HEADER = struct.Struct('<4sHII')
+_HEADER_SIZE = 64
+
+# seq, state, flags, realm/access/refresh/id/scope lengths, expires_in, x_refresh_token_expires_in, issued_at, updated_at
+_SLOT = struct.Struct('<IBB5Hqqdd')
+_SEQ = struct.Struct('<I')
+
+_EMPTY = 0
+_USED = 1
+_DELETED = 2
+
+_NONE_LENGTH = 0xFFFF
+
+# reader retries while a slot is written, and the pause between them in seconds
+_READ_RETRIES = 100
+_READ_PAUSE = 0.0001
+_STRING_FIELDS = ('access_token', 'refresh_token', 'id_token', 'scope')
+
+
+class SharedTokenCache(object):
+    """Fixed-size token table in an mmap-backed file, shared by every process that opens the same path
+    """
+
+    def __init__(self, path, slots=1024, slot_size=4096):
+        """Constructor for SharedTokenCache, creates the file if it does not exist
+
+        :param path: File path, e.g. on tmpfs such as /dev/shm
+        :param slots: Number of slots, used when creating the file, defaults to 1024
+        :param slot_size: Bytes per slot, used when creating the file, defaults to 4096
+        :raises ValueError: if the file exists with a different layout
+        """
+
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        with self._write_lock():
+            if os.fstat(self._fd).st_size == 0:
+                os.ftruncate(self._fd, _HEADER_SIZE + slots * slot_size)
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, _LAYOUT_VERSION, slots, slot_size), 0)
+            header = os.pread(self._fd, _HEADER.size, 0)
+        magic, layout_version, slots, slot_size = _HEADER.unpack(header) if len(header) == _HEADER.size else (None, None, 0, 0)
+        if magic != _MAGIC or layout_version != _LAYOUT_VERSION:
+            os.close(self._fd)
+            raise ValueError('{0} is not a token cache file of layout version {1}'.format(path, _LAYOUT_VERSION))
+
+        self.slots = slots
+        self.slot_size = slot_size
+        self._map = mmap.mmap(self._fd, _HEADER_SIZE + slots * slot_size)
+
+    def get(self, realm_id):
+        """Gets tokens stored for realm
+
+        :param realm_id: QBO Realm/Company ID
+        :return: `intuitlib.tokens.TokenSet` or None
+        """
+
+        record = self._find(realm_id)
+        return record[1] if record is not None else None
+
+    def get_record(self, realm_id):
+        """Gets tokens, flags and update time stored for realm
+
+        :param realm_id: QBO Realm/Company ID
+        :return: tuple of (`intuitlib.tokens.TokenSet`, flags, updated_at) or None
+        """
+
+        record = self._find(realm_id)
+        return record[1:] if record is not None else None
+
+    def sequence(self, realm_id):
+        """Gets the sequence counter of the realm's slot, which changes on every write
+
+        :param realm_id: QBO Realm/Company ID
+        :return: int, 0 if realm is not stored
+        """
+
+        record = self._find(realm_id)
+        return record[0] if record is not None else 0
+
+    def put(self, realm_id, tokens, flags=0):
+        """Stores tokens for realm
+
+        :param realm_id: QBO Realm/Company ID
+        :param tokens: `intuitlib.tokens.TokenSet`
+        :param flags: Record flags, defaults to 0
+        :raises ValueError: if realm_id is None or the record does not fit a slot
+        :raises MemoryError: if the table is full
+        """
+
+        if realm_id is None:
+            raise ValueError('Realm ID not specified')
+        realm = _encode(realm_id)
+        values = [_encode(getattr(tokens, field)) for field in _STRING_FIELDS]
+        lengths = [len(value) if value is not None else _NONE_LENGTH for value in [realm] + values]
+        payload = b''.join(value for value in [realm] + values if value is not None)
+        if _SLOT.size + len(payload) > self.slot_size:
+            raise ValueError('Token record of {0} bytes does not fit a slot of {1} bytes'.format(_SLOT.size + len(payload), self.slot_size))
+
+        with self._write_lock():
+            offset = self._probe(realm, for_insert=True)
+            seq = self._begin_write(offset)
+            self._map[offset + _SLOT.size:offset + _SLOT.size + len(payload)] = payload
+            _SLOT.pack_into(self._map, offset, seq, _USED, flags, *(lengths + [
+                _int_or_sentinel(tokens.expires_in),
+                _int_or_sentinel(tokens.x_refresh_token_expires_in),
+                _float_or_nan(tokens.issued_at),
+                time.time(),
+            ]))
+            _SEQ.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF)
+
+    def set_flags(self, realm_id, flags, refresh_token=None):
+        """Replaces flags of the realm's record and stamps its update time, tokens are kept
+
+        :param realm_id: QBO Realm/Company ID
+        :param flags: Record flags
+        :param refresh_token: Only change the record if it still holds this refresh token, defaults to None (any)
+        :return: True if the record was changed
+        """
+
+        if realm_id is None:
+            return False
+        realm = _encode(realm_id)
+        with self._write_lock():
+            offset = self._probe(realm)
+            if offset is None:
+                return False
+            slot = self._map[offset:offset + self.slot_size]
+            fields = _SLOT.unpack_from(slot)
+            if refresh_token is not None and _decode_slot(slot, fields)[0].refresh_token != refresh_token:
+                return False
+            seq = self._begin_write(offset)
+            _SLOT.pack_into(self._map, offset, *((seq, _USED, flags) + fields[3:-1] + (time.time(),)))
+            _SEQ.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF)
+            return True
+
+    def delete(self, realm_id):
+        """Removes realm
+
+        :param realm_id: QBO Realm/Company ID
+        :return: True if realm was stored
+        """
+
+        realm = _encode(realm_id)
+        with self._write_lock():
+            offset = self._probe(realm)
+            if offset is None:
+                return False
+            seq = self._begin_write(offset)
+            self._map[offset + 4] = _DELETED
+            _SEQ.pack_into(self._map, offset, (seq + 1) & 0xFFFFFFFF)
+            return True
+
+    def close(self):
+        """Unmaps the table and closes the file, the file itself is kept
+        """
+
+        self._map.close()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_lock(self):
+        return _WriteLock(self._lock, self._fd)
+
+    def _begin_write(self, offset):
+        """Marks the slot as being written and returns its odd sequence, caller holds the write lock
+
+        The sequence is odd already if a writer died between its two writes, e.g. a worker killed on timeout,
+        so it is made odd rather than incremented, and the end of this write makes it even again.
+        """
+
+        seq = _SEQ.unpack_from(self._map, offset)[0] | 1
+        _SEQ.pack_into(self._map, offset, seq)
+        return seq
+
+    def _read_slot(self, offset):
+        """Copies a slot without locking, returns (seq, slot bytes) or None if the slot was left half-written
+        """
+
+        for _ in range(_READ_RETRIES):
+            seq = _SEQ.unpack_from(self._map, offset)[0]
+            if not seq & 1:
+                slot = self._map[offset:offset + self.slot_size]
+                if _SEQ.unpack_from(self._map, offset)[0] == seq:
+                    return seq, slot
+            time.sleep(_READ_PAUSE)
+        # a live writer releases the lock within microseconds, still odd under the lock means the writer died
+        with self._write_lock():
+            seq = _SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                return None
+            return seq, self._map[offset:offset + self.slot_size]
+
+    def _find(self, realm_id):
+        if realm_id is None:
+            return None
+        realm = _encode(realm_id)
+        for offset in self._offsets(realm):
+            copy = self._read_slot(offset)
+            if copy is None:
+                continue
+            seq, slot = copy
+            fields = _SLOT.unpack_from(slot)
+            state = fields[1]
+            if state == _EMPTY:
+                return None
+            if state == _DELETED or fields[3] != len(realm) or slot[_SLOT.size:_SLOT.size + len(realm)] != realm:
+                continue
+            return (seq,) + _decode_slot(slot, fields)
+        return None
+
+    def _probe(self, realm, for_insert=False):
+        """Finds the slot offset of realm, or the first free one if for_insert, caller holds the write lock
+        """
+
+        free = None
+        for offset in self._offsets(realm):
+            state = self._map[offset + 4]
+            if state == _EMPTY:
+                return free if free is not None else (offset if for_insert else None)
+            if state == _DELETED:
+                if free is None and for_insert:
+                    free = offset
+                continue
+            length = struct.unpack_from('<H', self._map, offset + 6)[0]
+            if length == len(realm) and self._map[offset + _SLOT.size:offset + _SLOT.size + length] == realm:
+                return offset
+        if free is not None:
+            return free
+        if for_insert:
+            raise MemoryError('Token cache {0} is full'.format(self.path))
+        return None
+
+    def _offsets(self, realm):
+        start = zlib.crc32(realm) % self.slots
+        for i in range(self.slots):
+            yield _HEADER_SIZE + ((start + i) % self.slots) * self.slot_size
+
+
+class _WriteLock(object):
+    """Serializes writers between threads of a process and between processes
+    """
+
+    def __init__(self, lock, fd):
+        self.lock = lock
+        self.fd = fd
+
+    def __enter__(self):
+        self.lock.acquire()
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+
+def _decode_slot(slot, fields):
+    _, _, flags = fields[:3]
+    lengths = fields[3:8]
+    expires_in, x_refresh_token_expires_in, issued_at, updated_at = fields[8:]
+
+    values = []
+    position = _SLOT.size
+    for length in lengths:
+        if length == _NONE_LENGTH:
+            values.append(None)
+        else:
+            values.append(slot[position:position + length].decode('utf-8'))
+            position += length
+    realm_id, access_token, refresh_token, id_token, scope = values
+
+    tokens = TokenSet(
+        access_token=access_token,
+        refresh_token=refresh_token,
+        id_token=id_token,
+        expires_in=expires_in if expires_in >= 0 else None,
+        x_refresh_token_expires_in=x_refresh_token_expires_in if x_refresh_token_expires_in >= 0 else None,
+        realm_id=realm_id,
+        scope=scope,
+        issued_at=None if math.isnan(issued_at) else issued_at,
+    )
+    return tokens, flags, updated_at
+
+
+def _encode(value):
+    if value is None:
+        return None
+    return str(value).encode('utf-8')
+
+
+def _int_or_sentinel(value):
+    return -1 if value is None else int(value)
+
+
+def _float_or_nan(value):
+    return float('nan') if value is None else float(value)
@@ -0,0 +1,200 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains the immutable token state held by `intuitlib.client.AuthClient`
+"""
+
+import struct
+import time
+from collections import namedtuple
+
+TOKEN_FIELDS = ('access_token', 'refresh_token', 'id_token', 'expires_in', 'x_refresh_token_expires_in', 'realm_id', 'scope', 'issued_at')
+
+# token store record flag marking the refresh token of the record as dead
+FLAG_DEAD = 1
+
+# binary token state: magic, layout version, presence bits, issued_at, expires_in, x_refresh_token_expires_in,
+# endpoints version, then a u16 length per present string followed by the UTF-8 strings
+STATE_VERSION = 1
+_STATE_MAGIC = b'IT'
+_STATE_HEADER = struct.Struct('<2sBHdiiI')
+_STATE_STRINGS = ('access_token', 'refresh_token', 'id_token', 'realm_id', 'scope')
+_ISSUED_AT_BIT = 1 << 5
+_EXPIRES_IN_BIT = 1 << 6
+_X_REFRESH_BIT = 1 << 7
+_ENDPOINTS_VERSION_BIT = 1 << 8
+_LENGTHS = [struct.Struct('<' + 'H' * count) for count in range(len(_STATE_STRINGS) + 1)]
+_STRING_COUNTS = [bin(mask).count('1') for mask in range(1 << len(_STATE_STRINGS))]
+
+
+class TokenSet(namedtuple('TokenSet', TOKEN_FIELDS)):
+    """Immutable snapshot of tokens, expiries and realm
+
+    `expires_in` and `x_refresh_token_expires_in` are relative to `issued_at`, the epoch time the tokens were received.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, access_token=None, refresh_token=None, id_token=None, expires_in=None, x_refresh_token_expires_in=None, realm_id=None, scope=None, issued_at=None):
+        return super(TokenSet, cls).__new__(cls, access_token, refresh_token, id_token, expires_in, x_refresh_token_expires_in, realm_id, scope, issued_at)
+
+    @property
+    def access_token_expires_at(self):
+        """Epoch time the access token expires at, None if unknown
+        """
+
+        if self.issued_at is None or self.expires_in is None:
+            return None
+        return self.issued_at + self.expires_in
+
+    @property
+    def refresh_token_expires_at(self):
+        """Epoch time the refresh token expires at, None if unknown
+        """
+
+        if self.issued_at is None or self.x_refresh_token_expires_in is None:
+            return None
+        return self.issued_at + self.x_refresh_token_expires_in
+
+    def is_access_token_expired(self, leeway=0, now=None):
+        """Checks if access token is expired or expires within leeway seconds
+
+        :param leeway: Seconds before expiry the token is considered expired, defaults to 0
+        :param now: Epoch time to compare with, defaults to None (current time)
+        :return: True/False, False if expiry is unknown
+        """
+
+        expires_at = self.access_token_expires_at
+        if expires_at is None:
+            return False
+        return expires_at - leeway <= (time.time() if now is None else now)
+
+
+def encode_state(tokens, endpoints_version=None):
+    """Encodes token state in the compact binary layout
+
+    :param tokens: `TokenSet`
+    :param endpoints_version: Version of the `intuitlib.endpoints.Endpoints` the tokens were used with, defaults to None
+    :raises ValueError: if a string is longer than 65535 bytes
+    :return: bytes
+    """
+
+    presence = 0
+    lengths = []
+    values = []
+    for bit, field in enumerate(_STATE_STRINGS):
+        value = getattr(tokens, field)
+        if value is not None:
+            value = value.encode('utf-8') if not isinstance(value, bytes) else value
+            presence |= 1 << bit
+            lengths.append(len(value))
+            values.append(value)
+    if tokens.issued_at is not None:
+        presence |= _ISSUED_AT_BIT
+    if tokens.expires_in is not None:
+        presence |= _EXPIRES_IN_BIT
+    if tokens.x_refresh_token_expires_in is not None:
+        presence |= _X_REFRESH_BIT
+    if endpoints_version is not None:
+        presence |= _ENDPOINTS_VERSION_BIT
+
+    try:
+        header = _STATE_HEADER.pack(_STATE_MAGIC, STATE_VERSION, presence, tokens.issued_at or 0.0,
+            int(tokens.expires_in or 0), int(tokens.x_refresh_token_expires_in or 0), endpoints_version or 0)
+        return b''.join([header, _LENGTHS[len(lengths)].pack(*lengths)] + values)
+    except struct.error as e:
+        raise ValueError('Token state cannot be encoded: {0}'.format(e))
+
+def decode_state(data):
+    """Decodes token state encoded by `encode_state`
+
+    :param data: bytes
+    :raises ValueError: if data is not token state of a known layout version
+    :return: tuple of (`TokenSet`, endpoints version or None)
+    """
+
+    try:
+        magic, version, presence, issued_at, expires_in, x_refresh_token_expires_in, endpoints_version = _STATE_HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError('Token state is truncated')
+    if magic != _STATE_MAGIC or version != STATE_VERSION:
+        raise ValueError('Token state is not of layout version {0}'.format(STATE_VERSION))
+
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    lengths_struct = _LENGTHS[_STRING_COUNTS[presence & 0x1f]]
+    position = _STATE_HEADER.size + lengths_struct.size
+    if position > len(data):
+        raise ValueError('Token state is truncated')
+    lengths = iter(lengths_struct.unpack_from(data, _STATE_HEADER.size))
+    strings = [None] * len(_STATE_STRINGS)
+    for bit in range(len(_STATE_STRINGS)):
+        if presence & (1 << bit):
+            length = next(lengths)
+            strings[bit] = data[position:position + length].decode('utf-8')
+            position += length
+    if position > len(data):
+        raise ValueError('Token state is truncated')
+
+    access_token, refresh_token, id_token, realm_id, scope = strings
+    tokens = TokenSet(
+        access_token,
+        refresh_token,
+        id_token,
+        expires_in if presence & _EXPIRES_IN_BIT else None,
+        x_refresh_token_expires_in if presence & _X_REFRESH_BIT else None,
+        realm_id,
+        scope,
+        issued_at if presence & _ISSUED_AT_BIT else None,
+    )
+    return tokens, endpoints_version if presence & _ENDPOINTS_VERSION_BIT else None
+
+def state_to_dict(tokens, endpoints_version=None):
+    """Converts token state to a dict of JSON types, including absolute expiries
+
+    :param tokens: `TokenSet`
+    :param endpoints_version: Version of the `intuitlib.endpoints.Endpoints` the tokens were used with, defaults to None
+    :return: dict
+    """
+
+    state = tokens._asdict()
+    state.update(
+        version=STATE_VERSION,
+        access_token_expires_at=tokens.access_token_expires_at,
+        refresh_token_expires_at=tokens.refresh_token_expires_at,
+        endpoints_version=endpoints_version,
+    )
+    return dict(state)
+
+def state_from_dict(state):
+    """Converts a dict made by `state_to_dict` back to token state
+
+    Relative expiries missing from the dict are derived from the absolute ones and `issued_at`.
+
+    :param state: dict
+    :raises ValueError: if state is of a newer layout version
+    :return: tuple of (`TokenSet`, endpoints version or None)
+    """
+
+    if state.get('version', STATE_VERSION) > STATE_VERSION:
+        raise ValueError('Token state is of a newer layout version {0}'.format(state['version']))
+
+    values = dict((field, state.get(field)) for field in TOKEN_FIELDS)
+    issued_at = values['issued_at']
+    if issued_at is not None:
+        if values['expires_in'] is None and state.get('access_token_expires_at') is not None:
+            values['expires_in'] = int(round(state['access_token_expires_at'] - issued_at))
+        if values['x_refresh_token_expires_in'] is None and state.get('refresh_token_expires_at') is not None:
+            values['x_refresh_token_expires_in'] = int(round(state['refresh_token_expires_at'] - issued_at))
+    return TokenSet(**values), state.get('endpoints_version')
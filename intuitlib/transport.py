@@ -0,0 +1,248 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""This module contains the transports used to send HTTP requests to Intuit endpoints
+"""
+
+import json
+import threading
+
+import requests
+import urllib3
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+  from urllib.parse import urlencode
+except (ModuleNotFoundError, ImportError):
+  from future.moves.urllib.parse import urlencode
+from requests.sessions import Session
+from requests.structures import CaseInsensitiveDict
+
+
+class Response(object):
+    """Minimal response object returned by transports not based on `requests`
+    """
+
+    def __init__(self, status_code, content=b'', headers=None, url=None):
+        """Constructor for Response
+
+        :param status_code: HTTP status code
+        :param content: Response body bytes, defaults to b''
+        :param headers: Response headers, defaults to None
+        :param url: Request URL, defaults to None
+        """
+
+        self.status_code = status_code
+        self.content = content
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Transport(object):
+    """Interface for sending HTTP requests, all outbound calls of this library go through a transport
+    """
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        """Sends HTTP request
+
+        :param method: HTTP method type
+        :param url: request URL
+        :param headers: request headers, defaults to None
+        :param data: request body, defaults to None
+        :param auth: `requests` auth object (e.g. OAuth1) applied to the request, defaults to None
+        :return: response with `status_code`, `content`, `headers` and `json()`
+        """
+
+        raise NotImplementedError
+
+    def close(self):
+        """Releases pooled connections
+        """
+
+
+class RequestsTransport(Transport):
+    """Transport backed by `requests`
+    """
+
+    def __init__(self, session=None):
+        """Constructor for RequestsTransport
+
+        :param session: `requests.Session` to send requests with, defaults to None (`requests.request`)
+        """
+
+        self.session = session
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        if self.session is not None:
+            return self.session.request(method, url, headers=headers, data=data, auth=auth)
+        if method == 'GET':
+            # discovery and JWKS fetches have always gone through requests.get
+            return requests.get(url, headers=headers, auth=auth)
+        return requests.request(method, url, headers=headers, data=data, auth=auth)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+def _prepare(method, url, headers, data, auth):
+    """Applies auth and form-encodes a dict body for transports that do not build requests with `requests`
+
+    :return: (url, headers, data) tuple
+    """
+
+    if auth is not None:
+        # auth objects work on prepared requests, e.g. OAuth1 signs the final URL, headers and body
+        prepared = requests.Request(method, url, headers=headers, data=data, auth=auth).prepare()
+        return prepared.url, prepared.headers, prepared.body
+    if isinstance(data, dict):
+        data = urlencode(data)
+    return url, headers, data
+
+
+class Urllib3Transport(Transport):
+    """Transport backed by a `urllib3.PoolManager`, skips the per-call overhead of `requests`
+    """
+
+    def __init__(self, pool_manager=None, num_pools=10, maxsize=10, timeout=None, retries=False):
+        """Constructor for Urllib3Transport
+
+        :param pool_manager: `urllib3.PoolManager` to send requests with, defaults to None (created)
+        :param num_pools: Number of host pools kept, defaults to 10
+        :param maxsize: Connections kept per host, defaults to 10
+        :param timeout: Request timeout in seconds, defaults to None
+        :param retries: urllib3 retry configuration, defaults to False (no retries, like `requests`)
+        """
+
+        self.pool_manager = pool_manager or urllib3.PoolManager(num_pools=num_pools, maxsize=maxsize)
+        self.timeout = timeout
+        self.retries = retries
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        url, headers, data = _prepare(method, url, headers, data, auth)
+        response = self.pool_manager.request(method, url, body=data, headers=headers,
+            timeout=self.timeout, retries=self.retries, redirect=False)
+        return Response(response.status, response.data, response.headers, url)
+
+    def close(self):
+        self.pool_manager.clear()
+
+
+class Http2Transport(Transport):
+    """Transport backed by an `httpx.Client` speaking HTTP/2, concurrent calls share a few multiplexed connections
+
+    Requires the `httpx[http2]` package, installed with the `http2` extra of this library.
+    """
+
+    def __init__(self, client=None, max_connections=10, timeout=None, http1=True):
+        """Constructor for Http2Transport
+
+        :param client: `httpx.Client` to send requests with, defaults to None (created with HTTP/2 enabled)
+        :param max_connections: Connections kept in the pool, defaults to 10
+        :param timeout: Request timeout in seconds, defaults to None
+        :param http1: Fall back to HTTP/1.1 for servers not offering HTTP/2, False for HTTP/2 with prior knowledge (e.g. cleartext), defaults to True
+        :raises ImportError: if httpx is not installed
+        """
+
+        if client is None:
+            if httpx is None:
+                raise ImportError('Http2Transport requires the httpx[http2] package to be installed')
+            client = httpx.Client(http1=http1, http2=True, timeout=timeout,
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        self.client = client
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        url, headers, data = _prepare(method, url, headers, data, auth)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        response = self.client.request(method, url, headers=headers, content=data)
+        return Response(response.status_code, response.content, response.headers, url)
+
+    def close(self):
+        self.client.close()
+
+
+class InMemoryTransport(Transport):
+    """Transport answering from registered routes or a handler without any network I/O, for tests and benchmarks
+    """
+
+    def __init__(self, handler=None):
+        """Constructor for InMemoryTransport
+
+        :param handler: callable taking (method, url, headers, data) and returning a response, used for URLs without a route, defaults to None
+        """
+
+        self.handler = handler
+        self.requests = []
+        self.record = True
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def add_route(self, method, url, status=200, json_body=None, content=b'', headers=None):
+        """Registers the response returned for method and URL
+
+        :param method: HTTP method type
+        :param url: request URL
+        :param status: HTTP status code, defaults to 200
+        :param json_body: Object serialized as response body, defaults to None
+        :param content: Response body bytes if json_body is None, defaults to b''
+        :param headers: Response headers, defaults to None
+        """
+
+        if json_body is not None:
+            content = json.dumps(json_body).encode('utf-8')
+        self._routes[(method.upper(), url)] = (status, content, headers)
+
+    def request(self, method, url, headers=None, data=None, auth=None):
+        if self.record:
+            with self._lock:
+                self.requests.append((method, url, headers, data))
+
+        route = self._routes.get((method.upper(), url))
+        if route is not None:
+            status, content, response_headers = route
+            return Response(status, content, response_headers, url)
+        if self.handler is not None:
+            return self.handler(method, url, headers, data)
+        return Response(404, b'', None, url)
+
+
+_default_transport = RequestsTransport()
+
+
+def get_transport(transport=None, session=None):
+    """Resolves the transport used for a call
+
+    :param transport: `Transport` instance, defaults to None
+    :param session: `requests.Session` used if transport is None, defaults to None
+    :return: `Transport` instance
+    """
+
+    if transport is not None:
+        return transport
+    if session is not None and isinstance(session, Session):
+        return RequestsTransport(session)
+    return _default_transport
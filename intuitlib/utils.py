@@ -15,87 +15,147 @@
 """This module contains utility methods used by this library
 """
 
-import json
 import jwt
+import os
 import random
+# calls go through intuitlib.transport, tests patch requests through this module
 import requests
 import six
 import string
+import time
 from base64 import b64encode, b64decode
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, load_pem_public_key
 from datetime import datetime
-from requests.sessions import Session
+from types import MappingProxyType
 
+from intuitlib.calllog import get_call_logger
 from intuitlib.config import DISCOVERY_URL, ACCEPT_HEADER
 from intuitlib.enums import Scopes
 from intuitlib.exceptions import AuthClientError
+from intuitlib.jsoncodec import get_codec
+from intuitlib.jwks import JWKCache
+from intuitlib.scopes import ScopeSet
+from intuitlib.tokens import TOKEN_FIELDS
+from intuitlib.transport import get_transport
 
 
-def get_discovery_doc(environment, session=None):
+def get_discovery_url(environment):
+    """Gets discovery URL based on environment specified.
+    :param environment: App environment, accepted values: 'sandbox','production','prod' or a discovery URL
+    :return: Discovery URL
+    """
+    if environment.lower() in ['production', 'prod']:
+        return DISCOVERY_URL['production']
+    elif environment.lower() in ['sandbox', 'sand']:
+        return DISCOVERY_URL['sandbox']
+    return environment
+
+def get_discovery_doc(environment, session=None, codec=None, transport=None):
     """Gets discovery doc based on environment specified.
     :param environment: App environment, accepted values: 'sandbox','production','prod','e2e'
     :param session: `requests.Session` object if a session is already being used, defaults to None
+    :param codec: JSON codec instance or name, defaults to None (library default)
+    :param transport: `intuitlib.transport.Transport` to send the request with, defaults to None (`requests` using session)
     :return: Discovery doc response 
     :raises HTTPError: if response status != 200
     """
-    if environment.lower() in ['production', 'prod']:
-        discovery_url = DISCOVERY_URL['production']
-    elif environment.lower() in ['sandbox', 'sand']:
-        discovery_url = DISCOVERY_URL['sandbox']
-    else:
-        discovery_url = environment
-        
-    if session is not None and isinstance(session, Session):
-        response = session.get(url=discovery_url)
-    else:
-        response = requests.get(url=discovery_url)
+    discovery_url = get_discovery_url(environment)
+
+    response = _get(discovery_url, 'discovery', session, transport)
     if response.status_code != 200:
         raise AuthClientError(response)
-    return response.json()
+    return get_codec(codec).response_json(response)
 
-def set_attributes(obj, response_json):
+def set_attributes(obj, response_json, id_token_valid=None):
     """Sets attribute to an object from a dict
     
     :param obj: Object to set the attributes to
     :param response_json: dict with key names same as object attributes
+    :param id_token_valid: Result of validating the id_token of response_json beforehand, defaults to None (validated here)
     """
 
+    # objects holding a TokenSet get all token values in one update
+    update_tokens = getattr(obj, 'update_tokens', None)
+    token_values = {}
+
     for key in response_json:
         if key not in ['token_type', 'id_token']:
-            setattr(obj, key, response_json[key])
+            if update_tokens is not None and key in TOKEN_FIELDS:
+                token_values[key] = response_json[key]
+            else:
+                setattr(obj, key, response_json[key])
+
+    # applied before the ID token is validated, so tokens are kept if validation fails or raises
+    if token_values:
+        if 'access_token' in token_values:
+            token_values.setdefault('issued_at', time.time())
+        update_tokens(**token_values)
     
     if 'id_token' in response_json:
         if response_json['id_token'] is not None:
-            is_valid = validate_id_token(response_json['id_token'], obj.client_id, obj.issuer_uri, obj.jwks_uri)
+            is_valid = id_token_valid
+            if is_valid is None:
+                is_valid = validate_id_token(response_json['id_token'], obj.client_id, obj.issuer_uri, obj.jwks_uri,
+                    codec=getattr(obj, 'codec', None), session=getattr(obj, 'session', None), jwk_cache=getattr(obj, 'jwk_cache', None),
+                    transport=getattr(obj, 'transport', None))
             if is_valid:
-                obj.id_token = response_json['id_token']  
+                if update_tokens is not None:
+                    update_tokens(id_token=response_json['id_token'])
+                else:
+                    obj.id_token = response_json['id_token']  
 
-def send_request(method, url, header, obj, body=None, session=None, oauth1_header=None):
+def send_request(method, url, header, obj, body=None, session=None, oauth1_header=None, codec=None, rate_limiter=None, endpoint=None, transport=None, concurrency_limiter=None, call_logger=None):
     """Makes API request using requests library, raises `intuitlib.exceptions.AuthClientError` if request not successful and sets specified object attributes from API response if request successful
     
     :param method: HTTP method type
     :param url: request URL
-    :param header: request headers
-    :param obj: object to set the attributes to
+    :param header: request headers, updated with `ACCEPT_HEADER` unless read-only (see `intuitlib.templates.prepared_headers`)
+    :param obj: object to set the attributes to, None to leave the response unprocessed
     :param body: request body, defaults to None
     :param session: requests session, defaults to None
     :param oauth1_header: OAuth1 auth header, defaults to None
+    :param codec: JSON codec instance or name used to decode the response, defaults to None (library default)
+    :param rate_limiter: `intuitlib.ratelimit.RateLimiter` to acquire from before sending, defaults to None
+    :param endpoint: Endpoint name used by rate_limiter, defaults to None (request URL)
+    :param transport: `intuitlib.transport.Transport` to send the request with, defaults to None (`requests` using session)
+    :param concurrency_limiter: `intuitlib.concurrency.AdaptiveLimiter` the request takes a slot from, defaults to None
+    :param call_logger: `intuitlib.calllog.CallLogger` the call is logged with, defaults to None (library default)
     :raises AuthClientError: In case response != 200
+    :raises `intuitlib.exceptions.RateLimitExceededError`: if rate_limiter or concurrency_limiter does not allow the call in time
     :return: requests object
     """
 
-    headers = ACCEPT_HEADER
-    header.update(headers)
+    if rate_limiter is not None:
+        rate_limiter.acquire(endpoint or url)
 
-    if session is not None and isinstance(session, Session):
-        response = session.request(method, url, headers=header, data=body, auth=oauth1_header)
-    else:
-        response = requests.request(method, url, headers=header, data=body, auth=oauth1_header) 
+    # read-only headers are shared between calls and already carry ACCEPT_HEADER
+    if not isinstance(header, MappingProxyType):
+        header.update(ACCEPT_HEADER)
+
+    call_logger = get_call_logger(call_logger)
+    started = concurrency_limiter.acquire() if concurrency_limiter is not None else None
+    # timed only when the call can be logged, so disabled logging costs one level check
+    log_started = time.monotonic() if call_logger.enabled() else None
+    try:
+        response = get_transport(transport, session).request(method, url, headers=header, data=body, auth=oauth1_header)
+    except Exception as e:
+        if started is not None:
+            concurrency_limiter.release(started)
+        if log_started is not None:
+            call_logger.log_call(method, url, endpoint, header, body, time.monotonic() - log_started, error=e)
+        raise
+    if started is not None:
+        concurrency_limiter.release(started, response.status_code, response.headers.get('Retry-After'))
+    if log_started is not None:
+        call_logger.log_call(method, url, endpoint, header, body, time.monotonic() - log_started, response)
 
     if response.status_code != 200:
         raise AuthClientError(response)
 
-    if response.content:
-        set_attributes(obj, response.json())
+    if response.content and obj is not None:
+        set_attributes(obj, get_codec(codec).response_json(response))
 
     return response
 
@@ -116,13 +176,17 @@ def scopes_to_string(scopes):
     """Converts list of enum to string
     
     :param scopes: Scopes specified for OAuth/OpenID flow  
-    :type scopes: list of `intuitlib.enums.Scopes`
+    :type scopes: list of `intuitlib.enums.Scopes` or `intuitlib.scopes.ScopeSet`
     :raises TypeError: for invalid input for scope 
     :return: Scopes string
     """
     
+    if isinstance(scopes, ScopeSet):
+        return scopes.to_string()
+    if scopes and not isinstance(scopes, list):
+        raise TypeError('Please use enum of type Scopes in list for scopes.')
     for scope in scopes:
-        if not isinstance(scope, Scopes) or not isinstance(scopes, list):
+        if not isinstance(scope, Scopes):
             raise TypeError('Please use enum of type Scopes in list for scopes.')
     return ' '.join(scope.value for scope in scopes).strip()
 
@@ -136,54 +200,216 @@ def generate_token(length=30, allowed_chars=''.join([string.ascii_letters, strin
 
     return ''.join(random.choice(allowed_chars) for i in range(length))
 
-def validate_id_token(id_token, client_id, intuit_issuer, jwk_uri):
+def validate_id_token(id_token, client_id, intuit_issuer, jwk_uri, codec=None, session=None, jwk_cache=None, transport=None):
     """Validates ID Token returned by Intuit
     
     :param id_token: ID Token
     :param client_id: Client ID
     :param intuit_issuer: Intuit Issuer
     :param jwk_uri: JWK URI
+    :param codec: JSON codec instance or name, defaults to None (library default)
+    :param session: `requests.Session` used to fetch JWKS, defaults to None
+    :param jwk_cache: `intuitlib.jwks.JWKCache` to look up the key in, defaults to None (fetch every call)
+    :param transport: `intuitlib.transport.Transport` used to fetch JWKS, defaults to None (`requests` using session)
     :return: True/False
     """
 
-    id_token_parts = id_token.split('.')
-    if len(id_token_parts) < 3:
-        return False
+    codec = get_codec(codec)
 
-    id_token_header = json.loads(b64decode(_correct_padding(id_token_parts[0])).decode('ascii'))
-    id_token_payload = json.loads(b64decode(_correct_padding(id_token_parts[1])).decode('ascii'))
-
-    if id_token_payload['iss'] != intuit_issuer:
-        return False
-    elif id_token_payload['aud'][0] != client_id:
+    id_token_header = _check_id_token_claims(id_token, client_id, intuit_issuer, codec, _current_time())
+    if id_token_header is None:
         return False
 
-    current_time = (datetime.utcnow() - datetime(1970, 1, 1)).total_seconds()
-    if id_token_payload['exp'] < current_time:
-        return False
-
-    public_key = get_jwk(id_token_header['kid'], jwk_uri).key
+    public_key = get_jwk(id_token_header['kid'], jwk_uri, codec=codec, session=session, cache=jwk_cache, transport=transport).key
     try:
         jwt.decode(id_token, public_key, audience=client_id, algorithms=['RS256'])
         return True
     except jwt.PyJWTError:
         return False
 
-def get_jwk(kid, jwk_uri):
+def validate_id_tokens(id_tokens, client_id, intuit_issuer, jwk_uri, codec=None, session=None, jwk_cache=None, transport=None, processes=None, chunksize=256, executor=None):
+    """Validates many ID Tokens, verifying signatures across a process pool
+
+    Claims (iss, aud, exp) are checked first so failing tokens never reach the pool, each kid is resolved once
+    and the tokens of a chunk are sent to the pool grouped by kid. Results are streamed in input order.
+
+    :param id_tokens: iterable of ID Tokens
+    :param client_id: Client ID
+    :param intuit_issuer: Intuit Issuer
+    :param jwk_uri: JWK URI
+    :param codec: JSON codec instance or name, defaults to None (library default)
+    :param session: `requests.Session` used to fetch JWKS, defaults to None
+    :param jwk_cache: `intuitlib.jwks.JWKCache` to look up keys in, defaults to None (JWKS fetched once for this call)
+    :param transport: `intuitlib.transport.Transport` used to fetch JWKS, defaults to None (`requests` using session)
+    :param processes: Number of worker processes, defaults to None (number of CPUs)
+    :param chunksize: Number of tokens read from id_tokens per batch, defaults to 256
+    :param executor: `concurrent.futures.Executor` to use instead of creating a process pool, defaults to None
+    :return: generator of True/False, one per token in input order
+    """
+
+    codec = get_codec(codec)
+    if jwk_cache is None:
+        jwk_cache = JWKCache()
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=processes)
+    max_pending = 2 * (processes or os.cpu_count() or 1)
+
+    public_keys = {}
+    def get_public_key(kid):
+        if kid not in public_keys:
+            try:
+                key = get_jwk(kid, jwk_uri, codec=codec, session=session, cache=jwk_cache, transport=transport).key
+                public_keys[kid] = key.public_bytes(Encoding.PEM, PublicFormat.SubjectPublicKeyInfo)
+            except KeyError:
+                public_keys[kid] = None
+        return public_keys[kid]
+
+    def submit(chunk):
+        results = [False] * len(chunk)
+        current_time = _current_time()
+        groups = {}
+        for index, id_token in enumerate(chunk):
+            try:
+                header = _check_id_token_claims(id_token, client_id, intuit_issuer, codec, current_time)
+                public_key = get_public_key(header['kid']) if header is not None else None
+            except (ValueError, TypeError, KeyError, IndexError):
+                continue
+            if public_key is not None:
+                indexes, tokens = groups.setdefault(public_key, ([], []))
+                indexes.append(index)
+                tokens.append(id_token)
+
+        futures = [(indexes, executor.submit(_verify_id_token_signatures, public_key, client_id, tokens))
+            for public_key, (indexes, tokens) in groups.items()]
+        return results, futures
+
+    def collect(results, futures):
+        for indexes, future in futures:
+            for index, is_valid in zip(indexes, future.result()):
+                results[index] = is_valid
+        return results
+
+    pending = deque()
+    try:
+        chunk = []
+        for id_token in id_tokens:
+            chunk.append(id_token)
+            if len(chunk) == chunksize:
+                pending.append(submit(chunk))
+                chunk = []
+            while len(pending) > max_pending:
+                for is_valid in collect(*pending.popleft()):
+                    yield is_valid
+        if chunk:
+            pending.append(submit(chunk))
+        while pending:
+            for is_valid in collect(*pending.popleft()):
+                yield is_valid
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+
+def get_jwk(kid, jwk_uri, codec=None, session=None, cache=None, transport=None):
     """Get JWK for public key information
     
     :param kid: KID
     :param jwk_uri: JWK URI
+    :param codec: JSON codec instance or name, defaults to None (library default)
+    :param session: `requests.Session` object if a session is already being used, defaults to None
+    :param cache: `intuitlib.jwks.JWKCache` to look up the key in, defaults to None (fetch every call)
+    :param transport: `intuitlib.transport.Transport` to send the request with, defaults to None (`requests` using session)
 
     :raises HTTPError: if response status != 200
     :return: Algorithm with the key loaded.
     """
 
-    response = requests.get(jwk_uri)
+    if cache is not None:
+        return cache.get(kid, jwk_uri, lambda uri: get_jwks(uri, codec=codec, session=session, transport=transport))
+    return jwt.PyJWKSet.from_dict(get_jwks(jwk_uri, codec=codec, session=session, transport=transport))[kid]
+
+def get_jwks(jwk_uri, codec=None, session=None, transport=None):
+    """Get JWKS document
+
+    :param jwk_uri: JWK URI
+    :param codec: JSON codec instance or name, defaults to None (library default)
+    :param session: `requests.Session` object if a session is already being used, defaults to None
+    :param transport: `intuitlib.transport.Transport` to send the request with, defaults to None (`requests` using session)
+
+    :raises HTTPError: if response status != 200
+    :return: JWKS document as dict
+    """
+
+    response = _get(jwk_uri, 'jwks', session, transport)
     if response.status_code != 200:
         raise AuthClientError(response)
-    data = response.json()
-    return jwt.PyJWKSet.from_dict(data)[kid]
+    return get_codec(codec).response_json(response)
+
+def _get(url, endpoint, session, transport):
+    """Sends GET request for discovery doc or JWKS, logged with the library default call logger
+    """
+
+    call_logger = get_call_logger()
+    if not call_logger.enabled():
+        return get_transport(transport, session).request('GET', url)
+    started = time.monotonic()
+    try:
+        response = get_transport(transport, session).request('GET', url)
+    except Exception as e:
+        call_logger.log_call('GET', url, endpoint, {}, None, time.monotonic() - started, error=e)
+        raise
+    call_logger.log_call('GET', url, endpoint, {}, None, time.monotonic() - started, response)
+    return response
+
+def _current_time():
+    return (datetime.utcnow() - datetime(1970, 1, 1)).total_seconds()
+
+def _check_id_token_claims(id_token, client_id, intuit_issuer, codec, current_time):
+    """Checks ID Token structure, issuer, audience and expiry without verifying the signature
+
+    :return: ID Token header if checks pass, else None
+    """
+
+    id_token_parts = id_token.split('.')
+    if len(id_token_parts) < 3:
+        return None
+
+    id_token_header = codec.loads(b64decode(_correct_padding(id_token_parts[0])))
+    id_token_payload = codec.loads(b64decode(_correct_padding(id_token_parts[1])))
+
+    if id_token_payload['iss'] != intuit_issuer:
+        return None
+    elif id_token_payload['aud'][0] != client_id:
+        return None
+
+    if id_token_payload['exp'] < current_time:
+        return None
+    return id_token_header
+
+_worker_public_keys = {}
+
+def _verify_id_token_signatures(public_key_pem, client_id, id_tokens):
+    """Verifies RS256 signatures of ID Tokens signed by one key, runs in pool workers
+
+    :param public_key_pem: PEM encoded public key
+    :param client_id: Client ID
+    :param id_tokens: list of ID Tokens
+    :return: list of True/False
+    """
+
+    public_key = _worker_public_keys.get(public_key_pem)
+    if public_key is None:
+        public_key = _worker_public_keys[public_key_pem] = load_pem_public_key(public_key_pem)
+
+    results = []
+    for id_token in id_tokens:
+        try:
+            jwt.decode(id_token, public_key, audience=client_id, algorithms=['RS256'])
+            results.append(True)
+        except jwt.PyJWTError:
+            results.append(False)
+    return results
 
 def _correct_padding(val):
     """Correct padding for JWT
@@ -36,6 +36,14 @@ setup(
         'six>=1.10.0',
         'enum-compat',
     ],
+    entry_points={
+        'console_scripts': ['intuit-oauth=intuitlib.cli:main'],
+    },
+    extras_require={
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'http2': ['httpx[http2]'],
+    },
     license='Apache 2.0',
     keywords='intuit quickbooks oauth auth openid client'
 )
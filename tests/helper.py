@@ -11,9 +11,18 @@
  # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
  # See the License for the specific language governing permissions and
  # limitations under the License.
-"""Helper module with MockResponse object
+"""Helper module with MockResponse object and a discovery doc of placeholder endpoints
 """
 
+DISCOVERY_DOC = {
+    'authorization_endpoint': 'https://auth',
+    'token_endpoint': 'https://token',
+    'revocation_endpoint': 'https://revoke',
+    'issuer': 'https://issuer',
+    'jwks_uri': 'https://jwks',
+    'userinfo_endpoint': 'https://userinfo',
+}
+
 class MockResponse():
     
     def __init__(self, status=200, content=None):
@@ -0,0 +1,55 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for benchmarks.bench_hot_paths, fails if a hot path regressed against the stored baseline
+"""
+
+import pytest
+
+from benchmarks.bench_hot_paths import BENCHMARKS, compare, load_baseline, run
+
+# timings on shared CI machines vary, only large slowdowns fail here, allocations are checked strictly when the
+# baseline was recorded on the same Python version
+TIME_TOLERANCE = 3.0
+
+class TestHotPaths():
+
+    def test_baseline_covers_benchmarks(self):
+        assert sorted(load_baseline()['benchmarks']) == sorted(name for name, _, _ in BENCHMARKS)
+
+    def test_no_regression(self):
+        results = run(scale=0.2, repeat=3)
+
+        assert compare(results, load_baseline(), time_tolerance=TIME_TOLERANCE) == []
+
+    def test_compare(self):
+        baseline = {'benchmarks': {'op': {'time_us': 1.0, 'relative': 0.1, 'alloc_bytes': 1000}}}
+        slower = {'benchmarks': {'op': {'time_us': 3.0, 'relative': 0.3, 'alloc_bytes': 1000}}}
+        larger = {'benchmarks': {'op': {'time_us': 1.0, 'relative': 0.1, 'alloc_bytes': 2000}, 'new': {'time_us': 1.0, 'relative': 1, 'alloc_bytes': 1}}}
+
+        assert compare(baseline, baseline) == []
+        assert compare(slower, baseline)[0].startswith('op: time 3.00x')
+        assert compare(larger, baseline) == ['op: allocations 2000 bytes, baseline 1000 bytes']
+
+    def test_compare_allocations_same_python_only(self):
+        baseline = {'python': '3.11', 'benchmarks': {'op': {'time_us': 1.0, 'relative': 0.1, 'alloc_bytes': 1000}}}
+        larger = {'python': '3.12', 'benchmarks': {'op': {'time_us': 1.0, 'relative': 0.1, 'alloc_bytes': 2000}}}
+
+        assert compare(larger, baseline) == []
+        larger['python'] = '3.11'
+        assert compare(larger, baseline) == ['op: allocations 2000 bytes, baseline 1000 bytes']
+
+if __name__ == '__main__':
+    pytest.main()
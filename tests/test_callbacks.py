@@ -0,0 +1,201 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.callbacks
+"""
+
+import json
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from intuitlib.callbacks import STAGES, CallbackPipeline
+from intuitlib.client import AuthClient
+from intuitlib.exceptions import AuthClientError
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+@pytest.fixture(scope='module')
+def signing_keys():
+    private_key, other_key = [rsa.generate_private_key(public_exponent=65537, key_size=2048) for _ in range(2)]
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update({'kid': 'kid1', 'alg': 'RS256', 'use': 'sig'})
+    return private_key, other_key, jwk
+
+@pytest.fixture
+def transport(signing_keys):
+    private_key, other_key, jwk = signing_keys
+    payload = {'aud': ['clientId'], 'iss': 'https://issuer', 'exp': int(time.time()) + 3600, 'sub': 'user'}
+    id_token = jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': 'kid1'})
+    # same kid, signed with a key that is not in the JWKS
+    forged_id_token = jwt.encode(payload, other_key, algorithm='RS256', headers={'kid': 'kid1'})
+
+    def token_handler(method, url, headers, data):
+        if 'code=bad' in data:
+            return Response(400, b'{"error": "invalid_grant"}', {'intuit_tid': 'tid'})
+        code = data.split('code=')[1].split('&')[0]
+        body = {'access_token': 'access-' + code, 'refresh_token': 'refresh-' + code, 'expires_in': 3600,
+            'id_token': forged_id_token if code == 'forged' else id_token}
+        return Response(200, json.dumps(body).encode('utf-8'))
+
+    transport = InMemoryTransport(handler=token_handler)
+    transport.add_route('GET', 'https://jwks', json_body={'keys': [jwk]})
+    return transport
+
+class TestCallbackPipeline():
+
+    def pipeline(self, transport, persist=None, **kwargs):
+        def client_factory(realm_id):
+            return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+                discovery_doc=DISCOVERY_DOC, transport=transport)
+
+        issued = set('state{0}'.format(i) for i in range(100))
+        lock = threading.Lock()
+
+        def verify_state(state, realm_id):
+            with lock:
+                if state in issued:
+                    issued.remove(state)
+                    return True
+                return False
+
+        self.persisted = []
+        return CallbackPipeline(client_factory, verify_state, persist or self.persisted.append, **kwargs)
+
+    def test_burst(self, transport):
+        with self.pipeline(transport) as pipeline:
+            futures = []
+
+            def handler(start):
+                for i in range(start, start + 10):
+                    futures.append(pipeline.submit('code{0}'.format(i), 'state{0}'.format(i), realm_id=str(i)))
+
+            handlers = [threading.Thread(target=handler, args=(start,)) for start in range(0, 50, 10)]
+            for thread in handlers:
+                thread.start()
+            for thread in handlers:
+                thread.join()
+            results = [future.result(timeout=10) for future in futures]
+
+        assert len(results) == 50
+        for result in results:
+            assert result.error is None
+            assert result.id_token_valid is True
+            assert result.tokens.access_token == 'access-code' + result.realm_id
+            assert result.tokens.realm_id == result.realm_id
+            assert result.tokens.id_token is not None
+            assert set(result.latencies) == set(STAGES + ('total',))
+        assert sorted(result.realm_id for result in self.persisted) == sorted(str(i) for i in range(50))
+
+        # keys are fetched for the burst once, or once per validate thread racing on the cold cache
+        assert 1 <= sum(1 for request in transport.requests if request[1] == 'https://jwks') <= 2
+
+        stats = pipeline.stats()
+        assert stats['submitted'] == stats['completed'] == 50
+        assert stats['in_flight'] == 0
+        for name in STAGES:
+            assert stats['stages'][name]['processed'] == 50
+            assert stats['stages'][name]['failed'] == 0
+            assert stats['stages'][name]['latency_ms']['max'] >= stats['stages'][name]['latency_ms']['p50']
+
+    def test_failed_stages(self, transport):
+        with self.pipeline(transport) as pipeline:
+            unknown_state = pipeline.submit('code1', 'unknown').result(timeout=10)
+            bad_code = pipeline.submit('bad', 'state1').result(timeout=10)
+            forged = pipeline.submit('forged', 'state2').result(timeout=10)
+
+        assert unknown_state.failed_stage == 'state'
+        assert isinstance(unknown_state.error, ValueError)
+        assert unknown_state.tokens is None
+
+        assert bad_code.failed_stage == 'redeem'
+        assert isinstance(bad_code.error, AuthClientError)
+
+        # like get_bearer_token, tokens are kept without the invalid ID token
+        assert forged.error is None
+        assert forged.id_token_valid is False
+        assert forged.tokens.access_token == 'access-forged'
+        assert forged.tokens.id_token is None
+
+        assert [result.state for result in self.persisted] == ['state2']
+        assert not any('code1' in (request[3] or '') for request in transport.requests)
+        assert pipeline.stats()['stages']['state']['failed'] == 1
+
+    def test_validation_error_keeps_tokens(self, transport):
+        transport.add_route('GET', 'https://jwks', status=500)
+        with self.pipeline(transport) as pipeline:
+            result = pipeline.submit('code1', 'state1', realm_id='1').result(timeout=10)
+
+        assert result.error is None
+        assert result.id_token_valid is False
+        assert result.tokens.access_token == 'access-code1'
+        assert result.tokens.id_token is None
+        assert [persisted.realm_id for persisted in self.persisted] == ['1']
+
+    def test_close_during_submits(self, transport):
+        pipeline = self.pipeline(transport)
+        futures = []
+        refused = []
+
+        def handler(start):
+            for i in range(start, start + 20):
+                try:
+                    futures.append(pipeline.submit('code{0}'.format(i), 'state{0}'.format(i)))
+                except RuntimeError:
+                    refused.append(i)
+
+        handlers = [threading.Thread(target=handler, args=(start,)) for start in range(0, 100, 20)]
+        for thread in handlers:
+            thread.start()
+        pipeline.close()
+        for thread in handlers:
+            thread.join()
+
+        assert len(futures) + len(refused) == 100
+        # every accepted callback completes, none is stranded behind the stop sentinels
+        assert all(future.result(timeout=10) is not None for future in futures)
+
+    def test_backpressure(self, transport):
+        release = threading.Event()
+
+        def slow_persist(result):
+            release.wait(10)
+
+        pipeline = self.pipeline(transport, persist=slow_persist, threads={'persist': 1}, queue_size=1)
+        futures = []
+        with pytest.raises(queue.Full):
+            for i in range(20):
+                futures.append(pipeline.submit('code{0}'.format(i), 'state{0}'.format(i), timeout=0.5))
+
+        # one callback in every stage and every queue, the rest is held back at submit
+        assert len(futures) < 20
+        release.set()
+        pipeline.close()
+        assert all(future.result(timeout=10).error is None for future in futures)
+        assert pipeline.stats()['stages']['persist']['wait_ms']['max'] > 0
+
+        with pytest.raises(RuntimeError):
+            pipeline.submit('code', 'state0')
+
+if __name__ == '__main__':
+    pytest.main()
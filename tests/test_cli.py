@@ -0,0 +1,100 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.cli
+"""
+
+import io
+import json
+
+import pytest
+
+from intuitlib.cli import Stats, main, read_records
+from intuitlib.config import DISCOVERY_URL
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+def token_handler(method, url, headers, data):
+    if 'dead' in data:
+        return Response(400, b'{"error": "invalid_grant"}', {'intuit_tid': 'tid'})
+    return Response(200, json.dumps({'access_token': 'new_access', 'refresh_token': 'new_refresh', 'expires_in': 3600}).encode('utf-8'))
+
+class TestCli():
+
+    def transport(self):
+        transport = InMemoryTransport(handler=token_handler)
+        transport.add_route('GET', DISCOVERY_URL['sandbox'], json_body=DISCOVERY_DOC)
+        transport.add_route('POST', 'https://revoke')
+        return transport
+
+    def run(self, tmpdir, operation, records, extension='jsonl', extra=()):
+        input_path = tmpdir.join('input.' + extension)
+        input_path.write(records)
+        output_path = tmpdir.join('output.jsonl')
+        argv = [operation, '-i', str(input_path), '-o', str(output_path), '--client-id', 'id', '--client-secret', 'secret'] + list(extra)
+        code = main(argv, transport=self.transport())
+        results = [json.loads(line) for line in output_path.readlines()]
+        return code, sorted(results, key=lambda result: result['index'])
+
+    def test_refresh_jsonl(self, tmpdir, capsys):
+        records = '\n'.join(json.dumps({'realm_id': str(i), 'refresh_token': 'dead' if i == 3 else 'ok'}) for i in range(5))
+        code, results = self.run(tmpdir, 'refresh', records, extra=['-c', '2'])
+
+        assert code == 1
+        assert [result['ok'] for result in results] == [True, True, True, False, True]
+        assert results[0]['access_token'] == 'new_access'
+        assert results[3]['status'] == 400
+        assert results[3]['intuit_tid'] == 'tid'
+        summary = json.loads(capsys.readouterr().err)
+        assert summary['total'] == 5
+        assert summary['failed'] == 1
+        assert set(summary['latency_ms']) == set(['p50', 'p90', 'p99', 'max'])
+
+    def test_revoke_csv(self, tmpdir):
+        code, results = self.run(tmpdir, 'revoke', 'realm_id,token\n1,abc\n2,def\n', extension='csv', extra=['--rate', '1000'])
+
+        assert code == 0
+        assert [result['realm_id'] for result in results] == ['1', '2']
+
+    def test_refresh_adaptive(self, tmpdir, capsys):
+        records = '\n'.join(json.dumps({'realm_id': str(i), 'refresh_token': 'ok'}) for i in range(20))
+        code, results = self.run(tmpdir, 'refresh', records, extra=['-c', '2', '--adaptive', '--max-concurrency', '4'])
+
+        assert code == 0
+        assert len(results) == 20
+        concurrency = json.loads(capsys.readouterr().err)['concurrency']
+        assert concurrency['successes'] == 20
+        assert 2 <= concurrency['limit'] <= 4
+        assert concurrency['in_flight'] == 0
+
+    def test_missing_credentials(self, capsys):
+        assert main(['refresh', '--client-id', '', '--client-secret', '']) == 2
+
+    def test_read_records(self):
+        assert list(read_records(io.StringIO(u'realm_id,refresh_token\n1,\n'), 'csv')) == [{'realm_id': '1'}]
+        assert list(read_records(io.StringIO(u'{"realm_id": "1"}\n\n'), 'jsonl')) == [{'realm_id': '1'}]
+
+    def test_stats(self):
+        stats = Stats()
+        for latency in range(1, 101):
+            stats.record(latency != 100, latency / 1000.0)
+
+        summary = stats.summary()
+        assert (summary['ok'], summary['failed']) == (99, 1)
+        assert summary['latency_ms']['p50'] == 51.0
+        assert summary['latency_ms']['max'] == 100.0
+
+if __name__ == '__main__':
+    pytest.main()
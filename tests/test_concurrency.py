@@ -0,0 +1,124 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.concurrency
+"""
+
+import threading
+
+import pytest
+
+from intuitlib.client import AuthClient
+from intuitlib.concurrency import AdaptiveLimiter
+from intuitlib.exceptions import AuthClientError, RateLimitExceededError
+from intuitlib.transport import InMemoryTransport
+from tests.helper import DISCOVERY_DOC
+
+def saturate(limiter):
+    return [limiter.acquire() for _ in range(limiter.limit)]
+
+class TestAdaptiveLimiter():
+
+    def test_invalid_limits(self):
+        with pytest.raises(ValueError):
+            AdaptiveLimiter(initial=10, max_limit=5)
+        with pytest.raises(ValueError):
+            AdaptiveLimiter(backoff=1)
+
+    def test_additive_increase_when_saturated(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=3)
+        for _ in range(3):
+            for started in saturate(limiter):
+                limiter.release(started, 200)
+        assert limiter.limit == 3
+
+        for _ in range(10):
+            for started in saturate(limiter):
+                limiter.release(started, 200)
+        assert limiter.limit == 3
+
+        # calls below the limit do not raise it
+        limiter = AdaptiveLimiter(initial=4)
+        for _ in range(20):
+            limiter.release(limiter.acquire(), 200)
+        assert limiter.limit == 4
+
+    def test_multiplicative_decrease_once_per_latency(self):
+        limiter = AdaptiveLimiter(initial=16)
+        slots = saturate(limiter)
+        for started in slots[:8]:
+            limiter.release(started - 1, 503)
+
+        metrics = limiter.metrics()
+        assert limiter.limit == 8
+        assert (metrics['overloads'], metrics['decreases'], metrics['in_flight']) == (8, 1, 8)
+
+        limiter.release(slots[8], None)
+        limiter._next_decrease = 0
+        limiter.release(slots[9], 429)
+        assert limiter.limit == 4
+
+    def test_client_errors_not_overload(self):
+        limiter = AdaptiveLimiter(initial=4)
+        limiter.release(limiter.acquire(), 400)
+
+        assert limiter.limit == 4
+        assert limiter.metrics()['successes'] == 1
+
+    def test_retry_after_pauses(self):
+        limiter = AdaptiveLimiter(initial=4, timeout=0.05)
+        limiter.release(limiter.acquire(), 429, '10')
+
+        assert limiter.metrics()['paused_s'] > 9
+        with pytest.raises(RateLimitExceededError) as e:
+            limiter.acquire()
+        assert e.value.retry_after > 9
+
+    def test_wait_for_slot(self):
+        limiter = AdaptiveLimiter(initial=1)
+        started = limiter.acquire()
+        with pytest.raises(RateLimitExceededError):
+            limiter.acquire(timeout=0.01)
+
+        threading.Timer(0.05, limiter.release, (started, 200)).start()
+        limiter.acquire(timeout=5)
+        assert limiter.in_flight == 1
+
+    def test_rising_p99(self):
+        limiter = AdaptiveLimiter(initial=8, window=10)
+        for _ in range(10):
+            limiter.release(limiter.acquire() - 0.01, 200)
+        assert limiter.metrics()['healthy_p99_ms'] >= 10
+
+        for _ in range(10):
+            limiter.release(limiter.acquire() - 0.1, 200)
+        assert limiter.limit == 4
+        assert limiter.metrics()['decreases'] == 1
+
+    def test_client_releases_slots(self):
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token', status=503, headers={'Retry-After': '0'})
+        limiter = AdaptiveLimiter(initial=4)
+        client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport, refresh_token='refresh', concurrency_limiter=limiter)
+
+        with pytest.raises(AuthClientError):
+            client.refresh()
+
+        assert limiter.in_flight == 0
+        assert limiter.limit == 2
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,144 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.deadtokens
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from intuitlib.client import AuthClient
+from intuitlib.deadtokens import DeadTokenCache
+from intuitlib.exceptions import AuthClientError, DeadRefreshTokenError
+from intuitlib.jsoncodec import get_codec
+from intuitlib.tokencache import SharedTokenCache
+from intuitlib.tokens import FLAG_DEAD, TokenSet
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+def make_client(transport, **kwargs):
+    return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+        discovery_doc=DISCOVERY_DOC, transport=transport, **kwargs)
+
+def error_transport(status, error):
+    transport = InMemoryTransport()
+    transport.add_route('POST', 'https://token', status=status, json_body={'error': error})
+    return transport
+
+class TestDeadTokenCache():
+
+    def test_add_check(self):
+        cache = DeadTokenCache(ttl=60)
+        cache.add('refresh', error='invalid_grant')
+
+        with pytest.raises(DeadRefreshTokenError) as e:
+            cache.check('refresh', 'realm')
+        assert e.value.error == 'invalid_grant'
+        assert 0 < e.value.retry_after <= 60
+        cache.check('other')
+
+        cache.discard('refresh')
+        cache.check('refresh')
+        assert cache.stats() == {'hits': 1, 'misses': 2, 'tokens': 0}
+
+    def test_expired(self):
+        cache = DeadTokenCache(ttl=0)
+        cache.add('refresh')
+
+        assert cache.get('refresh') is None
+        assert cache.stats()['tokens'] == 0
+
+    def test_maxsize(self):
+        cache = DeadTokenCache(maxsize=2)
+        for token in ['a', 'b', 'c']:
+            cache.add(token)
+
+        assert cache.get('a') is None
+        assert cache.get('c') is not None
+
+    def test_add_error(self):
+        cache = DeadTokenCache()
+        codec = get_codec()
+        response = Response(400, json.dumps({'error': 'invalid_grant'}).encode('utf-8'))
+        server_error = Response(503, b'unavailable')
+
+        assert cache.add_error('refresh', None, AuthClientError(response), codec)
+        assert not cache.add_error('other', None, AuthClientError(server_error), codec)
+        assert not cache.add_error('other', None, AuthClientError(Response(400, b'not json')), codec)
+        assert cache.get('other') is None
+
+    def test_imports_without_fcntl(self):
+        # as on Windows, where only the shared token cache is unavailable
+        code = "import sys; sys.modules['fcntl'] = None; import intuitlib.deadtokens, intuitlib.orchestrator"
+        assert subprocess.call([sys.executable, '-c', code]) == 0
+
+    def test_client_refresh_skipped(self):
+        transport = error_transport(400, 'invalid_grant')
+        client = make_client(transport, refresh_token='dead', dead_token_cache=DeadTokenCache())
+
+        with pytest.raises(AuthClientError):
+            client.refresh()
+        with pytest.raises(DeadRefreshTokenError):
+            client.refresh()
+        assert len(transport.requests) == 1
+
+    def test_client_retryable_error(self):
+        transport = error_transport(400, 'invalid_request')
+        client = make_client(transport, refresh_token='refresh', dead_token_cache=DeadTokenCache())
+
+        for _ in range(2):
+            with pytest.raises(AuthClientError):
+                client.refresh()
+        assert len(transport.requests) == 2
+
+    def test_shared_through_token_store(self, tmpdir):
+        store = SharedTokenCache(str(tmpdir.join('tokens')))
+        store.put('realm', TokenSet(access_token='access', refresh_token='dead', realm_id='realm'))
+        DeadTokenCache(token_store=store).add('dead', 'realm')
+
+        tokens, flags, _ = store.get_record('realm')
+        assert flags == FLAG_DEAD
+        assert tokens.access_token == 'access'
+
+        transport = error_transport(400, 'invalid_grant')
+        client = make_client(transport, refresh_token='dead', realm_id='realm', token_store=store,
+            dead_token_cache=DeadTokenCache(token_store=store))
+        with pytest.raises(DeadRefreshTokenError):
+            client.refresh()
+        assert not transport.requests
+
+        # new tokens written for the realm clear the flag
+        client.update_tokens(refresh_token='new')
+        assert store.get_record('realm')[1] == 0
+        store.close()
+
+    def test_token_store_rotated(self, tmpdir):
+        store = SharedTokenCache(str(tmpdir.join('tokens')))
+        store.put('realm', TokenSet(refresh_token='current', realm_id='realm'))
+        cache = DeadTokenCache(token_store=store)
+        cache.add('stale', 'realm')
+
+        assert store.get_record('realm')[1] == 0
+        assert DeadTokenCache(token_store=store).get('current', 'realm') is None
+
+        cache.add('dead', 'other')
+        assert store.get_record('other')[1] == FLAG_DEAD
+        store.close()
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,143 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.endpoints
+"""
+
+import json
+import time
+
+import pytest
+import mock
+
+from intuitlib.client import AuthClient
+from intuitlib.config import KNOWN_ENDPOINTS
+from intuitlib.endpoints import EndpointConfig, Endpoints
+from intuitlib.exceptions import AuthClientError
+from tests.helper import DISCOVERY_DOC, MockResponse
+
+def make_client(endpoint_config):
+    return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox', endpoint_config=endpoint_config)
+
+class TestEndpoints():
+
+    def test_from_discovery_doc(self):
+        endpoints = Endpoints.from_discovery_doc(DISCOVERY_DOC)
+
+        assert endpoints.token_endpoint == 'https://token'
+        assert endpoints.user_info_url == 'https://userinfo'
+        assert endpoints.version == 1
+
+    @mock.patch('intuitlib.endpoints.get_discovery_doc', return_value=DISCOVERY_DOC)
+    def test_shared_config_refresh(self, mock_discovery):
+        config = EndpointConfig('sandbox')
+        clients = [make_client(config) for _ in range(3)]
+        mock_discovery.return_value = dict(DISCOVERY_DOC, token_endpoint='https://moved')
+
+        assert config.refresh()
+        assert not config.refresh()
+        assert [client.token_endpoint for client in clients] == ['https://moved'] * 3
+        assert config.version == 2
+        assert mock_discovery.call_count == 3
+
+    def test_update(self):
+        config = EndpointConfig('sandbox', DISCOVERY_DOC)
+        client = make_client(config)
+        config.update(user_info_url='https://moved')
+
+        assert client.user_info_url == 'https://moved'
+        assert config.version == 2
+
+    def test_set_authorize_urls_detaches(self):
+        config = EndpointConfig('sandbox', DISCOVERY_DOC)
+        client = make_client(config)
+        other = make_client(config)
+
+        client.setAuthorizeURLs({
+            'auth_endpoint': 'https://custom/auth',
+            'token_endpoint': 'https://custom/token',
+            'revoke_endpoint': 'https://custom/revoke',
+            'user_info_url': 'https://custom/userinfo',
+        })
+        client.jwks_uri = 'https://custom/jwks'
+
+        assert client.token_endpoint == 'https://custom/token'
+        assert client.jwks_uri == 'https://custom/jwks'
+        assert client.issuer_uri == 'https://issuer'
+        assert other.token_endpoint == 'https://token'
+        assert config.version == 1
+
+    @mock.patch('intuitlib.endpoints.get_discovery_doc', return_value=DISCOVERY_DOC)
+    def test_auto_refresh(self, mock_discovery):
+        config = EndpointConfig('sandbox')
+        mock_discovery.side_effect = [AuthClientError(MockResponse(status=500)), dict(DISCOVERY_DOC, issuer='https://new')]
+        config.start_auto_refresh(interval=0.01)
+
+        deadline = time.time() + 5
+        while config.version == 1 and time.time() < deadline:
+            time.sleep(0.01)
+        config.stop_auto_refresh()
+
+        assert config.endpoints.issuer_uri == 'https://new'
+        assert config.last_error is None
+
+    @mock.patch('intuitlib.endpoints.get_discovery_doc')
+    def test_pinned_builtin(self, mock_discovery):
+        sandbox = EndpointConfig.pinned('sandbox')
+        production = EndpointConfig.pinned('prod')
+
+        assert sandbox.endpoints.user_info_url == 'https://sandbox-accounts.platform.intuit.com/v1/openid_connect/userinfo'
+        assert production.endpoints.user_info_url == 'https://accounts.platform.intuit.com/v1/openid_connect/userinfo'
+        assert production.endpoints.issuer_uri == 'https://oauth.platform.intuit.com/op/v1'
+        assert not mock_discovery.called
+        with pytest.raises(ValueError):
+            EndpointConfig.pinned('https://custom/discovery')
+
+    def test_pinned_file(self, tmpdir):
+        path = str(tmpdir.join('endpoints.json'))
+        EndpointConfig('sandbox', dict(DISCOVERY_DOC, token_endpoint='https://pinned')).save(path)
+
+        assert EndpointConfig.pinned('sandbox', path).endpoints.token_endpoint == 'https://pinned'
+        assert json.load(open(path)) == dict(DISCOVERY_DOC, token_endpoint='https://pinned')
+
+    def test_pinned_dict_field_names(self):
+        endpoints = Endpoints.from_discovery_doc(DISCOVERY_DOC)._asdict()
+        del endpoints['version']
+
+        assert EndpointConfig.pinned('sandbox', endpoints).endpoints == Endpoints.from_discovery_doc(DISCOVERY_DOC)
+
+    @mock.patch('intuitlib.endpoints.get_discovery_doc')
+    def test_client_from_pinned_endpoints(self, mock_discovery):
+        client = AuthClient.from_pinned_endpoints('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'production', realm_id='realm')
+
+        assert client.token_endpoint == KNOWN_ENDPOINTS['production']['token_endpoint']
+        assert client.realm_id == 'realm'
+        assert client.endpoint_config.session is client
+        assert not mock_discovery.called
+
+    @mock.patch('intuitlib.endpoints.get_discovery_doc', return_value=dict(DISCOVERY_DOC, token_endpoint='https://discovered'))
+    def test_pinned_lazy_refresh(self, mock_discovery):
+        client = AuthClient.from_pinned_endpoints('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox', lazy_refresh=True)
+        assert not mock_discovery.called
+
+        assert client.token_endpoint == KNOWN_ENDPOINTS['sandbox']['token_endpoint']
+        deadline = time.time() + 5
+        while client.endpoint_config.version == 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert client.token_endpoint == 'https://discovered'
+        assert mock_discovery.call_count == 1
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,185 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.hedging
+"""
+
+import threading
+import time
+
+import pytest
+
+from intuitlib.client import AuthClient
+from intuitlib.hedging import HedgingTransport
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+class SlowFirstCall():
+    """Answers the first call after `slow` seconds and every later call right away
+    """
+
+    def __init__(self, slow=1.0, status=200):
+        self.slow = slow
+        self.status = status
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, headers, data):
+        with self.lock:
+            self.calls.append((method, url))
+            first = len(self.calls) == 1
+        if first:
+            time.sleep(self.slow)
+            return Response(self.status, b'{"call": 1}')
+        return Response(self.status, b'{"call": 2}')
+
+class TestHedgingTransport():
+
+    def test_backup_answers_first(self):
+        handler = SlowFirstCall()
+        transport = HedgingTransport(InMemoryTransport(handler=handler), initial_delay=0.05)
+
+        start = time.monotonic()
+        response = transport.request('GET', 'https://userinfo')
+
+        assert time.monotonic() - start < 0.5
+        assert response.json() == {'call': 2}
+        assert len(handler.calls) == 2
+        assert transport.stats() == {'requests': 1, 'hedged': 1, 'backup_wins': 1, 'budget_exhausted': 0}
+        transport.close()
+
+    def test_records_primary_latency(self):
+        transport = HedgingTransport(InMemoryTransport(handler=SlowFirstCall(slow=0.3)), initial_delay=0.05)
+
+        assert transport.request('GET', 'https://userinfo').json() == {'call': 2}
+        assert 'https://userinfo' not in transport._latencies
+
+        # the slow primary that lost is still sampled, so the hedging delay does not drift down
+        assert wait_until(lambda: 'https://userinfo' in transport._latencies)
+        assert list(transport._latencies['https://userinfo'])[0] >= 0.3
+        transport.close()
+
+    def test_delay_counts_from_send(self):
+        transport = HedgingTransport(InMemoryTransport(handler=lambda *args: time.sleep(0.1) or Response(200)),
+            initial_delay=0.15, max_primary_workers=1)
+        threads = [threading.Thread(target=transport.request, args=('GET', 'https://jwks')) for _ in range(3)]
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert transport.stats()['hedged'] == 0
+        transport.close()
+
+    def test_primaries_not_capped_by_backup_workers(self):
+        transport = HedgingTransport(InMemoryTransport(handler=lambda *args: time.sleep(0.2) or Response(200)),
+            initial_delay=1.0, max_workers=1, max_primary_workers=4)
+        threads = [threading.Thread(target=transport.request, args=('GET', 'https://jwks')) for _ in range(4)]
+
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert time.monotonic() - start < 0.6
+        assert transport.stats()['hedged'] == 0
+        transport.close()
+
+    def test_primary_on_caller_thread_without_budget(self):
+        callers = []
+        transport = HedgingTransport(InMemoryTransport(handler=lambda *args: callers.append(threading.current_thread()) or Response(200)),
+            budget=0, burst=0)
+
+        transport.request('GET', 'https://jwks')
+
+        assert callers == [threading.current_thread()]
+        transport.close()
+
+    def test_fast_request_not_hedged(self):
+        handler = SlowFirstCall(slow=0)
+        transport = HedgingTransport(InMemoryTransport(handler=handler), initial_delay=0.5)
+
+        assert transport.request('GET', 'https://jwks').json() == {'call': 1}
+        assert len(handler.calls) == 1
+        assert transport.stats()['hedged'] == 0
+        transport.close()
+
+    def test_post_never_hedged(self):
+        handler = SlowFirstCall(slow=0.2)
+        transport = HedgingTransport(InMemoryTransport(handler=handler), initial_delay=0.01)
+        client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport, refresh_token='refresh')
+
+        client.refresh()
+
+        assert handler.calls == [('POST', 'https://token')]
+        assert transport.stats()['requests'] == 0
+        transport.close()
+
+    def test_budget(self):
+        transport = HedgingTransport(InMemoryTransport(handler=lambda *args: time.sleep(0.03) or Response(200)),
+            initial_delay=0.01, budget=0, burst=2)
+
+        for _ in range(4):
+            transport.request('GET', 'https://userinfo')
+
+        assert transport.stats()['hedged'] == 2
+        assert transport.stats()['budget_exhausted'] == 2
+        transport.close()
+
+    def test_delay_from_latency_percentile(self):
+        transport = HedgingTransport(InMemoryTransport(), initial_delay=0.1, min_delay=0.001, percentile=90)
+        assert transport.get_delay('https://jwks') == 0.1
+
+        for latency in range(1, 21):
+            transport._record('https://jwks', latency / 1000.0)
+
+        assert transport.get_delay('https://jwks') == 0.019
+        assert transport.get_delay('https://userinfo') == 0.1
+
+    def test_error_falls_back_to_other_request(self):
+        calls = []
+
+        def handler(method, url, headers, data):
+            calls.append(url)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise IOError('connection reset')
+            time.sleep(0.2)
+            return Response(200, b'{}')
+
+        transport = HedgingTransport(InMemoryTransport(handler=handler), initial_delay=0.01)
+        assert transport.request('GET', 'https://userinfo').status_code == 200
+        transport.close()
+
+    def test_client_user_info_hedged(self):
+        handler = SlowFirstCall()
+        transport = HedgingTransport(InMemoryTransport(handler=handler), initial_delay=0.05)
+        client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport, access_token='access')
+
+        assert client.get_user_info().json() == {'call': 2}
+        transport.close()
+
+if __name__ == '__main__':
+    pytest.main()
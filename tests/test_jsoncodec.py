@@ -0,0 +1,85 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+"""Test module for intuitlib.jsoncodec
+"""
+
+import pytest
+import mock
+
+from intuitlib import jsoncodec
+from intuitlib.jsoncodec import (
+    JSONCodec,
+    get_codec,
+    set_default_codec,
+)
+from intuitlib.utils import send_request
+from tests.helper import MockResponse
+
+class Obj(object):
+    pass
+
+class TestJSONCodec():
+
+    def teardown_method(self, method):
+        set_default_codec('json')
+
+    def test_get_codec_default(self):
+        assert get_codec() is jsoncodec._default_codec
+        assert get_codec().name == 'json'
+
+    def test_get_codec_instance(self):
+        codec = JSONCodec()
+        assert get_codec(codec) is codec
+
+    def test_get_codec_unknown(self):
+        with pytest.raises(ValueError):
+            get_codec('yaml')
+
+    def test_get_codec_auto_falls_back(self):
+        with mock.patch.dict(jsoncodec._CODECS, {
+            'orjson': (jsoncodec.OrjsonCodec, False),
+            'ujson': (jsoncodec.UjsonCodec, False),
+        }):
+            assert get_codec('auto').name == 'json'
+
+    def test_get_codec_not_installed(self):
+        with mock.patch.dict(jsoncodec._CODECS, {'ujson': (jsoncodec.UjsonCodec, False)}):
+            with pytest.raises(ImportError):
+                get_codec('ujson')
+
+    def test_set_default_codec(self):
+        codec = set_default_codec('auto')
+        assert get_codec() is codec
+
+    @pytest.mark.parametrize('name', ['json', 'orjson', 'ujson'])
+    def test_round_trip(self, name):
+        pytest.importorskip(name)
+        codec = get_codec(name)
+        data = {'token': 'abc', 'aud': ['client']}
+
+        assert codec.loads(codec.dumps(data)) == data
+        assert codec.loads(b'{"token": "abc"}') == {'token': 'abc'}
+
+    @mock.patch('intuitlib.transport.requests.request')
+    def test_send_request_codec(self, mock_post):
+        pytest.importorskip('orjson')
+        mock_post.return_value = MockResponse(status=200, content=b'{"access_token": "testaccess"}')
+        obj = Obj()
+
+        send_request('POST', 'url', {}, obj, body={}, codec='orjson')
+        assert obj.access_token == 'testaccess'
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,80 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.jwks
+"""
+
+import pytest
+import mock
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from intuitlib.jwks import JWKCache
+from intuitlib.utils import get_jwk
+
+def jwks_doc(*kids):
+    keys = []
+    for kid in kids:
+        public_key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+        key = jwt.algorithms.RSAAlgorithm.to_jwk(public_key, as_dict=True)
+        key.update({'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+        keys.append(key)
+    return {'keys': keys}
+
+class TestJWKCache():
+
+    def test_get_cached(self):
+        cache = JWKCache()
+        fetch = mock.Mock(return_value=jwks_doc('kid1', 'kid2'))
+
+        assert cache.get('kid1', 'uri', fetch).key_id == 'kid1'
+        assert cache.get('kid2', 'uri', fetch).key_id == 'kid2'
+        assert fetch.call_count == 1
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'fetches': 1, 'key_sets': 1}
+
+    def test_get_expired(self):
+        cache = JWKCache(ttl=0, min_refetch_interval=0)
+        fetch = mock.Mock(return_value=jwks_doc('kid1'))
+
+        cache.get('kid1', 'uri', fetch)
+        cache.get('kid1', 'uri', fetch)
+        assert fetch.call_count == 2
+
+    def test_unknown_kid_refetch_limited(self):
+        cache = JWKCache()
+        fetch = mock.Mock(return_value=jwks_doc('kid1'))
+        cache.get('kid1', 'uri', fetch)
+
+        with pytest.raises(KeyError):
+            cache.get('rotated', 'uri', fetch)
+        assert fetch.call_count == 1
+
+    def test_unknown_kid_rotation(self):
+        cache = JWKCache(min_refetch_interval=0)
+        cache.get('kid1', 'uri', mock.Mock(return_value=jwks_doc('kid1')))
+
+        assert cache.get('rotated', 'uri', mock.Mock(return_value=jwks_doc('rotated'))).key_id == 'rotated'
+
+    @mock.patch('intuitlib.transport.requests.get')
+    def test_get_jwk_cache(self, mock_get):
+        mock_get.return_value = mock.Mock(status_code=200, json=mock.Mock(return_value=jwks_doc('kid1')))
+        cache = JWKCache()
+
+        get_jwk('kid1', 'uri', cache=cache)
+        get_jwk('kid1', 'uri', cache=cache)
+        assert mock_get.call_count == 1
+
+if __name__ == '__main__':
+    pytest.main()
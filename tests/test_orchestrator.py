@@ -0,0 +1,175 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.orchestrator
+"""
+
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from intuitlib.endpoints import EndpointConfig
+from intuitlib.orchestrator import HashRing, RefreshOrchestrator
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+def token_endpoint(method, url, headers, data):
+    refresh_token = data.split('refresh_token=')[-1]
+    if refresh_token.startswith('dead'):
+        return Response(400, b'{"error": "invalid_grant"}')
+    content = {'access_token': 'access', 'refresh_token': refresh_token + "'", 'expires_in': 3600}
+    return Response(200, json.dumps(content).encode('utf-8'))
+
+def make_transport():
+    return InMemoryTransport(handler=token_endpoint)
+
+class Results():
+
+    def __init__(self):
+        self.results = []
+        self.lock = threading.Condition()
+
+    def __call__(self, realm_id, tokens, error):
+        with self.lock:
+            self.results.append((realm_id, tokens, error))
+            self.lock.notify_all()
+
+    def wait_for(self, count, timeout=10):
+        with self.lock:
+            self.lock.wait_for(lambda: len(self.results) >= count, timeout)
+            return list(self.results)
+
+def make_orchestrator(results, workers=2):
+    return RefreshOrchestrator('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+        workers=workers, endpoint_config=EndpointConfig('sandbox', DISCOVERY_DOC), transport_factory=make_transport,
+        on_result=results, mp_context=multiprocessing.get_context('fork'))
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+class TestHashRing():
+
+    def test_get_spread(self):
+        ring = HashRing(['a', 'b', 'c'])
+        owners = [ring.get(str(key)) for key in range(3000)]
+
+        assert ring.nodes == ['a', 'b', 'c']
+        assert all(700 < owners.count(node) < 1300 for node in ring.nodes)
+        assert HashRing().get('key') is None
+
+    def test_add_moves_only_to_new_node(self):
+        ring = HashRing(['a', 'b', 'c'])
+        before = dict((key, ring.get(str(key))) for key in range(3000))
+        ring.add('d')
+        after = dict((key, ring.get(str(key))) for key in range(3000))
+        moved = [key for key in before if before[key] != after[key]]
+
+        assert all(after[key] == 'd' for key in moved)
+        assert 500 < len(moved) < 1000
+
+        ring.remove('d')
+        assert dict((key, ring.get(str(key))) for key in range(3000)) == before
+
+class TestRefreshOrchestrator():
+
+    def test_refresh_due_realms_once(self):
+        results = Results()
+        with make_orchestrator(results) as orchestrator:
+            for n in range(20):
+                orchestrator.add_realm('realm{0}'.format(n), 'refresh{0}'.format(n))
+            orchestrator.add_realm('fresh', 'refresh', access_token='access', expires_in=3600, issued_at=time.time())
+            orchestrator.add_realm('gone', 'dead')
+
+            refreshed = results.wait_for(21)
+            time.sleep(0.2)
+            stats = orchestrator.stats()
+
+            assert len(results.results) == 21
+            assert sorted(realm_id for realm_id, _, error in refreshed if error is None) == sorted('realm{0}'.format(n) for n in range(20))
+            assert [realm_id for realm_id, _, error in refreshed if error is not None] == ['gone']
+            assert orchestrator.get_tokens('realm3').refresh_token == "refresh3'"
+            assert stats['realms'] == 22
+            assert sum(worker['refreshed'] for worker in stats['workers'].values()) == 20
+            assert all(worker['realms'] > 0 for worker in stats['workers'].values())
+
+    def test_rebalance(self):
+        results = Results()
+        with make_orchestrator(results) as orchestrator:
+            realms = ['realm{0}'.format(n) for n in range(50)]
+            for realm_id in realms:
+                orchestrator.add_realm(realm_id, 'refresh')
+            results.wait_for(50)
+            before = dict((realm_id, orchestrator.owner(realm_id)) for realm_id in realms)
+
+            name = orchestrator.add_worker()
+            # realms released by their old owner have no owner until the new one got them
+            assert wait_until(lambda: orchestrator.stats()['workers'][name]['realms'] == orchestrator.stats()['moved'] > 0
+                and None not in [orchestrator.owner(realm_id) for realm_id in realms])
+            after = dict((realm_id, orchestrator.owner(realm_id)) for realm_id in realms)
+            moved = [realm_id for realm_id in realms if before[realm_id] != after[realm_id]]
+            assert all(after[realm_id] == name for realm_id in moved)
+
+            orchestrator.remove_worker(name)
+            assert wait_until(lambda: name not in orchestrator.stats()['workers'])
+            assert wait_until(lambda: dict((realm_id, orchestrator.owner(realm_id)) for realm_id in realms) == before)
+
+            # moved realms carry their refreshed tokens, nothing is refreshed twice
+            time.sleep(0.2)
+            assert len(results.results) == 50
+            assert orchestrator.get_tokens(moved[0]).refresh_token == "refresh'"
+
+    def test_worker_crash(self):
+        results = Results()
+        with make_orchestrator(results) as orchestrator:
+            for n in range(10):
+                orchestrator.add_realm('realm{0}'.format(n), 'refresh')
+            results.wait_for(10)
+            victim = orchestrator.owner('realm0')
+            orchestrator._workers[victim].process.kill()
+
+            assert wait_until(lambda: victim not in orchestrator.stats()['workers'])
+            assert wait_until(lambda: all(orchestrator.owner('realm{0}'.format(n)) not in (None, victim) for n in range(10)))
+
+    def test_restart_after_stop_timeout(self):
+        results = Results()
+        orchestrator = make_orchestrator(results).start()
+        for n in range(10):
+            orchestrator.add_realm('realm{0}'.format(n), 'refresh')
+        results.wait_for(10)
+
+        # workers cannot exit within the timeout, so they are terminated
+        orchestrator.stop(timeout=0)
+        assert all(orchestrator.owner('realm{0}'.format(n)) is None for n in range(10))
+
+        orchestrator.start()
+        try:
+            assert wait_until(lambda: all(orchestrator.owner('realm{0}'.format(n)) in orchestrator.stats()['workers'] for n in range(10)))
+
+            # an owner unknown to the orchestrator counts as no owner
+            orchestrator._owners['realm0'] = 'gone'
+            name = orchestrator.add_worker()
+            assert orchestrator.owner('realm0') in orchestrator.stats()['workers']
+            assert name in orchestrator.stats()['workers']
+        finally:
+            orchestrator.stop()
+
+if __name__ == '__main__':
+    pytest.main()
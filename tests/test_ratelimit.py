@@ -0,0 +1,115 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.ratelimit
+"""
+
+import threading
+import time
+
+import pytest
+import mock
+
+from intuitlib.ratelimit import TokenBucket, RateLimiter
+from intuitlib.exceptions import RateLimitExceededError
+from intuitlib.utils import send_request
+from tests.helper import MockResponse
+
+class TestRateLimit():
+
+    def test_bucket_burst(self):
+        bucket = TokenBucket(1, burst=3)
+
+        assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+        assert bucket.try_acquire() > 0
+
+    def test_bucket_invalid(self):
+        with pytest.raises(ValueError):
+            TokenBucket(0)
+        with pytest.raises(ValueError):
+            TokenBucket(1, burst=0)
+        with pytest.raises(ValueError):
+            TokenBucket(1, burst=0.5)
+        with pytest.raises(ValueError):
+            TokenBucket(1, burst=2).acquire(3)
+        assert TokenBucket(0.5).burst == 1
+
+    def test_bucket_blocks(self):
+        bucket = TokenBucket(100, burst=1)
+        bucket.acquire()
+        start = time.monotonic()
+
+        assert bucket.acquire() == 0
+        assert time.monotonic() - start >= 0.005
+
+    def test_bucket_timeout(self):
+        bucket = TokenBucket(0.1, burst=1)
+        bucket.acquire()
+
+        assert bucket.acquire(timeout=0.01) > 0
+
+    def test_bucket_threads(self):
+        bucket = TokenBucket(0.001, burst=50)
+        results = []
+        def worker():
+            for _ in range(20):
+                results.append(bucket.try_acquire() == 0)
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 50
+
+    def test_limiter_fail_fast(self):
+        limiter = RateLimiter({'token': (1, 1)}, block=False)
+        limiter.acquire('token')
+
+        with pytest.raises(RateLimitExceededError) as excinfo:
+            limiter.acquire('token')
+        assert excinfo.value.endpoint == 'token'
+        assert excinfo.value.retry_after > 0
+
+    def test_limiter_per_endpoint(self):
+        limiter = RateLimiter({'token': (1, 1)}, default=(1, 2), block=False)
+        limiter.acquire('token')
+        limiter.acquire('revoke')
+        limiter.acquire('revoke')
+
+        with pytest.raises(RateLimitExceededError):
+            limiter.acquire('revoke')
+        limiter.set_limit('token', 1, 1)
+        limiter.acquire('token')
+
+    def test_limiter_unlimited_endpoint(self):
+        limiter = RateLimiter({'token': (1, 1)}, block=False)
+
+        for _ in range(10):
+            limiter.acquire('userinfo')
+        assert limiter.get_bucket('userinfo') is None
+
+    @mock.patch('intuitlib.transport.requests.request')
+    def test_send_request_rate_limited(self, mock_post):
+        mock_post.return_value = MockResponse(status=200)
+        limiter = RateLimiter({'token': (1, 1)}, block=False)
+
+        send_request('POST', 'url', {}, '', body={}, rate_limiter=limiter, endpoint='token')
+        with pytest.raises(RateLimitExceededError):
+            send_request('POST', 'url', {}, '', body={}, rate_limiter=limiter, endpoint='token')
+        assert mock_post.call_count == 1
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,125 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.registry
+"""
+
+import pytest
+import mock
+
+from intuitlib.exceptions import AuthClientError
+from intuitlib.registry import ClientRegistry
+from intuitlib.transport import InMemoryTransport
+from tests.helper import DISCOVERY_DOC, MockResponse
+
+class TestClientRegistry():
+
+    def setup_method(self, method):
+        patcher = mock.patch('intuitlib.endpoints.get_discovery_doc', return_value=DISCOVERY_DOC)
+        self.mock_discovery = patcher.start()
+        self.patcher = patcher
+        self.registry = ClientRegistry()
+        self.registry.register_app('app1', 'id1', 'secret1', 'https://app1/callback', 'sandbox')
+        self.registry.register_app('app2', 'id2', 'secret2', 'https://app2/callback', 'sand')
+        self.registry.register_app('app3', 'id3', 'secret3', 'https://app3/callback', 'production')
+
+    def teardown_method(self, method):
+        self.patcher.stop()
+        self.registry.close()
+
+    def test_get_client_cached(self):
+        client = self.registry.get_client('app1', realm_id='realm1')
+
+        assert client is self.registry.get_client('app1', realm_id='realm1')
+        assert client is not self.registry.get_client('app1', realm_id='realm2')
+        assert client.realm_id == 'realm1'
+        assert client.client_id == 'id1'
+        assert client.token_endpoint == DISCOVERY_DOC['token_endpoint']
+
+    def test_get_client_cached_updates_tokens(self):
+        client = self.registry.get_client('app1', realm_id='realm1', access_token='access1', refresh_token='refresh1')
+
+        assert self.registry.get_client('app1', realm_id='realm1', refresh_token='refresh2') is client
+        assert (client.access_token, client.refresh_token) == ('access1', 'refresh2')
+        self.registry.get_client('app1', realm_id='realm1')
+        assert (client.access_token, client.refresh_token) == ('access1', 'refresh2')
+
+    def test_shared_per_environment(self):
+        client1 = self.registry.get_client('app1', realm_id='realm1')
+        client2 = self.registry.get_client('app2', realm_id='realm1')
+        client3 = self.registry.get_client('app3', realm_id='realm1')
+
+        assert client1.session is client2.session
+        assert client1.jwk_cache is client2.jwk_cache
+        assert client1.session is not client3.session
+        assert self.mock_discovery.call_count == 2
+
+    def test_refresh_discovery_updates_clients(self):
+        client = self.registry.get_client('app1', realm_id='realm1')
+        self.mock_discovery.return_value = dict(DISCOVERY_DOC, token_endpoint='https://moved')
+
+        self.registry.refresh_discovery()
+        assert client.token_endpoint == 'https://moved'
+        assert client.endpoint_config.version == 2
+
+    def test_unknown_app(self):
+        with pytest.raises(KeyError):
+            self.registry.get_client('missing')
+
+    def test_register_app_new_credentials(self):
+        client = self.registry.get_client('app1', realm_id='realm1')
+        self.registry.register_app('app1', 'id1', 'rotated', 'https://app1/callback', 'sandbox')
+
+        assert self.registry.get_client('app1', realm_id='realm1').client_secret == 'rotated'
+        assert client.client_secret == 'secret1'
+
+    def test_stats(self):
+        client = self.registry.get_client('app1', realm_id='realm1')
+        self.registry.get_client('app2', realm_id='realm1')
+        with mock.patch.object(client.session, 'request', side_effect=[MockResponse(status=200), MockResponse(status=429)]):
+            client.transport.request('GET', 'https://userinfo')
+            client.transport.request('GET', 'https://userinfo')
+
+        stats = self.registry.stats()
+        assert stats['apps'] == 3
+        assert stats['clients'] == {'app1': 1, 'app2': 1}
+        assert stats['total_clients'] == 2
+        assert stats['total_requests'] == 2
+        assert stats['total_errors'] == 1
+        sandbox = [env for env in stats['environments'].values() if 'app1' in env['apps']][0]
+        assert sandbox['apps'] == ['app1', 'app2']
+        assert sandbox['discovery_fetches'] == 1
+        assert sandbox['fetches'] == 0
+
+    def test_stats_with_transport(self):
+        transport = InMemoryTransport()
+        transport.add_route('POST', DISCOVERY_DOC['token_endpoint'], json_body={'access_token': 'access', 'refresh_token': 'refresh'})
+        transport.add_route('GET', DISCOVERY_DOC['userinfo_endpoint'], status=401)
+        registry = ClientRegistry(transport=transport)
+        registry.register_app('app1', 'id1', 'secret1', 'https://app1/callback', 'sandbox')
+        client = registry.get_client('app1', realm_id='realm1', refresh_token='refresh')
+
+        client.refresh()
+        client.refresh()
+        with pytest.raises(AuthClientError):
+            client.get_user_info()
+
+        stats = registry.stats()
+        assert len(transport.requests) == 3
+        assert (stats['total_requests'], stats['total_errors']) == (3, 1)
+        registry.close()
+
+if __name__ == '__main__':
+    pytest.main()
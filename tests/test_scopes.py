@@ -0,0 +1,91 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.scopes
+"""
+
+import pickle
+
+import pytest
+
+from intuitlib.enums import Scopes
+from intuitlib.scopes import ScopeSet, SCOPE_BITS, ALL_SCOPES_MASK
+from intuitlib.utils import scopes_to_string
+
+class TestScopeSet():
+
+    def test_bits_unique(self):
+        assert len(set(SCOPE_BITS.values())) == len(Scopes)
+        assert ALL_SCOPES_MASK == (1 << len(Scopes)) - 1
+
+    def test_membership(self):
+        scopes = ScopeSet([Scopes.OPENID, Scopes.ACCOUNTING])
+
+        assert Scopes.ACCOUNTING in scopes
+        assert Scopes.PAYMENT not in scopes
+        assert 'com.intuit.quickbooks.accounting' not in scopes
+        assert len(scopes) == 2
+        assert list(scopes) == [Scopes.OPENID, Scopes.ACCOUNTING]
+
+    def test_invalid_scope(self):
+        with pytest.raises(TypeError):
+            ScopeSet(['openid'])
+        with pytest.raises(ValueError):
+            ScopeSet.from_mask(ALL_SCOPES_MASK + 1)
+
+    def test_from_string(self):
+        scopes = ScopeSet.from_string('openid com.intuit.quickbooks.accounting  email unknown')
+
+        assert scopes == ScopeSet([Scopes.EMAIL, Scopes.ACCOUNTING, Scopes.OPENID])
+        assert ScopeSet.from_string(None) == ScopeSet()
+        assert not ScopeSet.from_string('')
+        with pytest.raises(ValueError):
+            ScopeSet.from_string('openid unknown', strict=True)
+
+    def test_to_string(self):
+        scopes = ScopeSet([Scopes.ACCOUNTING, Scopes.OPENID])
+
+        assert scopes.to_string() == 'openid com.intuit.quickbooks.accounting'
+        assert scopes.to_string() is scopes.to_string()
+        assert scopes_to_string(scopes) == 'openid com.intuit.quickbooks.accounting'
+        assert ScopeSet.from_string(scopes.to_string()) == scopes
+
+    def test_set_operations(self):
+        openid = ScopeSet([Scopes.OPENID, Scopes.EMAIL, Scopes.PROFILE])
+        granted = ScopeSet([Scopes.OPENID, Scopes.EMAIL, Scopes.ACCOUNTING])
+
+        assert (openid & granted) == ScopeSet([Scopes.OPENID, Scopes.EMAIL])
+        assert (openid | granted) == ScopeSet([Scopes.OPENID, Scopes.EMAIL, Scopes.PROFILE, Scopes.ACCOUNTING])
+        assert (granted - openid) == ScopeSet([Scopes.ACCOUNTING])
+        assert ScopeSet([Scopes.OPENID]) <= granted
+        assert granted.issuperset([Scopes.ACCOUNTING])
+        assert not granted.issubset(openid)
+
+    def test_immutable_hashable(self):
+        scopes = ScopeSet([Scopes.OPENID])
+
+        with pytest.raises(AttributeError):
+            scopes.mask = 0
+        assert len(set([scopes, ScopeSet([Scopes.OPENID])])) == 1
+        assert pickle.loads(pickle.dumps(scopes)) == scopes
+
+    def test_scopes_to_string_list_unchanged(self):
+        assert scopes_to_string([Scopes.EMAIL, Scopes.OPENID]) == 'email openid'
+        assert scopes_to_string([]) == ''
+        with pytest.raises(TypeError):
+            scopes_to_string((Scopes.EMAIL,))
+
+if __name__ == '__main__':
+    pytest.main()
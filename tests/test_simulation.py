@@ -0,0 +1,92 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.simulation
+"""
+
+import json
+
+import pytest
+
+from intuitlib.simulation import Simulation, main
+
+class TestSimulation():
+
+    def test_steady_state(self):
+        report = Simulation(realms=100, latency=0.1, latency_sigma=0, seed=1).run(7200)
+
+        assert report['realms'] == 100
+        assert report['refreshes'] == report['succeeded']
+        # realms are refreshed every 3300 seconds, the first ones at start
+        assert 215 <= report['refreshes'] <= 240
+        assert report['access_tokens_expired'] == 0
+        assert report['refresh_tokens_expired'] == 0
+        assert report['queue_delay_s']['max'] == 0
+        assert report['utilization'] == pytest.approx(report['refreshes'] * 0.1 / (16 * 7200.0), abs=0.001)
+
+    def test_rate_limit_queues_burst(self):
+        # every access token is due 600 seconds after onboarding
+        report = Simulation(realms=0, onboarding=[(0, 1000)], expires_in=3600, leeway=3000, rate=10, burst=10,
+            latency=0.1, latency_sigma=0, seed=1).run(1000)
+
+        assert report['refreshes'] == 1000
+        assert report['peak_refresh_qps'] <= 20
+        assert report['peak_qps'] == 1000
+        assert report['max_queue'] >= 980
+        assert report['queue_delay_s']['max'] == pytest.approx(99, abs=1)
+        assert report['access_tokens_expired'] == 0
+
+    def test_too_few_workers_expire_tokens(self):
+        report = Simulation(realms=0, onboarding=[(0, 100)], expires_in=3600, leeway=10, workers=1, latency=1, latency_sigma=0, seed=1).run(4000)
+
+        assert report['refreshes'] == 100
+        # 10 refreshes fit the leeway, the other realms wait past expiry
+        assert report['access_tokens_expired'] == 90
+        assert report['stale_realm_s'] == pytest.approx(sum(range(1, 91)), abs=1)
+        assert report['utilization'] == pytest.approx(100 / 4000.0, abs=0.001)
+
+    def test_jitter_spreads_onboarding_burst(self):
+        burst = [(0, 1000, 10)]
+        synchronized = Simulation(realms=0, onboarding=burst, seed=1).run(7200)
+        spread = Simulation(realms=0, onboarding=burst, jitter=600, seed=1).run(7200)
+
+        assert synchronized['exchanges'] == spread['exchanges'] == 1000
+        assert spread['peak_refresh_qps'] < synchronized['peak_refresh_qps']
+
+    def test_failures(self):
+        retried = Simulation(realms=10, failure_rate=1.0, x_refresh_token_expires_in=7200, seed=1).run(7200)
+        assert retried['succeeded'] == 0
+        assert retried['failed'] > 10
+        assert retried['refresh_tokens_expired'] == 10
+        assert retried['realms'] == 0
+
+        dead = Simulation(realms=10, dead_rate=1.0, seed=1).run(7200)
+        assert dead['dead'] == 10
+        assert dead['refreshes'] == 10
+        assert dead['realms'] == 0
+
+    def test_seeded_runs_repeat(self):
+        simulation = Simulation(realms=200, onboarding=[(100, 50, 60)], failure_rate=0.1, rate=5, seed=7)
+        assert simulation.run(3600) == simulation.run(3600)
+
+    def test_main(self, capsys):
+        assert main(['--realms', '10', '--duration', '3600', '--onboarding', '60:5:10', '--seed', '1']) == 0
+
+        report = json.loads(capsys.readouterr().out)
+        assert report['exchanges'] == 5
+        assert report['realms'] == 15
+
+if __name__ == '__main__':
+    pytest.main()
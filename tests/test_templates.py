@@ -0,0 +1,84 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.templates
+"""
+
+import pytest
+
+try:
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib import urlencode
+
+from intuitlib.client import AuthClient
+from intuitlib.config import ACCEPT_HEADER
+from intuitlib.templates import RequestTemplates, prepared_headers
+from intuitlib.transport import InMemoryTransport
+from intuitlib.utils import get_auth_header, send_request
+from tests.helper import DISCOVERY_DOC
+
+class TestTemplates():
+
+    def test_bodies_match_urlencode(self):
+        redirect_uri = 'https://www.mydemoapp.com/oauth-redirect?a=1&b= c'
+        templates = RequestTemplates('clientId', 'secret', redirect_uri)
+
+        for value in ['AB11r', 'a b/+=&%', u'été', 12345]:
+            assert templates.refresh_body(value) == urlencode({'grant_type': 'refresh_token', 'refresh_token': value})
+            assert templates.code_body(value) == urlencode({'grant_type': 'authorization_code', 'code': value, 'redirect_uri': redirect_uri})
+
+    def test_headers(self):
+        templates = RequestTemplates('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect')
+
+        assert dict(templates.token_headers) == dict(ACCEPT_HEADER, **{
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Authorization': get_auth_header('clientId', 'secret'),
+        })
+        assert templates.revoke_headers['Content-Type'] == 'application/json'
+        with pytest.raises(TypeError):
+            templates.token_headers['Authorization'] = 'changed'
+
+    def test_send_request_keeps_prepared_headers(self):
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token')
+        headers = prepared_headers({'Authorization': 'Basic abc'})
+        plain = {'Authorization': 'Basic abc'}
+
+        send_request('POST', 'https://token', headers, None, body='x', transport=transport)
+        send_request('POST', 'https://token', plain, None, body='x', transport=transport)
+
+        assert transport.requests[0][2] is headers
+        assert dict(transport.requests[0][2]) == plain
+
+    def test_client_rebuilds_templates_on_credential_change(self):
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token', json_body={'access_token': 'access', 'refresh_token': 'refresh'})
+        auth_client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport)
+
+        auth_client.refresh(refresh_token='token 1')
+        auth_client.refresh(refresh_token='token 2')
+        auth_client.client_secret = 'rotated'
+        auth_client.get_bearer_token('code', realm_id='realm')
+
+        first, second, third = transport.requests
+        assert first[2] is second[2]
+        assert second[3] == 'grant_type=refresh_token&refresh_token=token+2'
+        assert third[2]['Authorization'] == get_auth_header('clientId', 'rotated')
+        assert third[3] == urlencode({'grant_type': 'authorization_code', 'code': 'code', 'redirect_uri': 'https://www.mydemoapp.com/oauth-redirect'})
+
+if __name__ == '__main__':
+    pytest.main()
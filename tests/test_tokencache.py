@@ -0,0 +1,152 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.tokencache
+"""
+
+import logging
+import multiprocessing
+import struct
+import time
+
+import pytest
+
+from intuitlib.client import AuthClient
+from intuitlib.tokencache import SharedTokenCache, FLAG_DEAD
+from intuitlib.tokens import TokenSet
+from intuitlib.transport import InMemoryTransport
+from tests.helper import DISCOVERY_DOC
+
+def write_tokens(path, realm_id, n):
+    with SharedTokenCache(path) as cache:
+        cache.put(realm_id, TokenSet(access_token='access{0}'.format(n), refresh_token='refresh{0}'.format(n), realm_id=realm_id, issued_at=float(n)))
+
+class TestSharedTokenCache():
+
+    def test_put_get(self, tmpdir):
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=8, slot_size=512) as cache:
+            tokens = TokenSet(access_token='access', refresh_token='refresh', expires_in=3600, realm_id='123', issued_at=1000.5)
+            cache.put('123', tokens)
+
+            assert cache.get('123') == tokens
+            assert cache.get('456') is None
+            assert cache.get(None) is None
+            assert cache.get_record('123')[1] == 0
+
+    def test_overwrite_sequence(self, tmpdir):
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=8, slot_size=512) as cache:
+            cache.put('123', TokenSet(access_token='a1', realm_id='123'))
+            first = cache.sequence('123')
+            cache.put('123', TokenSet(access_token='a2', realm_id='123'), flags=FLAG_DEAD)
+
+            assert cache.sequence('123') == first + 2
+            assert cache.get('123').access_token == 'a2'
+            assert cache.get_record('123')[1] == FLAG_DEAD
+
+    def test_recovers_from_dead_writer(self, tmpdir):
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=8, slot_size=512) as cache:
+            cache.put('123', TokenSet(access_token='a1', realm_id='123'))
+            offset = cache._probe(b'123')
+            # writer killed between its two sequence writes
+            seq = cache.sequence('123')
+            struct.pack_into('<I', cache._map, offset, seq + 1)
+
+            started = time.monotonic()
+            assert cache.get('123') is None
+            assert time.monotonic() - started < 1
+
+            cache.put('123', TokenSet(access_token='a2', realm_id='123'))
+            assert cache.get('123').access_token == 'a2'
+            assert cache.sequence('123') == seq + 2
+
+    def test_collisions_delete_full(self, tmpdir):
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=4, slot_size=256) as cache:
+            for realm in ['1', '2', '3', '4']:
+                cache.put(realm, TokenSet(access_token='a' + realm, realm_id=realm))
+            with pytest.raises(MemoryError):
+                cache.put('5', TokenSet(realm_id='5'))
+
+            assert cache.delete('2')
+            assert not cache.delete('2')
+            assert cache.get('2') is None
+            cache.put('5', TokenSet(access_token='a5', realm_id='5'))
+            assert [cache.get(realm).access_token for realm in ['1', '3', '4', '5']] == ['a1', 'a3', 'a4', 'a5']
+
+    def test_record_too_large(self, tmpdir):
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=4, slot_size=128) as cache:
+            with pytest.raises(ValueError):
+                cache.put('1', TokenSet(access_token='x' * 200))
+            with pytest.raises(ValueError):
+                cache.put(None, TokenSet())
+
+    def test_layout_from_file(self, tmpdir):
+        path = str(tmpdir.join('tokens'))
+        SharedTokenCache(path, slots=16, slot_size=1024).close()
+
+        with SharedTokenCache(path) as cache:
+            assert (cache.slots, cache.slot_size) == (16, 1024)
+
+        bad = tmpdir.join('bad')
+        bad.write('not a cache')
+        with pytest.raises(ValueError):
+            SharedTokenCache(str(bad))
+
+    def test_shared_between_processes(self, tmpdir):
+        path = str(tmpdir.join('tokens'))
+        cache = SharedTokenCache(path)
+        process = multiprocessing.get_context('spawn').Process(target=write_tokens, args=(path, 'realm', 7))
+        process.start()
+        process.join()
+
+        assert process.exitcode == 0
+        assert cache.get('realm').access_token == 'access7'
+        cache.close()
+
+    def test_client_token_store(self, tmpdir):
+        path = str(tmpdir.join('tokens'))
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token', json_body={'access_token': 'access9', 'refresh_token': 'refresh9'})
+        cache = SharedTokenCache(path)
+        client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport, realm_id='realm', refresh_token='refresh0', token_store=cache)
+
+        write_tokens(path, 'realm', 5)
+        assert client.load_tokens()
+        assert client.refresh_token == 'refresh5'
+
+        client.refresh()
+        method, url, headers, data = transport.requests[-1]
+        assert data == 'grant_type=refresh_token&refresh_token=refresh5'
+        assert cache.get('realm').access_token == 'access9'
+        assert not client.load_tokens()
+        cache.close()
+
+    def test_client_store_full(self, tmpdir, caplog):
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token', json_body={'access_token': 'access9', 'refresh_token': 'rotated'})
+        with SharedTokenCache(str(tmpdir.join('tokens')), slots=1, slot_size=256) as cache:
+            cache.put('other', TokenSet(realm_id='other'))
+            client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+                discovery_doc=DISCOVERY_DOC, transport=transport, realm_id='realm', refresh_token='refresh0', token_store=cache)
+
+            with caplog.at_level(logging.WARNING, logger='intuitlib.client'):
+                client.refresh()
+
+            assert client.refresh_token == 'rotated'
+            assert cache.get('realm') is None
+            assert 'Could not store tokens of realm realm' in caplog.text
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,205 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.tokens
+"""
+
+import itertools
+import json
+import threading
+import time
+
+import jwt
+import pytest
+
+from intuitlib.client import AuthClient
+from intuitlib.exceptions import AuthClientError
+from intuitlib.tokens import TokenSet, encode_state, decode_state, state_to_dict, state_from_dict
+from intuitlib.transport import InMemoryTransport, Response
+from tests.helper import DISCOVERY_DOC
+
+class RotatingTokenEndpoint():
+
+    def __init__(self, latency=0):
+        self.counter = itertools.count(1)
+        self.calls = 0
+        self.latency = latency
+
+    def __call__(self, method, url, headers, data):
+        self.calls += 1
+        time.sleep(self.latency)
+        n = next(self.counter)
+        content = {'access_token': 'access{0}'.format(n), 'refresh_token': 'refresh{0}'.format(n), 'expires_in': 3600, 'x_refresh_token_expires_in': 8726400}
+        return Response(200, json.dumps(content).encode('utf-8'))
+
+def make_client(endpoint, **kwargs):
+    return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+        discovery_doc=DISCOVERY_DOC, transport=InMemoryTransport(handler=endpoint), **kwargs)
+
+class TestTokens():
+
+    def test_token_set_expiry(self):
+        tokens = TokenSet(access_token='a', expires_in=3600, x_refresh_token_expires_in=7200, issued_at=1000)
+
+        assert tokens.access_token_expires_at == 4600
+        assert tokens.refresh_token_expires_at == 8200
+        assert tokens.is_access_token_expired(now=4600)
+        assert tokens.is_access_token_expired(leeway=60, now=4550)
+        assert not tokens.is_access_token_expired(now=4000)
+        assert not TokenSet(access_token='a').is_access_token_expired()
+
+    def test_client_snapshot(self):
+        auth_client = make_client(RotatingTokenEndpoint(), refresh_token='refresh0', realm_id='realm')
+        before = auth_client.tokens
+
+        auth_client.refresh()
+        after = auth_client.tokens
+
+        assert before.refresh_token == 'refresh0'
+        assert before.access_token is None
+        assert (after.access_token, after.refresh_token, after.realm_id) == ('access1', 'refresh1', 'realm')
+        assert after.issued_at is not None
+        assert auth_client.access_token == 'access1'
+
+    def test_client_attribute_assignment(self):
+        auth_client = make_client(RotatingTokenEndpoint())
+        before = auth_client.tokens
+        auth_client.access_token = 'assigned'
+
+        assert auth_client.tokens.access_token == 'assigned'
+        assert before.access_token is None
+
+    def test_get_bearer_token_realm_in_snapshot(self):
+        auth_client = make_client(RotatingTokenEndpoint(), realm_id='old')
+
+        auth_client.get_bearer_token('code', realm_id='new')
+        assert (auth_client.tokens.realm_id, auth_client.tokens.access_token) == ('new', 'access1')
+
+    def test_get_bearer_token_keeps_tokens_if_validation_fails(self):
+        payload = {'aud': ['clientId'], 'iss': 'https://issuer', 'exp': int(time.time()) + 3600, 'sub': 'user'}
+        id_token = jwt.encode(payload, 'x' * 32, algorithm='HS256', headers={'kid': 'kid1'})
+        content = json.dumps({'access_token': 'access1', 'refresh_token': 'refresh1', 'id_token': id_token}).encode('utf-8')
+        transport = InMemoryTransport()
+        transport.add_route('POST', 'https://token', content=content)
+        transport.add_route('GET', 'https://jwks', status=500)
+        auth_client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC, transport=transport)
+
+        with pytest.raises(AuthClientError):
+            auth_client.get_bearer_token('code', realm_id='realm')
+
+        assert (auth_client.access_token, auth_client.refresh_token, auth_client.realm_id) == ('access1', 'refresh1', 'realm')
+        assert auth_client.id_token is None
+
+    def test_concurrent_readers_see_consistent_pairs(self):
+        auth_client = make_client(RotatingTokenEndpoint(), refresh_token='refresh0', access_token='access0')
+        stop = threading.Event()
+        mismatches = []
+
+        def reader():
+            while not stop.is_set():
+                tokens = auth_client.tokens
+                if tokens.access_token[len('access'):] != tokens.refresh_token[len('refresh'):]:
+                    mismatches.append(tokens)
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for _ in range(50):
+            auth_client.refresh()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        assert not mismatches
+        assert auth_client.refresh_token == 'refresh50'
+
+    def test_concurrent_refresh_single_flight(self):
+        endpoint = RotatingTokenEndpoint(latency=0.1)
+        auth_client = make_client(endpoint, refresh_token='refresh0')
+        barrier = threading.Barrier(8)
+
+        def refresh():
+            barrier.wait()
+            auth_client.refresh()
+
+        threads = [threading.Thread(target=refresh) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert endpoint.calls == 1
+        assert auth_client.refresh_token == 'refresh1'
+
+class TestTokenState():
+
+    tokens = TokenSet(access_token='access', refresh_token='refresh', id_token='id', expires_in=3600,
+        x_refresh_token_expires_in=8726400, realm_id='123', scope='openid com.intuit.quickbooks.accounting', issued_at=1500000000.25)
+
+    def test_bytes_round_trip(self):
+        data = encode_state(self.tokens, endpoints_version=4)
+
+        assert decode_state(data) == (self.tokens, 4)
+        assert decode_state(bytearray(data)) == (self.tokens, 4)
+        assert decode_state(encode_state(TokenSet(refresh_token='refresh'))) == (TokenSet(refresh_token='refresh'), None)
+        assert decode_state(encode_state(TokenSet(access_token=u'\u00e9', expires_in=0))) == (TokenSet(access_token=u'\u00e9', expires_in=0), None)
+
+    def test_bytes_compact(self):
+        data = encode_state(self.tokens)
+
+        assert len(data) == 25 + 2 * 5 + sum(len(value) for value in ['access', 'refresh', 'id', '123', 'openid com.intuit.quickbooks.accounting'])
+
+    def test_bytes_invalid(self):
+        data = encode_state(self.tokens)
+
+        with pytest.raises(ValueError):
+            decode_state(data[:10])
+        for length in range(len(data)):
+            with pytest.raises(ValueError):
+                decode_state(data[:length])
+        with pytest.raises(ValueError):
+            decode_state(b'XX' + data[2:])
+        with pytest.raises(ValueError):
+            encode_state(TokenSet(id_token='x' * 70000))
+
+    def test_dict_round_trip(self):
+        state = state_to_dict(self.tokens, endpoints_version=2)
+
+        assert state['access_token_expires_at'] == 1500003600.25
+        assert state['version'] == 1
+        assert state_from_dict(state) == (self.tokens, 2)
+
+        del state['expires_in'], state['x_refresh_token_expires_in']
+        assert state_from_dict(state) == (self.tokens, 2)
+        with pytest.raises(ValueError):
+            state_from_dict({'version': 99})
+
+    def test_client_round_trip(self):
+        auth_client = make_client(RotatingTokenEndpoint(), refresh_token='refresh0', realm_id='realm')
+        auth_client.refresh()
+        data = auth_client.to_bytes()
+
+        restored = AuthClient.from_bytes(data, 'clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC)
+        assert restored.tokens == auth_client.tokens
+        assert decode_state(data)[1] == auth_client.endpoint_config.version
+
+        restored = AuthClient.from_dict(auth_client.to_dict(), 'clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=DISCOVERY_DOC)
+        assert restored.tokens == auth_client.tokens
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,232 @@
+ # Copyright (c) 2018 Intuit
+ #
+ # Licensed under the Apache License, Version 2.0 (the "License");
+ # you may not use this file except in compliance with the License.
+ # You may obtain a copy of the License at
+ #
+ #  http://www.apache.org/licenses/LICENSE-2.0
+ #
+ # Unless required by applicable law or agreed to in writing, software
+ # distributed under the License is distributed on an "AS IS" BASIS,
+ # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ # See the License for the specific language governing permissions and
+ # limitations under the License.
+
+
+"""Test module for intuitlib.transport
+"""
+
+import json
+import socket
+import threading
+
+import pytest
+import mock
+import requests
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from intuitlib.client import AuthClient
+from intuitlib.config import DISCOVERY_URL
+from intuitlib.exceptions import AuthClientError
+from intuitlib.transport import (
+    Http2Transport,
+    InMemoryTransport,
+    RequestsTransport,
+    Response,
+    Urllib3Transport,
+    get_transport,
+)
+from intuitlib.utils import get_discovery_doc
+from tests.helper import DISCOVERY_DOC, MockResponse
+
+class Handler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        content = json.dumps({'path': self.path, 'body': body.decode('utf-8'), 'accept': self.headers['Accept']}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{0}'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+class H2Server(object):
+    """Cleartext HTTP/2 server answering POSTs like Handler, counts connections and streams
+    """
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.url = 'http://127.0.0.1:{0}'.format(self.sock.getsockname()[1])
+        self.connections = 0
+        self.streams = 0
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn = self.sock.accept()[0]
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self.serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def serve_connection(self, conn):
+        from h2.config import H2Configuration
+        from h2.connection import H2Connection
+        from h2.events import DataReceived, RequestReceived, StreamEnded
+
+        h2_conn = H2Connection(H2Configuration(client_side=False, header_encoding='utf-8'))
+        h2_conn.initiate_connection()
+        conn.sendall(h2_conn.data_to_send())
+        requests_by_stream = {}
+        with conn:
+            while True:
+                data = conn.recv(65535)
+                if not data:
+                    return
+                for event in h2_conn.receive_data(data):
+                    if isinstance(event, RequestReceived):
+                        requests_by_stream[event.stream_id] = [dict(event.headers), b'']
+                    elif isinstance(event, DataReceived):
+                        requests_by_stream[event.stream_id][1] += event.data
+                        h2_conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, StreamEnded):
+                        self.streams += 1
+                        headers, body = requests_by_stream.pop(event.stream_id)
+                        content = json.dumps({'path': headers[':path'], 'body': body.decode('utf-8'), 'accept': headers.get('accept')}).encode('utf-8')
+                        h2_conn.send_headers(event.stream_id, [
+                            (':status', '200'),
+                            ('content-type', 'application/json'),
+                            ('content-length', str(len(content))),
+                        ])
+                        h2_conn.send_data(event.stream_id, content, end_stream=True)
+                conn.sendall(h2_conn.data_to_send())
+
+    def close(self):
+        self.sock.close()
+
+@pytest.fixture
+def h2_server():
+    pytest.importorskip('h2')
+    pytest.importorskip('httpx')
+    server = H2Server()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.close()
+
+class TestTransport():
+
+    def in_memory_client(self):
+        transport = InMemoryTransport()
+        transport.add_route('GET', DISCOVERY_URL['sandbox'], json_body=DISCOVERY_DOC)
+        return AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox', transport=transport), transport
+
+    def test_client_in_memory(self):
+        auth_client, transport = self.in_memory_client()
+        transport.add_route('POST', 'https://token', json_body={'access_token': 'access', 'refresh_token': 'refresh'})
+
+        auth_client.refresh(refresh_token='old')
+
+        assert auth_client.token_endpoint == 'https://token'
+        assert auth_client.access_token == 'access'
+        assert auth_client.refresh_token == 'refresh'
+        method, url, headers, data = transport.requests[-1]
+        assert (method, url) == ('POST', 'https://token')
+        assert headers['Accept'] == 'application/json'
+        assert data == 'grant_type=refresh_token&refresh_token=old'
+
+    def test_client_in_memory_error(self):
+        auth_client, transport = self.in_memory_client()
+        transport.add_route('POST', 'https://revoke', status=400, content=b'invalid_token', headers={'intuit_tid': 'tid'})
+
+        with pytest.raises(AuthClientError) as excinfo:
+            auth_client.revoke(token='token')
+        assert excinfo.value.intuit_tid == 'tid'
+
+    def test_in_memory_handler(self):
+        transport = InMemoryTransport(handler=lambda method, url, headers, data: Response(200, b'{"url": "' + url.encode('utf-8') + b'"}'))
+
+        assert get_discovery_doc('https://custom', transport=transport) == {'url': 'https://custom'}
+        assert InMemoryTransport().request('GET', 'https://missing').status_code == 404
+
+    def test_get_transport(self):
+        transport = InMemoryTransport()
+        session = requests.Session()
+
+        assert get_transport(transport, session) is transport
+        assert get_transport(session=session).session is session
+        assert get_transport().session is None
+
+    @mock.patch('intuitlib.transport.requests.request')
+    def test_requests_transport(self, mock_request):
+        mock_request.return_value = MockResponse(status=200)
+
+        RequestsTransport().request('POST', 'url', headers={}, data='body')
+        mock_request.assert_called_once_with('POST', 'url', headers={}, data='body', auth=None)
+
+    def test_urllib3_transport(self, server):
+        transport = Urllib3Transport()
+        response = transport.request('POST', server + '/token', headers={'Accept': 'application/json'}, data={'grant_type': 'refresh_token'})
+        transport.close()
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/json'
+        assert response.json() == {'path': '/token', 'body': 'grant_type=refresh_token', 'accept': 'application/json'}
+
+    def test_http2_transport(self, h2_server):
+        transport = Http2Transport(http1=False)
+        response = transport.request('POST', h2_server.url + '/token', headers={'Accept': 'application/json'}, data={'grant_type': 'refresh_token'})
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/json'
+        assert response.json() == {'path': '/token', 'body': 'grant_type=refresh_token', 'accept': 'application/json'}
+
+        threads = [threading.Thread(target=transport.request, args=('POST', h2_server.url + '/token'), kwargs={'data': 'x'}) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transport.close()
+
+        assert h2_server.streams == 21
+        assert h2_server.connections == 1
+
+    def test_http2_refresh(self, h2_server):
+        discovery_doc = dict(DISCOVERY_DOC, token_endpoint=h2_server.url + '/token')
+        auth_client = AuthClient('clientId', 'secret', 'https://www.mydemoapp.com/oauth-redirect', 'sandbox',
+            discovery_doc=discovery_doc, transport=Http2Transport(http1=False))
+
+        auth_client.refresh(refresh_token='token')
+
+        assert h2_server.streams == 1
+        assert h2_server.connections == 1
+
+    @mock.patch('intuitlib.transport.httpx', None)
+    def test_http2_transport_missing(self):
+        with pytest.raises(ImportError):
+            Http2Transport()
+
+if __name__ == '__main__':
+    pytest.main()
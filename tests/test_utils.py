@@ -15,9 +15,13 @@
 """Test module for intuitlib.utils
 """
 
+import time
 import pytest
 import mock
+import jwt
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives.asymmetric import rsa
 
 from intuitlib.utils import (
     get_discovery_doc,
@@ -27,12 +31,32 @@ from intuitlib.utils import (
     generate_token,
     get_jwk,
     validate_id_token,
+    validate_id_tokens,
 )
 from intuitlib.enums import Scopes
 from intuitlib.client import AuthClient
 from intuitlib.exceptions import AuthClientError
+from intuitlib.transport import InMemoryTransport
 from tests.helper import MockResponse
 
+class SignedIdTokens():
+
+    def __init__(self, kids=('kid1',)):
+        self.private_keys = {}
+        keys = []
+        for kid in kids:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            self.private_keys[kid] = private_key
+            jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+            jwk.update({'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+            keys.append(jwk)
+        self.transport = InMemoryTransport()
+        self.transport.add_route('GET', 'jwk_uri', json_body={'keys': keys})
+
+    def token(self, kid='kid1', aud='client_id', iss='issuer', exp=3600, signing_kid=None):
+        payload = {'aud': [aud], 'iss': iss, 'exp': int(time.time()) + exp, 'sub': 'user'}
+        return jwt.encode(payload, self.private_keys[signing_kid or kid], algorithm='RS256', headers={'kid': kid})
+
 class TestUtils():
 
     auth_client = AuthClient('client_id','client_secret','redirect_uri','sandbox')
@@ -108,7 +132,7 @@ class TestUtils():
         send_request('POST', 'url', {}, self.auth_client, body={})
         assert self.auth_client.access_token == 'testaccess'
     
-    @mock.patch('intuitlib.utils.Session.request')
+    @mock.patch('intuitlib.transport.Session.request')
     def test_send_request_session_ok(self, mock_post):
         mock_resp = self.mock_request(status=200, content={'access_token': 'testaccess'})
         mock_post.return_value = mock_resp
@@ -117,7 +141,7 @@ class TestUtils():
         send_request('POST', 'url', {}, self.auth_client, body={}, session=session)
         assert self.auth_client.access_token == 'testaccess'
 
-    @mock.patch('intuitlib.utils.Session.request')
+    @mock.patch('intuitlib.transport.Session.request')
     def test_send_request_session_bad(self, mock_post):
         mock_resp = self.mock_request(status=400, content={'access_token': 'testaccess'})
         mock_post.return_value = mock_resp
@@ -157,5 +181,37 @@ class TestUtils():
         is_valid = validate_id_token(sample_id_token, client_id, intuit_issuer, jwk_uri)
         assert not is_valid 
 
+    def test_validate_id_token_signed(self):
+        signed = SignedIdTokens()
+
+        assert validate_id_token(signed.token(), 'client_id', 'issuer', 'jwk_uri', transport=signed.transport)
+
+    def test_validate_id_tokens(self):
+        signed = SignedIdTokens(kids=('kid1', 'kid2'))
+        tokens = [
+            signed.token(),
+            signed.token(kid='kid2'),
+            signed.token(aud='other'),
+            signed.token(iss='other'),
+            signed.token(exp=-60),
+            signed.token(kid='kid2', signing_kid='kid1'),
+            'firstcomp.secondcomp',
+            'not.a.token',
+            signed.token(kid='kid1'),
+        ]
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(validate_id_tokens(iter(tokens), 'client_id', 'issuer', 'jwk_uri', transport=signed.transport, chunksize=4, executor=executor))
+
+        assert results == [True, True, False, False, False, False, False, False, True]
+        assert len(signed.transport.requests) == 1
+
+    def test_validate_id_tokens_process_pool(self):
+        signed = SignedIdTokens()
+        tokens = [signed.token(), signed.token(exp=-60)] * 10
+
+        results = list(validate_id_tokens(tokens, 'client_id', 'issuer', 'jwk_uri', transport=signed.transport, processes=2, chunksize=3))
+        assert results == [True, False] * 10
+
 if __name__ == '__main__':
     pytest.main()